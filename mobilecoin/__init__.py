@@ -1,9 +1,25 @@
 from mobilecoin.cli import CommandLineInterface
 from mobilecoin.client import (
     Client,
+    ShardedClient,
     WalletAPIError,
 )
+from mobilecoin.models import (
+    Account,
+    Address,
+    Balance,
+    GiftCode,
+    NetworkStatus,
+    TransactionLog,
+    Txo,
+)
+from mobilecoin.transport import (
+    HTTPTransport,
+    InProcessTransport,
+    UnixSocketTransport,
+)
 from mobilecoin.utility import (
     mob2pmob,
     pmob2mob,
 )
+from mobilecoin.watch import TxoWatcher
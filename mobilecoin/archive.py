@@ -0,0 +1,133 @@
+import base64
+import json
+import os
+from pathlib import Path
+
+
+ARCHIVE_FORMAT = 'mobilecoin-account-archive'
+ARCHIVE_VERSION = 1
+
+# Scrypt parameters for deriving the archive key from a password.
+SCRYPT_N = 2**15
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+
+class ArchiveWriter:
+    """
+    Write account backups into a single archive file.
+
+    The archive is a JSON lines file. Its first line is a header, and each
+    following line holds one account backup, in the same form as a file from
+    "mobcli export". With a password, each backup line is encrypted separately,
+    using the cryptography library, so the archive can still be streamed.
+
+    Backups are written to a temporary file, which replaces the archive only once
+    it is complete and synced to disk, so the archive is never left half written.
+    Use as a context manager; if the block raises, the temporary file is removed.
+    """
+
+    def __init__(self, path, password=None):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.fernet = None
+        self.header = {
+            'format': ARCHIVE_FORMAT,
+            'version': ARCHIVE_VERSION,
+            'encryption': None,
+        }
+        if password is not None:
+            salt = os.urandom(16)
+            self.fernet = _fernet(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+            self.header['encryption'] = {
+                'cipher': 'fernet',
+                'kdf': 'scrypt',
+                'salt': base64.b64encode(salt).decode(),
+                'n': SCRYPT_N,
+                'r': SCRYPT_R,
+                'p': SCRYPT_P,
+            }
+        self.count = 0
+
+    def __enter__(self):
+        self.f = self.tmp_path.open('w')
+        self.f.write(json.dumps(self.header) + '\n')
+        return self
+
+    def write(self, backup):
+        line = json.dumps(backup)
+        if self.fernet is not None:
+            line = self.fernet.encrypt(line.encode()).decode()
+        self.f.write(line + '\n')
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.f.close()
+            self.tmp_path.unlink()
+            return
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self.tmp_path, self.path)
+        # Sync the directory too, so the rename itself survives a crash.
+        dir_fd = os.open(self.path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def is_archive(path):
+    """ Check whether a file starts with an archive header. """
+    try:
+        with open(path) as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError):
+        return False
+    return isinstance(header, dict) and header.get('format') == ARCHIVE_FORMAT
+
+
+def is_encrypted(path):
+    with open(path) as f:
+        return json.loads(f.readline())['encryption'] is not None
+
+
+def read_archive(path, password=None):
+    """ Yield each account backup in an archive. """
+    with open(path) as f:
+        header = json.loads(f.readline())
+        if header.get('format') != ARCHIVE_FORMAT:
+            raise ValueError('{} is not an account archive.'.format(path))
+        fernet = None
+        encryption = header['encryption']
+        if encryption is not None:
+            if password is None:
+                raise ValueError('{} is encrypted, and needs a password.'.format(path))
+            salt = base64.b64decode(encryption['salt'])
+            fernet = _fernet(password, salt, encryption['n'], encryption['r'], encryption['p'])
+
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if fernet is not None:
+                line = _decrypt(fernet, line)
+            yield json.loads(line)
+
+
+def _fernet(password, salt, n, r, p):
+    # Optional dependency, only needed for encrypted archives.
+    from cryptography.fernet import Fernet
+    from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+    key = Scrypt(salt=salt, length=32, n=n, r=r, p=p).derive(password.encode())
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def _decrypt(fernet, line):
+    from cryptography.fernet import InvalidToken
+    try:
+        return fernet.decrypt(line.encode())
+    except InvalidToken:
+        raise ValueError('Could not decrypt the archive. Is the password correct?')
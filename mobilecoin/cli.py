@@ -1,26 +1,52 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import csv
 from decimal import Decimal
 from getpass import getpass
 import json
 import os
 from pathlib import Path
+import string
 import subprocess
+import sys
 from textwrap import indent
+import time
+from urllib.parse import urlsplit, urlunsplit
 
 from .utility import (
+    mob2pmob,
     pmob2mob,
+    RateMeter,
+    try_int,
 )
+from .archive import ArchiveWriter, is_archive, is_encrypted, read_archive
+from .index import AddressIndex, TxoIndex
+from .journal import FAILED, FINAL_STATES, SUCCEEDED, UNKNOWN, PayoutJournal, payment_id
+from .output import FORMATS, record_writer
+from .schedule import TransactionQueue, input_key_images
+from .snapshot import DEFAULT_THREADS, create_snapshot, restore_snapshot, verify_snapshot
+from .supervisor import Supervisor, running_pid, stop as stop_supervisor
+from .watch import TxoWatcher, UnixSocketBroadcaster
 from .client import (
     Client,
+    ShardedClient,
     WalletAPIError,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_URL,
+    MAX_INPUTS,
     MAX_TOMBSTONE_BLOCKS,
+    tombstone_window,
 )
 
 
+TXO_STATUSES = ['unspent', 'pending', 'spent', 'orphaned', 'secreted']
+
+
 class CommandLineInterface:
 
     def __init__(self):
         self.verbose = False
+        self.format = 'text'
         self.config = json.loads(os.environ['MOBILECOIN_CONFIG'])
 
     def main(self):
@@ -35,8 +61,9 @@ class CommandLineInterface:
 
         self.verbose = args.pop('verbose')
         self.auto_confirm = args.pop('yes')
+        self.format = args.pop('format')
 
-        self.client = Client(url=self.config.get('api-url'), verbose=self.verbose)
+        self.client = self._create_client()
 
         # Dispatch command.
         setattr(self, 'import', self.import_)  # Can't name a function "import".
@@ -55,6 +82,8 @@ class CommandLineInterface:
         )
         self.parser.add_argument('-v', '--verbose', action='store_true', help='Show more information.')
         self.parser.add_argument('-y', '--yes', action='store_true', help='Do not ask for confirmation.')
+        self.parser.add_argument('-f', '--format', choices=FORMATS, default='text',
+                                 help='Output format for list, history, address list, gift list and status.')
 
         command_sp = self.parser.add_subparsers(dest='command', help='Commands')
 
@@ -67,12 +96,52 @@ class CommandLineInterface:
                                      help='Do not encrypt the wallet database. Secret keys will be stored on the hard drive in plaintext.')
         self.start_args.add_argument('--change-password', action='store_true',
                                      help='Change the password for the database.')
+        self.start_args.add_argument('--no-wait', action='store_true',
+                                     help='With --bg, return immediately instead of waiting for the server to start and sync the ledger.')
+        self.start_args.add_argument('--sync-timeout', type=float,
+                                     help='With --bg, give up waiting for the ledger to sync after this many seconds.')
+
+        self.start_args.add_argument('--metrics-interval', type=float, default=10.0,
+                                     help='Seconds between samples of the server\'s memory, CPU and disk use.')
 
         # Stop server.
         self.stop_args = command_sp.add_parser('stop', help='Stop the local MobileCoin wallet server.')
 
         # Network status.
         self.status_args = command_sp.add_parser('status', help='Check the status of the MobileCoin network.')
+        self.status_args.add_argument('-w', '--watch', action='store_true',
+                                      help='Keep watching ledger and account sync progress until interrupted.')
+        self.status_args.add_argument('-a', '--account', action='append',
+                                      help='With --watch, also show sync progress for this account. May be repeated.')
+        self.status_args.add_argument('--interval', type=float, default=2.0,
+                                      help='With --watch, seconds between samples.')
+        self.status_args.add_argument('--stall', type=float, default=60.0,
+                                      help='With --watch, report a stall after this many seconds without progress.')
+
+        # Ledger snapshots.
+        self.ledger_args = command_sp.add_parser('ledger', help='Ledger database snapshots, for quickly setting up a new server.')
+        ledger_action = self.ledger_args.add_subparsers(dest='action')
+
+        self.ledger_snapshot_args = ledger_action.add_parser(
+            'snapshot',
+            help='Write a compressed, checksummed snapshot of the local ledger database. Stop the server first.',
+        )
+        self.ledger_snapshot_args.add_argument('snapshot', help='Snapshot file to write.')
+
+        self.ledger_restore_args = ledger_action.add_parser(
+            'restore',
+            help='Verify a ledger snapshot and restore the local ledger database from it.',
+        )
+        self.ledger_restore_args.add_argument('snapshot', help='Snapshot file to restore from.')
+        self.ledger_restore_args.add_argument('--replace', action='store_true',
+                                              help='Replace an existing ledger database.')
+
+        self.ledger_verify_args = ledger_action.add_parser('verify', help='Check a ledger snapshot for corruption.')
+        self.ledger_verify_args.add_argument('snapshot', help='Snapshot file to check.')
+
+        for args in [self.ledger_snapshot_args, self.ledger_restore_args, self.ledger_verify_args]:
+            args.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                              help='Number of chunks to compress or decompress at once.')
 
         # List accounts.
         self.list_args = command_sp.add_parser('list', help='List accounts.')
@@ -88,8 +157,12 @@ class CommandLineInterface:
 
         # Import account.
         self.import_args = command_sp.add_parser('import', help='Import an account.')
-        self.import_args.add_argument('backup', help='Account backup file, mnemonic recovery phrase, or legacy root entropy in hexadecimal.')
-        self.import_args.add_argument('-n', '--name', help='Account name.')
+        self.import_args.add_argument('backup', nargs='?',
+                                      help='Account backup file or archive, mnemonic recovery phrase, or legacy root entropy in hexadecimal.')
+        group = self.import_args.add_mutually_exclusive_group()
+        group.add_argument('-d', '--dir', dest='directory',
+                           help='Import every account backup file in this directory, then show their sync progress.')
+        group.add_argument('-n', '--name', help='Account name.')
         self.import_args.add_argument('-b', '--block', type=int,
                                       help='Block index at which to start the account. No transactions before this block will be loaded.')
         self.import_args.add_argument('--key_derivation_version', type=int, default=2,
@@ -97,7 +170,13 @@ class CommandLineInterface:
 
         # Export account.
         self.export_args = command_sp.add_parser('export', help='Export seed phrase.')
-        self.export_args.add_argument('account_id', help='ID of the account to export.')
+        self.export_args.add_argument('account_ids', nargs='*', help='IDs of the accounts to export.')
+        self.export_args.add_argument('--all', dest='all_accounts', action='store_true',
+                                      help='Export every account in the wallet.')
+        self.export_args.add_argument('-o', '--output',
+                                      help='Write all the exported accounts to this archive file.')
+        self.export_args.add_argument('--encrypt', action='store_true',
+                                      help='Encrypt the archive with a password.')
 
         # Remove account.
         self.remove_args = command_sp.add_parser('remove', help='Remove an account from local storage.')
@@ -113,14 +192,107 @@ class CommandLineInterface:
             '--delay', type=int, default=0,
             help='Make a transaction which cannot be submitted until after the given number of blocks.'
         )
+        self.send_args.add_argument('--queue', action='store_true',
+                                    help='Build the transaction and add it to the transaction queue, instead of writing a file.')
         self.send_args.add_argument('account_id', help='Source account ID.')
         self.send_args.add_argument('amount', help='Amount of MOB to send.')
         self.send_args.add_argument('to_address', help='Address to send to.')
 
         # Submit transaction proposal.
-        self.submit_args = command_sp.add_parser('submit', help='Submit a transaction proposal.')
-        self.submit_args.add_argument('proposal', help='A tx_proposal.json file.')
-        self.submit_args.add_argument('account_id', nargs='?', help='Source account ID. Only used for logging the transaction.')
+        self.submit_args = command_sp.add_parser('submit', help='Submit transaction proposals.')
+        self.submit_args.add_argument('proposals', nargs='+',
+                                      help='tx_proposal.json files, or directories of them, optionally followed by the source account ID.')
+        self.submit_args.add_argument('-a', '--account-id', help='Source account ID. Only used for logging the transactions.')
+
+        # Transaction queue commands.
+        self.queue_args = command_sp.add_parser('queue', help='Queue transaction proposals to submit once they are valid.')
+        queue_action = self.queue_args.add_subparsers(dest='action')
+
+        self.queue_add_args = queue_action.add_parser('add', help='Add transaction proposals to the queue.')
+        self.queue_add_args.add_argument('proposals', nargs='+', help='tx_proposal.json files, or directories of them.')
+        self.queue_add_args.add_argument('-a', '--account-id', help='Source account ID. Only used for logging the transactions.')
+
+        self.queue_list_args = queue_action.add_parser('list', help='List queued transaction proposals.')
+
+        self.queue_run_args = queue_action.add_parser(
+            'run',
+            help='Submit each queued proposal when its tombstone window opens, until none are waiting.',
+        )
+        self.queue_run_args.add_argument('--forever', action='store_true',
+                                         help='Keep running, and submit proposals added later.')
+        self.queue_run_args.add_argument('--interval', type=float, default=1.0,
+                                         help='Seconds between network status checks.')
+
+        self.queue_clear_args = queue_action.add_parser(
+            'clear',
+            help='Remove submitted, expired and failed proposals from the queue.',
+        )
+
+        # Batch payouts.
+        self.payout_args = command_sp.add_parser(
+            'payout',
+            help='Send many payments from a CSV file, safely resuming if interrupted.',
+        )
+        self.payout_args.add_argument('account_id', help='Source account ID.')
+        self.payout_args.add_argument('payments',
+                                      help='CSV file with "address" and "amount" columns, in MOB, and optionally "id".')
+        self.payout_args.add_argument('--journal',
+                                      help='Journal file recording progress. Defaults to the payments file name plus ".journal".')
+        self.payout_args.add_argument('--retry-failed', action='store_true', help='Try failed payments again.')
+        self.payout_args.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                                      help='Number of transactions to build and submit at once.')
+        self.payout_args.add_argument('--report', help='Write the result for each payment to this CSV file.')
+
+        # Consolidate txos.
+        self.consolidate_args = command_sp.add_parser(
+            'consolidate',
+            help='Merge many small txos in an account into a few large ones, sending each subaddress\'s funds back to itself.',
+        )
+        self.consolidate_args.add_argument('account_id', help='Account ID.')
+        self.consolidate_args.add_argument('--below', help='Only merge txos worth less than this amount of MOB.')
+        self.consolidate_args.add_argument('--target', type=int, default=1,
+                                           help='Stop when this many of the txos being merged remain in each subaddress.')
+        self.consolidate_args.add_argument('--max-inputs', type=int, default=MAX_INPUTS,
+                                           choices=range(2, MAX_INPUTS + 1), metavar='N',
+                                           help='Maximum number of txos to merge in one transaction, from 2 to {}.'.format(MAX_INPUTS))
+
+        # Query txos.
+        self.txos_args = command_sp.add_parser('txos', help='Search the txos in an account.')
+        self.txos_args.add_argument('account_id', help='Account ID.')
+        self.txos_args.add_argument('-s', '--status', choices=TXO_STATUSES, help='Only show txos with this status.')
+        self.txos_args.add_argument('--subaddress', type=int, help='Only show txos received at this subaddress index.')
+        self.txos_args.add_argument('--min', dest='min_amount', help='Only show txos worth at least this amount of MOB.')
+        self.txos_args.add_argument('--max', dest='max_amount', help='Only show txos worth at most this amount of MOB.')
+        self.txos_args.add_argument('--sort', choices=['value', 'block'], help='Sort by value or received block.')
+        self.txos_args.add_argument('-r', '--reverse', action='store_true', help='Sort in descending order.')
+        self.txos_args.add_argument('--limit', type=int, help='Show at most this many txos.')
+        self.txos_args.add_argument('-c', '--count', action='store_true',
+                                    help='Only show the count, total, minimum and maximum of matching txos.')
+        self.txos_args.add_argument('--refresh', type=float,
+                                    help='Repeat the query every this many seconds, updating the index incrementally.')
+
+        # Summarize all accounts.
+        self.summary_args = command_sp.add_parser('summary', help='Show total balances across all accounts.')
+        group = self.summary_args.add_mutually_exclusive_group()
+        group.add_argument('-s', '--separator',
+                           help='Group accounts by the part of their name before this separator, like "/" in "ops/hot-1".')
+        group.add_argument('-p', '--prefix', type=int,
+                           help='Group accounts by this many leading characters of their name.')
+
+        # Watch for txo changes.
+        self.watch_args = command_sp.add_parser(
+            'watch',
+            help='Stream an event for each txo received or spent, as JSON lines.',
+        )
+        self.watch_args.add_argument('account_ids', nargs='*', help='Accounts to watch. Defaults to all accounts.')
+        self.watch_args.add_argument('-o', '--output', help='Append events to this file instead of printing them.')
+        self.watch_args.add_argument('--socket', help='Serve events to clients of a Unix socket at this path.')
+        self.watch_args.add_argument('--interval', type=float, default=1.0,
+                                     help='Seconds between checks for a new block.')
+
+        # Find the account owning an address.
+        self.whois_args = command_sp.add_parser('whois', help='Find which account and subaddress an address belongs to.')
+        self.whois_args.add_argument('address', help='Public address.')
 
         # Address QR code.
         self.qr_args = command_sp.add_parser('qr', help='Show account address as a QR code')
@@ -141,6 +313,17 @@ class CommandLineInterface:
         )
         self.address_create_args.add_argument('account_id', help='Account ID.')
         self.address_create_args.add_argument('metadata', nargs='?', help='Address label.')
+        self.address_create_args.add_argument('-c', '--count', type=int, default=1,
+                                              help='Create this many addresses, numbering their labels.')
+        self.address_create_args.add_argument('--from-file',
+                                              help='Create one address for each label in this file, one per line.')
+
+        # Look up address.
+        self.address_lookup_args = address_action.add_parser(
+            'lookup',
+            help='Find the account and subaddress for an address or label, from the local address index.',
+        )
+        self.address_lookup_args.add_argument('key', help='Public address or address label.')
 
         # Gift code commands.
         self.gift_args = command_sp.add_parser('gift', help='Gift code commands.')
@@ -154,16 +337,46 @@ class CommandLineInterface:
         self.gift_create_args.add_argument('account_id', help='Source account ID.')
         self.gift_create_args.add_argument('amount', help='Amount of MOB to add to the gift code.')
         self.gift_create_args.add_argument('-m', '--memo', help='Gift code memo.')
+        self.gift_create_args.add_argument('-c', '--count', type=int, default=1,
+                                           help='Create this many gift codes, each holding the amount.')
+        self.gift_create_args.add_argument('-o', '--output',
+                                           help='Append each gift code to this file once it has landed.')
 
         # Claim gift code.
         self.gift_claim_args = gift_action.add_parser('claim', help='Claim a gift code, adding the funds to your account.')
         self.gift_claim_args.add_argument('account_id', help='Destination account ID to deposit the gift code funds.')
-        self.gift_claim_args.add_argument('gift_code', help='Gift code string')
+        self.gift_claim_args.add_argument('gift_code', nargs='?', help='Gift code string')
+        self.gift_claim_args.add_argument('--from-file', help='Claim every gift code in this file, one per line.')
+        self.gift_claim_args.add_argument('--report', help='With --from-file, write the result for each code to this CSV file.')
 
         # Remove gift code.
         self.gift_remove_args = gift_action.add_parser('remove', help='Remove a gift code.')
         self.gift_remove_args.add_argument('gift_code', help='Gift code to remove.')
 
+        # Receipt commands.
+        self.receipts_args = command_sp.add_parser('receipts', help='Receiver receipt commands.')
+        receipts_action = self.receipts_args.add_subparsers(dest='action')
+
+        # Check receipts.
+        self.receipts_check_args = receipts_action.add_parser(
+            'check',
+            help='Check the status of payments from a file of receiver receipts.',
+        )
+        self.receipts_check_args.add_argument(
+            'receipts_file',
+            help='JSON lines file, each line an object with "address" and "receipt" fields.',
+        )
+        self.receipts_check_args.add_argument('--no-wait', action='store_true',
+                                              help='Report pending payments instead of waiting for them to finish.')
+
+    def _create_client(self):
+        shard_configs = _shard_configs(self.config)
+        if len(shard_configs) == 1:
+            return Client(url=self.config.get('api-url'), verbose=self.verbose, typed=True)
+        else:
+            urls = [ shard_config['api-url'] for shard_config in shard_configs ]
+            return ShardedClient(urls, verbose=self.verbose, typed=True)
+
     def _load_account_prefix(self, prefix):
         accounts = self.client.get_all_accounts()
         matching_ids = [
@@ -186,7 +399,7 @@ class CommandLineInterface:
         confirmation = input(message)
         return confirmation.lower() in ['y', 'yes']
 
-    def start(self, offline=False, bg=False, unencrypted=False, change_password=False):
+    def start(self, offline=False, bg=False, unencrypted=False, change_password=False, no_wait=False, sync_timeout=None, metrics_interval=10.0):
         password = ''
         new_password = ''
         if not unencrypted:
@@ -206,54 +419,156 @@ class CommandLineInterface:
         env = {'MC_PASSWORD': password}
         if new_password != '':
             env['MC_CHANGED_PASSWORD'] = new_password
+        if 'RUST_LOG' in os.environ:
+            env['RUST_LOG'] = os.environ['RUST_LOG']
 
-        wallet_server_command = [
-            self.config['executable'],
-            '--ledger-db', self.config['ledger-db'],
-            '--wallet-db', self.config['wallet-db'],
+        shard_configs = _shard_configs(self.config, offline)
+        commands = [
+            _wallet_server_command(shard_config, offline)
+            for shard_config in shard_configs
         ]
-        if offline:
-            wallet_server_command += ['--offline']
-        else:
-            for peer in self.config['peer']:
-                wallet_server_command += ['--peer', peer]
-            for tx_source_url in self.config['tx-source-url']:
-                wallet_server_command += ['--tx-source-url', tx_source_url]
-
-        ingest_enclave = self.config.get('fog-ingest-enclave-css')
-        if ingest_enclave is not None:
-            wallet_server_command += ['--fog-ingest-enclave-css', ingest_enclave]
-
-        if bg:
-            wallet_server_command += [
-                '>', self.config['logfile'], '2>&1'
-            ]
 
         if self.verbose:
-            print(' '.join(wallet_server_command))
+            for command in commands:
+                print(' '.join(command))
 
         print('Starting {}...'.format(Path(self.config['executable']).name))
 
-        Path(self.config['ledger-db']).mkdir(parents=True, exist_ok=True)
-        Path(self.config['wallet-db']).parent.mkdir(parents=True, exist_ok=True)
+        for shard_config in shard_configs:
+            Path(shard_config['ledger-db']).mkdir(parents=True, exist_ok=True)
+            Path(shard_config['wallet-db']).parent.mkdir(parents=True, exist_ok=True)
+
+        for shard_config in shard_configs:
+            pid = running_pid(_pidfile(shard_config))
+            if pid is not None:
+                print('The wallet server for {} is already running, in process {}.'.format(shard_config['wallet-db'], pid))
+                exit(1)
 
         if bg:
-            subprocess.Popen(' '.join(wallet_server_command), shell=True, env=env)
-            print('Started, view log at {}.'.format(self.config['logfile']))
+            for command, shard_config in zip(commands, shard_configs):
+                # Each shard gets a detached supervisor, which restarts it if it crashes.
+                with open(shard_config['logfile'], 'ab') as log:
+                    subprocess.Popen(
+                        _supervisor_command(command, shard_config, metrics_interval),
+                        env={**env, 'PYTHONPATH': os.pathsep.join(sys.path)},
+                        stdin=subprocess.DEVNULL,
+                        stdout=log,
+                        stderr=subprocess.STDOUT,
+                        start_new_session=True,
+                    )
+                print('Started, view log at {}.'.format(shard_config['logfile']))
+                print('Resource usage is sampled to {}.'.format(_metrics_path(shard_config)))
             print('Stop server with "mobcli stop".')
+            if not no_wait:
+                self._wait_for_servers(shard_configs, offline, sync_timeout)
+        elif len(commands) == 1:
+            supervisor = Supervisor(
+                commands[0],
+                _pidfile(shard_configs[0]),
+                env,
+                metrics_path=_metrics_path(shard_configs[0]),
+                metrics_interval=metrics_interval,
+            )
+            supervisor.run()
         else:
-            subprocess.run(' '.join(wallet_server_command), shell=True, env=env)
+            # Supervise the shards in the foreground, and stop them all if any one gives up.
+            processes = [
+                subprocess.Popen(
+                    _supervisor_command(command, shard_config, metrics_interval),
+                    env={**env, 'PYTHONPATH': os.pathsep.join(sys.path)},
+                )
+                for command, shard_config in zip(commands, shard_configs)
+            ]
+            try:
+                while all( p.poll() is None for p in processes ):
+                    time.sleep(1.0)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                for p in processes:
+                    if p.poll() is None:
+                        p.terminate()
+                for p in processes:
+                    p.wait()
+
+    def _wait_for_servers(self, shard_configs, offline, sync_timeout=None):
+        for shard_config in shard_configs:
+            client = Client(url=shard_config['api-url'], verbose=self.verbose)
+            try:
+                client.wait_for_server()
+            except ConnectionError:
+                print('The wallet server at {} did not start. Check the log at {}.'.format(
+                    shard_config['api-url'],
+                    shard_config['logfile'],
+                ))
+                exit(1)
+            if not offline:
+                self._print_ledger_sync(client, sync_timeout)
+        print('Ready.')
+
+    def _print_ledger_sync(self, client, timeout=None):
+        meter = RateMeter()
+        tty = sys.stdout.isatty()
+        try:
+            for i, network_status in enumerate(client.poll_ledger_sync(timeout=timeout)):
+                local_block = network_status['local_block_index']
+                network_block = network_status['network_block_index']
+                meter.add(local_block)
+                # Redraw one line on a terminal, but only log occasionally to a file.
+                if tty:
+                    print('\r' + _format_sync_progress('Ledger', local_block, network_block, meter) + '\033[K', end='', flush=True)
+                elif i % 10 == 0:
+                    print(_format_sync_progress('Ledger', local_block, network_block, meter), flush=True)
+        except TimeoutError as e:
+            if tty:
+                print()
+            print(e)
+            print('The server is still running. Check on it with "mobcli status --watch".')
+            exit(1)
+        except KeyboardInterrupt:
+            if tty:
+                print()
+            print('Stopped waiting for the ledger to sync. The server is still running.')
+            exit(1)
+        if tty:
+            print()
 
     def stop(self):
         if self.verbose:
             print('Stopping MobileCoin wallet server...')
-        subprocess.Popen(['killall', '-v', self.config['executable']])
+        num_stopped = 0
+        for shard_config in _shard_configs(self.config):
+            try:
+                pid = stop_supervisor(_pidfile(shard_config))
+            except TimeoutError as e:
+                print(e)
+                exit(1)
+            if pid is not None:
+                print('Stopped the wallet server for {}.'.format(shard_config['wallet-db']))
+                num_stopped += 1
+        if num_stopped == 0:
+            print('No wallet server started by mobcli is running.')
+
+    def status(self, watch=False, account=None, interval=2.0, stall=60.0):
+        if watch:
+            accounts = [ self._load_account_prefix(prefix) for prefix in (account or []) ]
+            self._watch_sync(accounts, interval, stall)
+            return
 
-    def status(self):
         network_status = self.client.get_network_status()
         fee = pmob2mob(network_status['fee_pmob'])
 
-        if int(network_status['network_block_index']) == 0:
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                writer.write({
+                    'network_block_index': network_status['network_block_index'],
+                    'local_block_index': network_status['local_block_index'],
+                    'fee_pmob': network_status['fee_pmob'],
+                    'offline': network_status['network_block_index'] == 0,
+                })
+            return
+
+        if network_status['network_block_index'] == 0:
             print('Offline.')
             print('Local ledger has {} blocks.'.format(network_status['local_block_index']))
             print('Expected fee is {}'.format(_format_mob(fee)))
@@ -265,19 +580,155 @@ class CommandLineInterface:
             ))
             print('Network fee is {}'.format(_format_mob(fee)))
 
+    def ledger(self, action, **args):
+        getattr(self, 'ledger_' + action)(**args)
+
+    def ledger_snapshot(self, snapshot, threads=DEFAULT_THREADS):
+        if self._server_running():
+            print('Stop the wallet server with "mobcli stop" before taking a snapshot of its ledger.')
+            exit(1)
+        ledger_db = self.config['ledger-db']
+        start = time.monotonic()
+        try:
+            manifest = create_snapshot(ledger_db, snapshot, threads=threads, progress=_print_snapshot_progress('Reading'))
+        except (FileNotFoundError, ValueError) as e:
+            print()
+            print(e)
+            exit(1)
+        print()
+        size = sum( f['size'] for f in manifest['files'] )
+        print('Wrote snapshot of {} to {}, {} compressed to {}, in {:.1f} seconds.'.format(
+            ledger_db,
+            snapshot,
+            _format_bytes(size),
+            _format_bytes(os.path.getsize(snapshot)),
+            time.monotonic() - start,
+        ))
+
+    def ledger_restore(self, snapshot, replace=False, threads=DEFAULT_THREADS):
+        if self._server_running():
+            print('Stop the wallet server with "mobcli stop" before restoring its ledger.')
+            exit(1)
+        # Online shards each keep their own copy of the ledger.
+        ledger_dbs = list(dict.fromkeys( c['ledger-db'] for c in _shard_configs(self.config) ))
+        if replace and not self.confirm('Replace the ledger database at {}? (Y/N) '.format(', '.join(ledger_dbs))):
+            print('Cancelled.')
+            return
+        start = time.monotonic()
+        for ledger_db in ledger_dbs:
+            try:
+                restore_snapshot(snapshot, ledger_db, threads, _print_snapshot_progress('Restoring'), replace)
+            except (FileExistsError, ValueError) as e:
+                print()
+                print(e)
+                if isinstance(e, FileExistsError):
+                    print('Use --replace to replace it.')
+                exit(1)
+            print()
+            print('Restored {} from {}.'.format(ledger_db, snapshot))
+        print('Done in {:.1f} seconds. Start the server with "mobcli start".'.format(time.monotonic() - start))
+
+    def ledger_verify(self, snapshot, threads=DEFAULT_THREADS):
+        try:
+            manifest = verify_snapshot(snapshot, threads, _print_snapshot_progress('Verifying'))
+        except ValueError as e:
+            print()
+            print(e)
+            exit(1)
+        print()
+        print('{} is intact: {} files, {}, taken {}.'.format(
+            snapshot,
+            len(manifest['files']),
+            _format_bytes(sum( f['size'] for f in manifest['files'] )),
+            time.strftime('%Y-%m-%d %H:%M', time.localtime(manifest['created'])),
+        ))
+
+    def _server_running(self):
+        try:
+            self.client.get_network_status()
+        except ConnectionError:
+            return False
+        return True
+
+    def _watch_sync(self, accounts, interval=2.0, stall=60.0, until_synced=False):
+        """
+        Show ledger and account sync progress, redrawing it until interrupted.
+
+        Each sample costs one network status request, plus one balance request
+        per watched account.
+        """
+        samples = self._sample_sync(accounts, interval, stall, until_synced)
+        try:
+            if self.format == 'text':
+                names = ['ledger'] + [ _format_account_header(account) for account in accounts ]
+                redraw = sys.stdout.isatty()
+                num_lines = 0
+                for rows in samples:
+                    lines = _format_sync_table(names, rows)
+                    if redraw and num_lines > 0:
+                        print('\033[{}F'.format(num_lines), end='')  # Move back up over the last table.
+                    print('\n'.join( line + '\033[K' if redraw else line for line in lines ))
+                    if not redraw:
+                        print()
+                    num_lines = len(lines)
+                    sys.stdout.flush()
+            else:
+                with record_writer(self.format) as writer:
+                    for rows in samples:
+                        now = time.time()
+                        for row in rows:
+                            writer.write({'time': now, **row})
+                        writer.flush()
+        except KeyboardInterrupt:
+            pass
+
+    def _sample_sync(self, accounts, interval, stall, until_synced):
+        """ Yield a list of sync progress rows for the ledger and each account, at intervals. """
+        ledger_meter = RateMeter()
+        account_meters = { account['account_id']: RateMeter() for account in accounts }
+        while True:
+            network_status = self.client.get_network_status()
+            local_block = network_status['local_block_index']
+            network_block = network_status['network_block_index']
+            ledger_meter.add(local_block)
+            rows = [_sync_row('ledger', local_block, network_block, ledger_meter, stall)]
+
+            with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+                balances = list(executor.map(
+                    lambda account: self.client.get_balance_for_account(account['account_id']),
+                    accounts,
+                ))
+            for account, balance in zip(accounts, balances):
+                account_block = balance['account_block_index']
+                meter = account_meters[account['account_id']]
+                meter.add(account_block)
+                rows.append(_sync_row(account['account_id'], account_block, local_block, meter, stall))
+
+            yield rows
+
+            if until_synced and all( row['state'] == 'synced' for row in rows ):
+                return
+            time.sleep(interval)
+
     def list(self, **args):
         accounts = self.client.get_all_accounts(**args)
+        # Each balance is fetched just before its account is written.
+        account_list = (
+            (account, self.client.get_balance_for_account(account_id))
+            for account_id, account in accounts.items()
+        )
+
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                for account, balance in account_list:
+                    writer.write(_account_record(account, balance))
+            return
 
         if len(accounts) == 0:
             print('No accounts.')
             return
 
-        account_list = []
-        for account_id, account in accounts.items():
-            balance = self.client.get_balance_for_account(account_id)
-            account_list.append((account_id, account, balance))
-
-        for (account_id, account, balance) in account_list:
+        for account, balance in account_list:
             print()
             _print_account(account, balance)
 
@@ -303,7 +754,15 @@ class CommandLineInterface:
         _print_account(account)
         print()
 
-    def import_(self, backup, name=None, block=None, key_derivation_version=2):
+    def import_(self, backup=None, name=None, block=None, key_derivation_version=2, directory=None):
+        if directory is not None:
+            return self._import_dir(directory, block, key_derivation_version)
+        if backup is None:
+            print('Give an account backup, or a directory of backup files with --dir.')
+            exit(1)
+        if is_archive(backup):
+            return self._import_archive(backup, block, key_derivation_version)
+
         data = _load_import(backup)
 
         if name is not None:
@@ -324,7 +783,143 @@ class CommandLineInterface:
         _print_account(account)
         print()
 
-    def export(self, account_id):
+    def _import_dir(self, directory, block=None, key_derivation_version=2):
+        paths = sorted( p for p in Path(directory).iterdir() if p.is_file() )
+        with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+            parsed = list(executor.map(_read_import_file, paths))
+        self._import_backups(list(zip(paths, parsed)), block, key_derivation_version)
+
+    def _import_archive(self, path, block=None, key_derivation_version=2):
+        password = None
+        try:
+            if is_encrypted(path):
+                password = getpass('Archive password: ')
+            backups = [
+                ('{} account {}'.format(path, backup.get('account_id', i)), _read_archive_member(backup))
+                for i, backup in enumerate(read_archive(path, password))
+            ]
+        except ImportError:
+            print('Reading encrypted archives requires the cryptography library. Try:')
+            print('$ pip install cryptography')
+            exit(1)
+        except ValueError as e:
+            print(e)
+            exit(1)
+        self._import_backups(backups, block, key_derivation_version)
+
+    def _import_backups(self, backups, block=None, key_derivation_version=2):
+        """
+        Import (source, (import data, account id, error)) pairs in parallel, then
+        show the sync progress of the new accounts.
+        """
+        # Skip unreadable backups, accounts already in the wallet, and duplicates.
+        # A duplicate backup keeps the earliest first block, so no transactions are missed.
+        existing = self.client.get_all_accounts()
+        to_import = {}
+        num_invalid = 0
+        for source, (data, account_id, error) in backups:
+            if error is not None:
+                print('Skipping {}: {}'.format(source, error))
+                num_invalid += 1
+                continue
+            if account_id in existing:
+                continue
+            if block is not None:
+                data['first_block_index'] = block
+            if 'mnemonic' in data:
+                data.setdefault('key_derivation_version', key_derivation_version)
+            key = account_id or data.get('mnemonic') or data['legacy_root_entropy']
+            other = to_import.get(key)
+            if other is None or int(data.get('first_block_index', 0)) < int(other.get('first_block_index', 0)):
+                to_import[key] = data
+        num_skipped = len(backups) - num_invalid - len(to_import)
+
+        if len(to_import) == 0:
+            print('No new accounts to import from {} backups, skipping {} already imported or duplicated, and {} unreadable.'.format(
+                len(backups), num_skipped, num_invalid))
+            return
+
+        def import_account(data):
+            try:
+                if 'mnemonic' in data:
+                    return self.client.import_account(**data)
+                else:
+                    return self.client.import_account_from_legacy_root_entropy(**data)
+            except WalletAPIError as e:
+                print('Could not import {}: {}'.format(data.get('name', ''), e.server_error))
+
+        with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+            accounts = [ a for a in executor.map(import_account, to_import.values()) if a is not None ]
+
+        print('Imported {} accounts from {} backups, skipping {} already imported or duplicated, and {} unreadable.'.format(
+            len(accounts), len(backups), num_skipped, num_invalid))
+        if len(accounts) < len(to_import):
+            print('{} accounts could not be imported.'.format(len(to_import) - len(accounts)))
+        print()
+        self._watch_sync(accounts, until_synced=True)
+
+    def export(self, account_ids, all_accounts=False, output=None, encrypt=False):
+        if len(account_ids) == 1 and not all_accounts and output is None and not encrypt:
+            return self._export_one(account_ids[0])
+        if len(account_ids) == 0 and not all_accounts:
+            print('Give the accounts to export, or use --all.')
+            exit(1)
+
+        try:
+            if all_accounts:
+                accounts = list(self.client.get_all_accounts().values())
+            else:
+                accounts = [ self._load_account_prefix(prefix) for prefix in account_ids ]
+        except WalletAPIError as e:
+            print('Could not list accounts: {}'.format(e.server_error))
+            exit(1)
+        if output is None:
+            output = 'mobilecoin_seed_phrases.jsonl'
+        if Path(output).exists():
+            print('The file {} already exists. Please rename the existing file and retry.'.format(output))
+            exit(1)
+
+        password = None
+        if encrypt:
+            password = getpass('Archive password: ')
+            if password == '' or getpass('Repeat password: ') != password:
+                print('The passwords were empty or did not match.')
+                exit(1)
+
+        print('You are about to export the seed phrases for {} accounts.'.format(len(accounts)))
+        print()
+        print('Keep the exported archive safe and private!')
+        print('Anyone who has access to the seed phrases can spend all the')
+        print('funds in the accounts.')
+        if not self.confirm('Really write {} account seed phrases to {}? (Y/N) '.format(len(accounts), output)):
+            print('Cancelled.')
+            return
+
+        try:
+            archive = ArchiveWriter(output, password)
+        except ImportError:
+            print('Encrypting archives requires the cryptography library. Try:')
+            print('$ pip install cryptography')
+            exit(1)
+
+        # Secrets are fetched in parallel, and written in order as they arrive.
+        try:
+            with archive, ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+                all_secrets = executor.map(
+                    lambda account: self.client.export_account_secrets(account['account_id']),
+                    accounts,
+                )
+                for account, secrets in zip(accounts, all_secrets):
+                    archive.write(_export_data(account, secrets))
+        except OSError as e:
+            print('Could not write file: {}'.format(e))
+            exit(1)
+        except WalletAPIError as e:
+            print('Could not export account secrets, so nothing was written: {}'.format(e.server_error))
+            exit(1)
+        print('Wrote {} accounts to {}.'.format(archive.count, output))
+
+    def _export_one(self, account_id):
         account = self._load_account_prefix(account_id)
         account_id = account['account_id']
         balance = self.client.get_balance_for_account(account_id)
@@ -372,7 +967,7 @@ class CommandLineInterface:
         account = self._load_account_prefix(account_id)
         account_id = account['account_id']
 
-        transactions = self.client.get_all_transaction_logs_for_account(account_id)
+        transactions = self.client.iter_transaction_logs_for_account(account_id)
 
         def block_key(t):
             submitted = t['submitted_block_index']
@@ -386,9 +981,16 @@ class CommandLineInterface:
             else:
                 return None
 
-        transactions = sorted(transactions.values(), key=block_key)
+        if self.format != 'text':
+            # Records are streamed in the server's order, each with its block index,
+            # rather than collecting the whole history to sort it.
+            with record_writer(self.format) as writer:
+                for _, t in transactions:
+                    for record in _transaction_records(t, block_key(t)):
+                        writer.write(record)
+            return
 
-        for t in transactions:
+        for t in sorted(( t for _, t in transactions ), key=block_key):
             print()
             if t['direction'] == 'tx_direction_received':
                 amount = _format_mob(
@@ -414,7 +1016,7 @@ class CommandLineInterface:
                 print('paying a fee of {}'.format(_format_mob(pmob2mob(t['fee_pmob']))))
         print()
 
-    def send(self, account_id, amount, to_address, build_only=False, delay=0):
+    def send(self, account_id, amount, to_address, build_only=False, delay=0, queue=False):
         account = self._load_account_prefix(account_id)
         account_id = account['account_id']
         balance = self.client.get_balance_for_account(account_id)
@@ -434,7 +1036,7 @@ class CommandLineInterface:
             amount = Decimal(amount)
             total_amount = amount + fee
 
-        if build_only:
+        if build_only or queue:
             verb = 'Building transaction for'
         else:
             verb = 'Sending'
@@ -460,9 +1062,15 @@ class CommandLineInterface:
             ]).format(unspent))
             return
 
-        if build_only:
-            tombstone_block = int(balance['network_block_index']) + delay + MAX_TOMBSTONE_BLOCKS
+        if build_only or queue:
+            tombstone_block = balance['network_block_index'] + delay + MAX_TOMBSTONE_BLOCKS
             tx_proposal = self.client.build_transaction(account_id, amount, to_address, tombstone_block)
+            if queue:
+                input_txo_ids = self.client.txo_ids_by_key_image(account_id, input_key_images(tx_proposal)).values()
+                with self._transaction_queue().transaction() as q:
+                    entry_id = q.add(tx_proposal, account_id, input_txo_ids)
+                print('Added {} to the transaction queue.'.format(entry_id))
+                return
             path = Path('tx_proposal.json')
             if path.exists():
                 print(f'The file {path} already exists. Please rename the existing file and retry.')
@@ -483,38 +1091,469 @@ class CommandLineInterface:
             pmob2mob(transaction_log['fee_pmob']),
         ))
 
-    def submit(self, proposal, account_id=None):
+    def submit(self, proposals, account_id=None):
+        # For compatibility, "submit PROPOSAL ACCOUNT_ID" still works.
+        if account_id is None and len(proposals) > 1 and _looks_like_account_id(proposals[-1]):
+            account_id = proposals.pop()
         if account_id is not None:
             account = self._load_account_prefix(account_id)
             account_id = account['account_id']
 
-        with Path(proposal).open() as f:
-            tx_proposal = json.load(f)
+        paths = self._proposal_paths(proposals)
+        tx_proposals = {}
+        for path in paths:
+            with path.open() as f:
+                tx_proposals[path] = json.load(f)
 
-        # Check that the tombstone block is within range.
-        tombstone_block = int(tx_proposal['tx']['prefix']['tombstone_block'])
+        # Check every tombstone block against a single network status.
         network_status = self.client.get_network_status()
-        lo = int(network_status['network_block_index']) + 1
-        hi = lo + MAX_TOMBSTONE_BLOCKS
-        if lo >= tombstone_block:
-            print('This transaction has expired, and can no longer be submitted.')
+        lo, hi = tombstone_window(network_status['network_block_index'])
+        ready, expired, early = [], [], []
+        for path, tx_proposal in tx_proposals.items():
+            tombstone_block = int(tx_proposal['tx']['prefix']['tombstone_block'])
+            if tombstone_block <= lo:
+                expired.append(path)
+            elif tombstone_block > hi:
+                early.append((path, tombstone_block - hi))
+            else:
+                ready.append((tombstone_block, path))
+        ready = [ path for _, path in sorted(ready) ]
+
+        for path in expired:
+            print('{} has expired, and can no longer be submitted.'.format(path))
+        for path, num_blocks in early:
+            print('{} cannot be submitted yet. Wait for {} more blocks.'.format(path, num_blocks))
+        if len(ready) == 0:
             return
-        if tombstone_block > hi:
-            print('This transaction cannot be submitted yet. Wait for {} more blocks.'.format(
-                tombstone_block - hi))
 
         # Confirm and submit.
         if account_id is None:
-            print('This transaction will not be logged, because an account id was not provided.')
-        total_value = sum( pmob2mob(outlay['value']) for outlay in tx_proposal['outlay_list'] )
-        if not self.confirm(
-            'Submit this transaction proposal for {}? (Y/N) '.format(_format_mob(total_value))
-        ):
+            print('Transactions will not be logged, because an account id was not provided.')
+        total_value = sum(
+            pmob2mob(outlay['value'])
+            for path in ready
+            for outlay in tx_proposals[path]['outlay_list']
+        )
+        if len(ready) == 1:
+            message = 'Submit this transaction proposal for {}? (Y/N) '.format(_format_mob(total_value))
+        else:
+            message = 'Submit {} transaction proposals for {}, earliest expiring first? (Y/N) '.format(
+                len(ready), _format_mob(total_value))
+        if not self.confirm(message):
             print('Cancelled.')
             return
 
-        self.client.submit_transaction(tx_proposal)
-        print('Submitted. The file {} is now unusable for sending transactions.'.format(proposal))
+        def submit(path):
+            try:
+                self.client.submit_transaction(tx_proposals[path], account_id)
+            except WalletAPIError as e:
+                return e.server_error
+
+        with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+            errors = list(executor.map(submit, ready))
+
+        failed = [ (path, error) for path, error in zip(ready, errors) if error is not None ]
+        for path, error in failed:
+            print('{} failed: {}'.format(path, error))
+        if len(paths) == 1 and not failed:
+            print('Submitted. The file {} is now unusable for sending transactions.'.format(paths[0]))
+        else:
+            print('Submitted {} of {} transaction proposals: {} failed, {} expired, {} too early.'.format(
+                len(ready) - len(failed), len(paths), len(failed), len(expired), len(early)))
+
+    def _proposal_paths(self, proposals):
+        paths = _proposal_paths(proposals)
+        missing = [ path for path in paths if not path.is_file() ]
+        for path in missing:
+            print('File not found: {}'.format(path))
+        if missing:
+            exit(1)
+        return paths
+
+    def queue(self, action, **args):
+        getattr(self, 'queue_' + action)(**args)
+
+    def queue_add(self, proposals, account_id=None):
+        if account_id is not None:
+            account_id = self._load_account_prefix(account_id)['account_id']
+        paths = self._proposal_paths(proposals)
+        tx_proposals = []
+        for path in paths:
+            with path.open() as f:
+                tx_proposals.append(json.load(f))
+
+        # Look up every proposal's input txos in one pass over the account.
+        txo_ids = {}
+        if account_id is not None:
+            txo_ids = self.client.txo_ids_by_key_image(
+                account_id, [ k for p in tx_proposals for k in input_key_images(p) ])
+
+        with self._transaction_queue().transaction() as q:
+            for path, tx_proposal in zip(paths, tx_proposals):
+                key_images = input_key_images(tx_proposal)
+                input_txo_ids = None
+                if all( k in txo_ids for k in key_images ):
+                    input_txo_ids = [ txo_ids[k] for k in key_images ]
+                entry_id = q.add(tx_proposal, account_id, input_txo_ids)
+                print('Added {} as {}'.format(path, entry_id))
+
+    def queue_list(self):
+        q = self._transaction_queue()
+        q.load()
+        entries = sorted(q.entries.values(), key=lambda e: e['tombstone_block'])
+
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                for entry in entries:
+                    writer.write(_queue_record(entry))
+            return
+
+        if len(entries) == 0:
+            print('The transaction queue is empty.')
+            return
+        lo, hi = tombstone_window(self.client.get_network_status()['network_block_index'])
+        for entry in entries:
+            print(_format_queue_entry(entry, lo, hi))
+
+    def queue_run(self, forever=False, interval=1.0):
+        q = self._transaction_queue()
+        with q.transaction():
+            num_waiting = len(q.waiting())
+        if num_waiting == 0 and not forever:
+            print('No transaction proposals are waiting.')
+            return
+        print('Waiting to submit {} transaction proposals.'.format(num_waiting))
+
+        def on_change(entry):
+            if entry['state'] in ('failed', 'unknown'):
+                print('{} {}: {}'.format(entry['id'], entry['state'], entry['error']), flush=True)
+            else:
+                print('{} {}'.format(entry['id'], entry['state']), flush=True)
+
+        try:
+            q.run(self.client, interval, forever, on_change)
+        except KeyboardInterrupt:
+            print()
+
+    def queue_clear(self):
+        with self._transaction_queue().transaction() as q:
+            done = [ entry_id for entry_id, e in q.entries.items() if e['state'] in ('submitted', 'expired', 'failed', 'unknown') ]
+            for entry_id in done:
+                del q.entries[entry_id]
+        print('Removed {} transaction proposals from the queue.'.format(len(done)))
+
+    def _transaction_queue(self):
+        path = self.config.get('transaction-queue')
+        if path is None:
+            path = Path(self.config['wallet-db']).parent / 'transaction_queue.json'
+        return TransactionQueue(path)
+
+    def payout(self, account_id, payments, journal=None, retry_failed=False, concurrency=DEFAULT_CONCURRENCY, report=None):
+        account = self._load_account_prefix(account_id)
+        account_id = account['account_id']
+        if journal is None:
+            journal = payments + '.journal'
+        rows = _load_payments(payments)
+
+        try:
+            with PayoutJournal(journal) as j:
+                # Identical rows without an id are told apart by counting them.
+                counts = {}
+                entries = []
+                for row_id, address, amount_pmob in rows:
+                    if row_id is None:
+                        n = counts.get((address, amount_pmob), 0)
+                        counts[(address, amount_pmob)] = n + 1
+                        row_id = payment_id(account_id, address, amount_pmob, n)
+                    entries.append(j.add(row_id, account_id, address, amount_pmob))
+
+                todo = [
+                    e for e in entries
+                    if e['state'] not in FINAL_STATES or (retry_failed and e['state'] == FAILED)
+                ]
+                print('{} payments: {} already paid, {} to pay.'.format(
+                    len(entries),
+                    sum( 1 for e in entries if e['state'] == SUCCEEDED ),
+                    len(todo),
+                ))
+                if len(todo) > 0:
+                    print()
+                    _print_account(account)
+                    print()
+                    if not self.confirm('Pay {} payments worth {}, plus fees, from this account? (Y/N) '.format(
+                        len(todo),
+                        _format_mob(pmob2mob(sum( e['amount_pmob'] for e in todo ))),
+                    )):
+                        print('Cancelled.')
+                        return
+
+                    num_paid = sum( 1 for e in entries if e['state'] == SUCCEEDED )
+
+                    def on_change(entry):
+                        nonlocal num_paid
+                        if entry['state'] == SUCCEEDED:
+                            num_paid += 1
+                            print('\rPaid {} of {} payments.'.format(num_paid, len(entries)), end='', flush=True)
+
+                    try:
+                        j.run(self.client, concurrency, retry_failed=retry_failed, on_change=on_change)
+                    except KeyboardInterrupt:
+                        print()
+                        print('Interrupted. Run the same command again to resume, without paying anyone twice.')
+                        return
+                    print()
+
+                for entry in entries:
+                    if entry['state'] == UNKNOWN:
+                        print('Payment {} to {} is in an unknown state: {}. Check the account history before retrying.'.format(
+                            entry['id'], entry['to_address'], entry['error']))
+                    elif entry['state'] == FAILED:
+                        print('Payment {} to {} failed: {}'.format(entry['id'], entry['to_address'], entry['error']))
+        except RuntimeError as e:
+            print(e)
+            exit(1)
+
+        if report is not None:
+            with open(report, 'w', newline='') as f:
+                with record_writer('csv', f) as writer:
+                    for entry in entries:
+                        writer.write(_payout_record(entry))
+            print('Wrote report to {}'.format(report))
+
+    def consolidate(self, account_id, below=None, target=1, max_inputs=MAX_INPUTS):
+        account = self._load_account_prefix(account_id)
+        account_id = account['account_id']
+        target = max(1, target)
+        network_status = self.client.get_network_status()
+        fee = network_status['fee_pmob']
+        below_pmob = None if below is None else mob2pmob(below)
+
+        txos_by_subaddress = self.client.unspent_txos_by_subaddress(account_id, below_pmob)
+        num_txos_before = sum( len(txos) for txos in txos_by_subaddress.values() )
+        num_transactions = 0
+        num_rounds = 0
+        for txos in txos_by_subaddress.values():
+            n, r = _estimate_consolidation(txos, fee, max_inputs, target)
+            num_transactions += n
+            num_rounds = max(num_rounds, r)
+        if num_transactions == 0:
+            print('Nothing to consolidate, account {} has {} txos to merge.'.format(account_id[:6], num_txos_before))
+            return
+
+        print('\n'.join([
+            'Merging {} txos in {} subaddresses into {} in each, in account {} {},',
+            'takes about {} transactions over {} rounds, one round per block.',
+            'Fees will be about {}.',
+        ]).format(
+            num_txos_before,
+            len(txos_by_subaddress),
+            target,
+            account_id[:6],
+            account['name'],
+            num_transactions,
+            num_rounds,
+            _format_mob(pmob2mob(num_transactions * fee)),
+        ))
+        if not self.confirm('Continue? (Y/N) '):
+            print('Cancelled.')
+            return
+
+        # Merged txos go back to the subaddress they came from.
+        addresses = {0: account['main_address']}
+
+        def merge(subaddress_group):
+            subaddress_index, group = subaddress_group
+            value = sum( value for value, _ in group ) - fee
+            input_txo_ids = [ txo_id for _, txo_id in group ]
+            return self.client.build_and_submit_transaction(
+                account_id, pmob2mob(value), addresses[subaddress_index], input_txo_ids)
+
+        # Each round's transactions spend disjoint txos, so submit them all at
+        # once, then wait for them to land before merging the results.
+        num_succeeded = 0
+        while True:
+            groups = [
+                (subaddress_index, group)
+                for subaddress_index, txos in sorted(txos_by_subaddress.items())
+                for group in _plan_consolidation(txos, fee, max_inputs, target)
+            ]
+            if len(groups) == 0:
+                break
+            missing = { subaddress_index for subaddress_index, _ in groups } - addresses.keys()
+            if len(missing) > 0:
+                addresses.update(_subaddress_addresses(self.client, account_id, missing))
+                if not missing <= addresses.keys():
+                    print('Could not find subaddresses {} in account {}.'.format(
+                        ', '.join( str(i) for i in sorted(missing - addresses.keys()) ),
+                        account_id[:6],
+                    ))
+                    exit(1)
+            with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+                transaction_logs = list(executor.map(merge, groups))
+            print('Submitted {} transactions merging {} txos.'.format(
+                len(groups),
+                sum( len(group) for _, group in groups ),
+            ))
+
+            # Wait until the transactions are final, rather than for a block
+            # index, since they may land in any block before their tombstone.
+            transaction_logs = self.client.poll_transaction_logs(
+                [ t['transaction_log_id'] for t in transaction_logs ])
+            num_failed = sum( 1 for t in transaction_logs if t['status'] == 'tx_status_failed' )
+            num_succeeded += len(transaction_logs) - num_failed
+            if num_failed == len(transaction_logs):
+                print('Every transaction in this round failed. Stopping.')
+                break
+            elif num_failed > 0:
+                print('{} transactions failed, and their txos will be merged in the next round.'.format(num_failed))
+            txos_by_subaddress = self.client.unspent_txos_by_subaddress(account_id, below_pmob)
+
+        print('Merged {} txos into {}, paying {} in fees.'.format(
+            num_txos_before,
+            sum( len(txos) for txos in txos_by_subaddress.values() ),
+            _format_mob(pmob2mob(num_succeeded * fee)),
+        ))
+
+    def txos(self, account_id, status=None, subaddress=None, min_amount=None, max_amount=None, sort=None,
+             reverse=False, limit=None, count=False, refresh=None):
+        account = self._load_account_prefix(account_id)
+        account_id = account['account_id']
+        query = {
+            'status': None if status is None else 'txo_status_' + status,
+            'subaddress_index': subaddress,
+            'min_value': None if min_amount is None else mob2pmob(min_amount),
+            'max_value': None if max_amount is None else mob2pmob(max_amount),
+            'sort': '-' + sort if sort is not None and reverse else sort,
+        }
+
+        index = TxoIndex(account_id)
+        try:
+            while True:
+                index.update(self.client.iter_txos_for_account(account_id))
+                txo_ids = index.query(**query)
+                _print_txo_query(index, txo_ids, limit, count)
+                if refresh is None:
+                    break
+                time.sleep(refresh)
+                print()
+        except KeyboardInterrupt:
+            pass
+
+    def summary(self, separator=None, prefix=None):
+        accounts = self.client.get_all_accounts()
+        balances = self.client.get_balances_for_accounts(accounts.keys())
+
+        rows = []
+        for account_id, account in accounts.items():
+            balance = balances[account_id]
+            name = account['name'] or ''
+            if separator is not None:
+                group = name.split(separator, 1)[0]
+            elif prefix is not None:
+                group = name[:prefix]
+            else:
+                group = 'all'
+            rows.append({
+                'row_type': 'account',
+                'account_id': account_id,
+                'name': name,
+                'group': group,
+                'accounts': 1,
+                'unspent_pmob': balance['unspent_pmob'],
+                'pending_pmob': balance['pending_pmob'],
+                'spent_pmob': balance['spent_pmob'],
+                'sync_lag_blocks': max(0, balance['network_block_index'] - balance['account_block_index']),
+            })
+
+        groups = {}
+        for row in rows:
+            groups.setdefault(row['group'], []).append(row)
+        group_rows = [ _summary_total('group', group, group_rows) for group, group_rows in groups.items() ]
+        total_row = _summary_total('total', None, rows)
+
+        if self.format != 'text':
+            # Account rows come first, then a row for each group, then the overall total.
+            with record_writer(self.format) as writer:
+                for row in rows + group_rows + [total_row]:
+                    writer.write(row)
+            return
+
+        totals = group_rows + [total_row] if len(group_rows) > 1 else group_rows
+        labels = [ 'total' if row['row_type'] == 'total' else row['group'] for row in totals ]
+        width = max(map(len, labels)) if totals else 0
+        print('{:<{}}  {:>8}  {:>26}  {:>26}  {:>26}'.format('', width, 'accounts', 'unspent', 'pending', 'spent'))
+        for label, row in zip(labels, totals):
+            print('{:<{}}  {:>8}  {:>26}  {:>26}  {:>26}'.format(
+                label,
+                width,
+                row['accounts'],
+                _format_pmob_exact(row['unspent_pmob']),
+                _format_pmob_exact(row['pending_pmob']),
+                _format_pmob_exact(row['spent_pmob']),
+            ))
+
+        lagging = [ row for row in rows if row['sync_lag_blocks'] > 0 ]
+        if lagging:
+            print()
+            print('{} accounts are not synced, so their balances may be out of date:'.format(len(lagging)))
+            for row in sorted(lagging, key=lambda row: -row['sync_lag_blocks']):
+                print('  {} {} is {} blocks behind'.format(row['account_id'][:6], row['name'], row['sync_lag_blocks']))
+
+    def watch(self, account_ids, output=None, socket=None, interval=1.0):
+        if len(account_ids) == 0:
+            accounts = self.client.get_all_accounts()
+        else:
+            accounts = { a['account_id']: a for a in map(self._load_account_prefix, account_ids) }
+        watcher = TxoWatcher(self.client, accounts.keys(), interval)
+        format = 'ndjson' if self.format == 'text' else self.format
+
+        if socket is not None:
+            stream = UnixSocketBroadcaster(socket)
+        elif output is not None:
+            stream = open(output, 'a')
+        else:
+            stream = None
+
+        try:
+            with record_writer(format, stream) as writer:
+                for event in watcher:
+                    writer.write(event)
+                    writer.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if stream is not None:
+                stream.close()
+
+    def whois(self, address):
+        accounts = self.client.get_all_accounts()
+        index = self._address_index()
+
+        # Only refresh the index when it can't answer, or its answer is for a deleted account.
+        record = index.lookup(address)
+        if record is None or record.account_id not in accounts:
+            index.refresh(self.client, accounts)
+            index.save()
+            record = index.lookup(address)
+
+        if record is None or record.account_id not in accounts:
+            print('Address {} does not belong to this wallet.'.format(address))
+            exit(1)
+
+        account = accounts[record.account_id]
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                writer.write({
+                    'public_address': address,
+                    'account_id': record.account_id,
+                    'account_name': account['name'],
+                    'subaddress_index': record.subaddress_index,
+                    'metadata': record.metadata,
+                })
+            return
+
+        print(_format_account_header(account))
+        print('  subaddress {} {}'.format(record.subaddress_index, record.metadata))
 
     def qr(self, account_id):
         try:
@@ -545,11 +1584,26 @@ class CommandLineInterface:
         account = self._load_account_prefix(account_id)
         addresses = self.client.get_addresses_for_account(account['account_id'])
 
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                for address in addresses.values():
+                    if address['subaddress_index'] == 1:
+                        continue  # Don't show change address.
+                    balance = self.client.get_balance_for_address(address['public_address'])
+                    writer.write({
+                        'account_id': account['account_id'],
+                        'public_address': address['public_address'],
+                        'subaddress_index': address['subaddress_index'],
+                        'metadata': address['metadata'],
+                        **_balance_record(balance),
+                    })
+            return
+
         print()
         print(_format_account_header(account))
 
         for address in addresses.values():
-            if int(address['subaddress_index']) == 1:
+            if address['subaddress_index'] == 1:
                 continue  # Don't show change address.
             print(indent(
                 '{} {}'.format(address['public_address'], address['metadata']),
@@ -563,22 +1617,81 @@ class CommandLineInterface:
 
         print()
 
-    def address_create(self, account_id, metadata):
+    def address_create(self, account_id, metadata, count=1, from_file=None):
         account = self._load_account_prefix(account_id)
-        address = self.client.assign_address_for_account(account['account_id'], metadata)
+
+        if from_file is not None:
+            with open(from_file) as f:
+                metadata_list = [ line.strip() for line in f if line.strip() ]
+        elif count == 1:
+            metadata_list = [metadata]
+        else:
+            prefix = '' if metadata is None else metadata + '-'
+            metadata_list = [ '{}{}'.format(prefix, i) for i in range(1, count + 1) ]
+
+        # Addresses assigned before a failure are still saved to the index.
+        index = self._address_index()
+        try:
+            addresses = self.client.assign_addresses_for_account(
+                account['account_id'], metadata_list, on_assigned=index.add)
+        finally:
+            index.save()
+
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                for address in addresses:
+                    writer.write(_address_record(address))
+            return
+
         print()
         print(_format_account_header(account))
-        print(indent(
-            '{} {}'.format(address['public_address'], address['metadata']),
-            ' '*2,
-        ))
+        for address in addresses:
+            print(indent(
+                '{} {}'.format(address['public_address'], address['metadata']),
+                ' '*2,
+            ))
         print()
 
+    def address_lookup(self, key):
+        index = self._address_index()
+        if index.lookup(key) is not None:
+            public_addresses = [key]
+        else:
+            public_addresses = index.lookup_metadata(key)
+
+        if len(public_addresses) == 0:
+            print('No address or label {} in the local address index.'.format(key))
+            exit(1)
+
+        for public_address in public_addresses:
+            record = index.lookup(public_address)
+            print('{} {}'.format(public_address, record.metadata))
+            print('  account {}, subaddress {}'.format(record.account_id[:6], record.subaddress_index))
+
+    def _address_index(self):
+        path = self.config.get('address-index')
+        if path is None:
+            path = Path(self.config['wallet-db']).parent / 'address_index.json'
+        return AddressIndex(path)
+
     def gift(self, action, **args):
         getattr(self, 'gift_' + action)(**args)
 
     def gift_list(self):
         gift_codes = self.client.get_all_gift_codes()
+
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                for gift_code in gift_codes:
+                    response = self.client.check_gift_code_status(gift_code['gift_code_b58'])
+                    writer.write({
+                        'gift_code_b58': gift_code['gift_code_b58'],
+                        'value_pmob': gift_code['value_pmob'],
+                        'memo': gift_code['memo'],
+                        'status': _format_gift_code_status(response['gift_code_status']),
+                    })
+            return
+
         if gift_codes == []:
             print('No gift codes.')
         else:
@@ -593,9 +1706,14 @@ class CommandLineInterface:
                 )
             print()
 
-    def gift_create(self, account_id, amount, memo=''):
+    def gift_create(self, account_id, amount, memo='', count=1, output=None):
         account = self._load_account_prefix(account_id)
         amount = Decimal(amount)
+        if memo is None:
+            memo = ''
+        if count > 1 or output is not None:
+            return self._gift_create_bulk(account, amount, memo, count, output)
+
         response = self.client.build_gift_code(account['account_id'], amount, memo)
         gift_code_b58 = response['gift_code_b58']
         tx_proposal = response['tx_proposal']
@@ -614,8 +1732,83 @@ class CommandLineInterface:
         gift_code = self.client.submit_gift_code(gift_code_b58, tx_proposal, account['account_id'])
         print('Created gift code {}'.format(gift_code['gift_code_b58']))
 
-    def gift_claim(self, account_id, gift_code):
+    def _gift_create_bulk(self, account, amount, memo, count, output):
+        fee = pmob2mob(self.client.get_network_status()['fee_pmob'])
+        balance = self.client.get_balance_for_account(account['account_id'])
+        if pmob2mob(balance['unspent_pmob']) < count * (amount + fee):
+            print('There is not enough MOB in the account {} to create {} gift codes of {}.'.format(
+                account['account_id'][:6], count, _format_mob(amount)))
+            return
+
+        if not self.confirm('Create {} gift codes of {} each from account {} {}, for {} plus {} in fees? (Y/N) '.format(
+            count,
+            _format_mob(amount),
+            account['account_id'][:6],
+            account['name'],
+            _format_mob(count * amount),
+            _format_mob(count * fee),
+        )):
+            print('Cancelled.')
+            return
+
+        # Each code is written out once it has landed and can be claimed, so the
+        # output never holds a code which was not funded.
+        num_submitted = 0
+        num_created = 0
+
+        def on_submitted(gift_code):
+            nonlocal num_submitted
+            num_submitted += 1
+
+        def create(write):
+            nonlocal num_created
+            gift_codes = self.client.create_gift_codes(
+                account['account_id'], amount, count, memo, on_submitted=on_submitted)
+            for gift_code in gift_codes:
+                write(gift_code['gift_code_b58'])
+                num_created += 1
+                if output is not None:
+                    print('\rCreated {} of {} gift codes.'.format(num_created, count), end='', flush=True)
+            if output is not None:
+                print()
+
+        f = sys.stdout if output is None else open(output, 'a')
+        try:
+            if self.format != 'text':
+                with record_writer(self.format, f) as writer:
+                    def write_record(gift_code_b58):
+                        writer.write({
+                            'gift_code_b58': gift_code_b58,
+                            'value_pmob': mob2pmob(amount),
+                            'memo': memo,
+                        })
+                        writer.flush()
+                    create(write_record)
+            else:
+                def write_line(gift_code_b58):
+                    f.write(gift_code_b58 + '\n')
+                    f.flush()
+                create(write_line)
+        except Exception as e:
+            print()
+            print('Stopped after creating {} of {} gift codes: {}'.format(num_created, count, e))
+            if num_submitted > num_created:
+                print('{} more gift codes were submitted, but had not landed yet, so they are not in the output.'.format(
+                    num_submitted - num_created))
+                print('Find them with "mobcli gift list".')
+            exit(1)
+        finally:
+            if output is not None:
+                f.close()
+
+    def gift_claim(self, account_id, gift_code=None, from_file=None, report=None):
         account = self._load_account_prefix(account_id)
+        if from_file is not None:
+            return self._gift_claim_bulk(account, from_file, report)
+        if gift_code is None:
+            print('Give a gift code, or a file of gift codes with --from-file.')
+            exit(1)
+
         response = self.client.check_gift_code_status(gift_code)
         amount = pmob2mob(response['gift_code_value'])
         status = response['gift_code_status']
@@ -644,6 +1837,77 @@ class CommandLineInterface:
 
         print('Successfully claimed!')
 
+    def _gift_claim_bulk(self, account, from_file, report):
+        with open(from_file) as f:
+            gift_codes = list(dict.fromkeys( line.strip() for line in f if line.strip() ))
+
+        responses = self.client.check_gift_code_statuses(gift_codes)
+        results = {}
+        available = []
+        total_pmob = 0
+        for gift_code, (response, error) in zip(gift_codes, responses):
+            if error is not None:
+                results[gift_code] = {
+                    'gift_code_b58': gift_code,
+                    'status': 'CheckFailed',
+                    'value_pmob': None,
+                    'txo_id': None,
+                    'error': error,
+                }
+                continue
+            status = response['gift_code_status']
+            value_pmob = try_int(response.get('gift_code_value'))
+            results[gift_code] = {
+                'gift_code_b58': gift_code,
+                'status': status,
+                'value_pmob': value_pmob,
+                'txo_id': None,
+                'error': None,
+            }
+            if status == 'GiftCodeAvailable':
+                available.append(gift_code)
+                total_pmob += value_pmob
+
+        print('{} gift codes: {} available, {} already claimed, {} not yet landed, {} could not be checked.'.format(
+            len(gift_codes),
+            len(available),
+            sum( 1 for r in results.values() if r['status'] == 'GiftCodeClaimed' ),
+            sum( 1 for r in results.values() if r['status'] == 'GiftCodeSubmittedPending' ),
+            sum( 1 for r in results.values() if r['status'] == 'CheckFailed' ),
+        ))
+        if len(available) > 0:
+            print()
+            _print_account(account)
+            print()
+            if not self.confirm('Claim {} gift codes worth {} for this account? (Y/N) '.format(
+                len(available),
+                _format_mob(pmob2mob(total_pmob)),
+            )):
+                print('Cancelled.')
+                return
+
+            num_claimed = 0
+            for gift_code, txo_id, error in self.client.claim_gift_codes(account['account_id'], available):
+                result = results[gift_code]
+                result['txo_id'] = txo_id
+                if error is None:
+                    result['status'] = 'Claimed'
+                    num_claimed += 1
+                elif error == 'GiftCodeClaimed':
+                    result['status'] = error
+                else:
+                    result['status'] = 'ClaimFailed'
+                    result['error'] = error
+                print('\rClaimed {} of {} gift codes.'.format(num_claimed, len(available)), end='', flush=True)
+            print()
+
+        if report is not None:
+            with open(report, 'w', newline='') as f:
+                with record_writer('csv', f) as writer:
+                    for gift_code in gift_codes:
+                        writer.write(results[gift_code])
+            print('Wrote report to {}'.format(report))
+
     def gift_remove(self, gift_code):
         gift_code_b58 = gift_code
 
@@ -676,27 +1940,185 @@ class CommandLineInterface:
                 print('Gift code not found; nothing to remove.')
                 return
 
+    def receipts(self, action, **args):
+        getattr(self, 'receipts_' + action)(**args)
+
+    def receipts_check(self, receipts_file, no_wait=False):
+        receipts = _load_receipts(receipts_file)
+        statuses = self.client.check_receiver_receipt_statuses(
+            [ (r['address'], r['receipt']) for r in receipts ],
+            wait=not no_wait,
+        )
+
+        if self.format != 'text':
+            with record_writer(self.format) as writer:
+                for i, response, error in statuses:
+                    writer.write(_receipt_record(receipts[i], response, error))
+                    writer.flush()
+            return
+
+        counts = {}
+        for i, response, error in statuses:
+            record = _receipt_record(receipts[i], response, error)
+            status = record['status']
+            counts[status] = counts.get(status, 0) + 1
+            print('{} {} {}{}'.format(
+                record['address'],
+                record['public_key'] or '',
+                status,
+                '' if error is None else ' ({})'.format(error),
+            ), flush=True)
+        print()
+        print(', '.join( '{} {}'.format(n, status) for status, n in sorted(counts.items()) ))
+
+
+def _plan_consolidation(txos, fee, max_inputs, target):
+    """
+    Group (value, txo_id) pairs into self-transfers, smallest txos first.
+
+    A transfer turns its group of inputs into a single txo, so groups are only
+    made until the number of txos would reach the target. Groups worth no more
+    than the fee cannot pay for themselves, and are left alone.
+    """
+    txos = sorted(txos)
+    groups = []
+    excess = len(txos) - target
+    i = 0
+    while excess > 0 and len(txos) - i >= 2:
+        size = min(max_inputs, excess + 1, len(txos) - i)
+        group = txos[i:i + size]
+        i += size
+        if sum( value for value, _ in group ) <= fee:
+            continue
+        groups.append(group)
+        excess -= size - 1
+    return groups
+
+
+def _estimate_consolidation(txos, fee, max_inputs, target):
+    """
+    Count the transactions and rounds needed to merge (value, txo_id) pairs down
+    to the target, planning each round as consolidate does, so groups too small
+    to pay the fee are skipped here too. Assumes every transaction lands.
+    """
+    num_transactions = 0
+    num_rounds = 0
+    while True:
+        groups = _plan_consolidation(txos, fee, max_inputs, target)
+        if len(groups) == 0:
+            return num_transactions, num_rounds
+        merged = { txo_id for group in groups for _, txo_id in group }
+        txos = [ (value, txo_id) for value, txo_id in txos if txo_id not in merged ] + [
+            (sum( value for value, _ in group ) - fee, 'merged-{}-{}'.format(num_rounds, i))
+            for i, group in enumerate(groups)
+        ]
+        num_transactions += len(groups)
+        num_rounds += 1
+
+
+def _subaddress_addresses(client, account_id, subaddress_indexes):
+    """ Look up the public addresses of some of an account's subaddresses, one page at a time. """
+    addresses = {}
+    offset = 0
+    while not subaddress_indexes <= addresses.keys():
+        page = client.get_addresses_for_account(account_id, offset=offset, limit=1000)
+        if len(page) == 0:
+            break
+        for address in page.values():
+            if address['subaddress_index'] in subaddress_indexes:
+                addresses[address['subaddress_index']] = address['public_address']
+        offset += len(page)
+    return addresses
+
 
 def _format_mob(mob):
     return '{:.4f} MOB'.format(mob)
 
 
+def _format_pmob_exact(pmob):
+    """ Format an amount of picoMOB in MOB, with every digit. """
+    sign = '-' if pmob < 0 else ''
+    pmob = abs(pmob)
+    return '{}{}.{:012d} MOB'.format(sign, pmob // 10**12, pmob % 10**12)
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h{:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    elif seconds >= 60:
+        return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+    else:
+        return '{}s'.format(seconds)
+
+
+def _format_sync_progress(label, current_block, target_block, meter):
+    if target_block == 0:
+        return '{} at block {}, waiting for network.'.format(label, current_block)
+    progress = '{} {}/{} blocks'.format(label, current_block, target_block)
+    if current_block >= target_block:
+        return progress + ', synced.'
+    rate = meter.rate()
+    if rate is None:
+        return progress + ', measuring rate.'
+    eta = meter.eta(target_block)
+    if eta is None:
+        return progress + ', {:.1f} blocks/sec.'.format(rate)
+    return progress + ', {:.1f} blocks/sec, ETA {}.'.format(rate, _format_duration(eta))
+
+
+def _sync_row(name, block_index, target_block_index, meter, stall):
+    rate = meter.rate()
+    eta = meter.eta(target_block_index)
+    if target_block_index == 0:
+        state = 'waiting'
+    elif block_index >= target_block_index:
+        state = 'synced'
+        eta = 0
+    elif meter.stalled_for() >= stall:
+        state = 'stalled'
+    else:
+        state = 'syncing'
+    return {
+        'name': name,
+        'block_index': block_index,
+        'target_block_index': target_block_index,
+        'blocks_per_sec': None if rate is None else round(rate, 2),
+        'eta_seconds': None if eta is None else round(eta),
+        'state': state,
+    }
+
+
+def _format_sync_table(names, rows):
+    row_format = '{:<24} {:>21} {:>11} {:>8}  {}'
+    lines = [row_format.format('', 'blocks', 'blocks/sec', 'ETA', 'state')]
+    for name, row in zip(names, rows):
+        lines.append(row_format.format(
+            name[:24],
+            '{}/{}'.format(row['block_index'], row['target_block_index']),
+            '-' if row['blocks_per_sec'] is None else '{:.1f}'.format(row['blocks_per_sec']),
+            '-' if row['eta_seconds'] is None else _format_duration(row['eta_seconds']),
+            row['state'],
+        ))
+    return lines
+
+
 def _format_account_header(account):
     return '{} {}'.format(account['account_id'][:6], account['name'])
 
 
 def _format_balance(balance):
     offline = False
-    network_block = int(balance['network_block_index'])
+    network_block = balance['network_block_index']
     if network_block == 0:
         offline = True
-        network_block = int(balance['local_block_index'])
+        network_block = balance['local_block_index']
 
-    account_block = int(balance['account_block_index'])
+    account_block = balance['account_block_index']
     if account_block == network_block:
         sync_status = 'synced'
     else:
-        sync_status = 'syncing, {}/{}'.format(balance['account_block_index'], network_block)
+        sync_status = 'syncing, {}/{}'.format(account_block, network_block)
 
     if offline:
         offline_status = ' [offline]'
@@ -710,6 +2132,161 @@ def _format_balance(balance):
     )
 
 
+def _balance_record(balance):
+    return {
+        'unspent_pmob': balance['unspent_pmob'],
+        'pending_pmob': balance['pending_pmob'],
+        'account_block_index': balance['account_block_index'],
+        'local_block_index': balance['local_block_index'],
+        'network_block_index': balance['network_block_index'],
+        'is_synced': balance['is_synced'],
+    }
+
+
+def _account_record(account, balance):
+    return {
+        'account_id': account['account_id'],
+        'name': account['name'],
+        'main_address': account['main_address'],
+        **_balance_record(balance),
+    }
+
+
+def _proposal_paths(proposals):
+    """ Expand a list of proposal files and directories into file paths. """
+    paths = []
+    for proposal in proposals:
+        path = Path(proposal)
+        if path.is_dir():
+            paths.extend(sorted(path.glob('*.json')))
+        else:
+            paths.append(path)
+    return paths
+
+
+def _looks_like_account_id(arg):
+    """ Whether a command line argument is an account id or prefix, rather than a file path. """
+    return (
+        len(arg) > 0
+        and all( c in string.hexdigits for c in arg )
+        and not Path(arg).exists()
+    )
+
+
+def _queue_record(entry):
+    return { key: value for key, value in entry.items() if key != 'tx_proposal' }
+
+
+def _format_queue_entry(entry, lo, hi):
+    if entry['state'] == 'queued' and entry['tombstone_block'] > hi:
+        when = 'opens in {} blocks'.format(entry['tombstone_block'] - hi)
+    elif entry['state'] == 'queued' and entry['tombstone_block'] > lo:
+        when = 'expires in {} blocks'.format(entry['tombstone_block'] - lo)
+    elif entry['state'] == 'submitted':
+        when = 'at block {}'.format(entry['submitted_block'])
+    elif entry['state'] in ('failed', 'unknown'):
+        when = entry['error']
+    else:
+        when = ''
+    return '{} {} {:>10} {}'.format(
+        entry['id'],
+        _format_mob(pmob2mob(entry['value_pmob'])),
+        entry['state'],
+        when,
+    ).rstrip()
+
+
+def _load_receipts(filename):
+    receipts = []
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                receipts.append(json.loads(line))
+    return receipts
+
+
+def _load_payments(filename):
+    """ Read (id, address, amount_pmob) rows from a payments CSV file. The id may be None. """
+    rows = []
+    with open(filename, newline='') as f:
+        for row in csv.DictReader(f):
+            rows.append((
+                row.get('id') or None,
+                row['address'].strip(),
+                mob2pmob(row['amount'].strip()),
+            ))
+    return rows
+
+
+def _payout_record(entry):
+    return {
+        'id': entry['id'],
+        'address': entry['to_address'],
+        'amount_pmob': entry['amount_pmob'],
+        'state': entry['state'],
+        'transaction_log_id': entry['transaction_log_id'],
+        'error': entry['error'],
+    }
+
+
+def _summary_total(row_type, group, rows):
+    """ A summary row adding up the balances of account rows. """
+    return {
+        'row_type': row_type,
+        'account_id': None,
+        'name': None,
+        'group': group,
+        'accounts': len(rows),
+        'unspent_pmob': sum( row['unspent_pmob'] for row in rows ),
+        'pending_pmob': sum( row['pending_pmob'] for row in rows ),
+        'spent_pmob': sum( row['spent_pmob'] for row in rows ),
+        'sync_lag_blocks': max(( row['sync_lag_blocks'] for row in rows ), default=0),
+    }
+
+
+def _receipt_record(receipt, response, error=None):
+    return {
+        'address': receipt['address'],
+        'public_key': receipt['receipt'].get('public_key'),
+        'status': 'CheckFailed' if error is not None else response['receipt_transaction_status'],
+        'error': error,
+    }
+
+
+def _address_record(address):
+    return {
+        'account_id': address['account_id'],
+        'public_address': address['public_address'],
+        'subaddress_index': address['subaddress_index'],
+        'metadata': address['metadata'],
+    }
+
+
+def _transaction_records(t, block_index):
+    """ One record for a received transaction, or one per output of a sent transaction. """
+    common = {
+        'transaction_log_id': t['transaction_log_id'],
+        'status': t['status'],
+        'block_index': try_int(block_index),
+        'fee_pmob': t['fee_pmob'],
+    }
+    if t['direction'] == 'tx_direction_received':
+        yield {
+            'direction': 'received',
+            'value_pmob': sum( int(txo['value_pmob']) for txo in t['output_txos'] ),
+            'address': t['assigned_address_id'],
+            **common,
+        }
+    elif t['direction'] == 'tx_direction_sent':
+        for txo in t['output_txos']:
+            yield {
+                'direction': 'sent',
+                'value_pmob': int(txo['value_pmob']),
+                'address': txo['recipient_address_id'],
+                **common,
+            }
+
+
 def _format_gift_code_status(status):
     return {
         'GiftCodeSubmittedPending': 'pending',
@@ -742,6 +2319,29 @@ def _print_gift_code(gift_code_b58, amount, memo='', status=None):
     print(indent('\n'.join(lines), ' '*2))
 
 
+def _print_txo_query(index, txo_ids, limit=None, count=False):
+    if not count:
+        for txo_id in txo_ids[:limit]:
+            record = index.records[txo_id]
+            print('{} {:>16} {:<9} subaddress {:<4} block {}'.format(
+                txo_id[:16],
+                _format_mob(pmob2mob(record.value)),
+                record.status.replace('txo_status_', ''),
+                record.subaddress_index,
+                record.received_block_index,
+            ))
+    stats = index.aggregate(txo_ids)
+    if stats['count'] == 0:
+        print('No matching txos.')
+    else:
+        print('{} txos, total {}, min {}, max {}'.format(
+            stats['count'],
+            _format_mob(pmob2mob(stats['total_pmob'])),
+            _format_mob(pmob2mob(stats['min_pmob'])),
+            _format_mob(pmob2mob(stats['max_pmob'])),
+        ))
+
+
 def _print_txo(txo, received=False):
     print(txo)
     to_address = txo['assigned_address']
@@ -762,6 +2362,100 @@ def _print_txo(txo, received=False):
         print('    to unknown address')
 
 
+def _print_snapshot_progress(verb):
+    def progress(done, total):
+        print('\r{} ledger: {} of {}'.format(verb, _format_bytes(done), _format_bytes(total)), end='', flush=True)
+    return progress
+
+
+def _format_bytes(n):
+    for unit in ['bytes', 'KB', 'MB', 'GB']:
+        if n < 1024 or unit == 'GB':
+            break
+        n /= 1024
+    if unit == 'bytes':
+        return '{} bytes'.format(n)
+    return '{:.1f} {}'.format(n, unit)
+
+
+def _shard_configs(config, offline=False):
+    """
+    Derive the configuration for each wallet server instance.
+
+    The first shard uses the configured paths unchanged, so an existing wallet
+    becomes shard 0. Each additional shard gets its own wallet database, log
+    file and API port. Offline shards never write to the ledger, so they all
+    share one ledger database. Online shards each sync their own copy: an
+    online instance writes every block it syncs to its ledger database, so two
+    can't share one, and an offline instance can't submit transactions for the
+    accounts it holds.
+    """
+    num_shards = int(config.get('shards', 1))
+    shard_configs = [config]
+    for i in range(1, num_shards):
+        shard_config = dict(config)
+        shard_config['wallet-db'] = _shard_path(config['wallet-db'], i)
+        shard_config['logfile'] = _shard_path(config['logfile'], i)
+        if not offline:
+            shard_config['ledger-db'] = _shard_path(config['ledger-db'], i)
+
+        url = urlsplit(config.get('api-url', DEFAULT_URL))
+        shard_config['api-url'] = urlunsplit(url._replace(
+            netloc='{}:{}'.format(url.hostname, (url.port or 80) + i),
+        ))
+        shard_configs.append(shard_config)
+
+    return shard_configs
+
+
+def _shard_path(path, i):
+    path = Path(path)
+    return str(path.with_name('{}_shard{}{}'.format(path.stem, i, path.suffix)))
+
+
+def _pidfile(config):
+    return Path(config['wallet-db']).with_suffix('.pid')
+
+
+def _metrics_path(config):
+    return Path(config['logfile']).with_suffix('.metrics.ndjson')
+
+
+def _supervisor_command(command, config, metrics_interval):
+    return [
+        sys.executable, '-c', 'from mobilecoin.supervisor import main; main()',
+        '--pidfile', str(_pidfile(config)),
+        '--metrics', str(_metrics_path(config)),
+        '--metrics-interval', str(metrics_interval),
+        '--',
+    ] + command
+
+
+def _wallet_server_command(config, offline=False):
+    command = [
+        config['executable'],
+        '--ledger-db', config['ledger-db'],
+        '--wallet-db', config['wallet-db'],
+    ]
+    if 'api-url' in config:
+        port = urlsplit(config['api-url']).port
+        if port is not None:
+            command += ['--listen-port', str(port)]
+    if offline:
+        command += ['--offline']
+    else:
+        for peer in config['peer']:
+            command += ['--peer', peer]
+        for tx_source_url in config['tx-source-url']:
+            command += ['--tx-source-url', tx_source_url]
+
+    ingest_enclave = config.get('fog-ingest-enclave-css')
+    if ingest_enclave is not None:
+        command += ['--fog-ingest-enclave-css', ingest_enclave]
+
+    return command
+
+
 def _load_import(backup):
     # Try to load it as a file.
     try:
@@ -782,10 +2476,31 @@ def _load_import(backup):
 
 
 def _load_import_file(filename):
-    result = {}
-
     with open(filename) as f:
         data = json.load(f)
+    return _parse_import_data(data)
+
+
+def _read_import_file(path):
+    """ Load a backup file for a bulk import, returning (import data, account id, error). """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return _parse_import_data(data), data.get('account_id'), None
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        return None, None, 'not an account backup ({})'.format(e)
+
+
+def _read_archive_member(data):
+    """ Like _read_import_file, for one account from an export archive. """
+    try:
+        return _parse_import_data(data), data.get('account_id'), None
+    except (KeyError, AttributeError) as e:
+        return None, None, 'not an account backup (missing {})'.format(e)
+
+
+def _parse_import_data(data):
+    result = {}
 
     for field in [
         'mnemonic',  # Key derivation version 2+.
@@ -799,6 +2514,12 @@ def _load_import_file(filename):
         if value is not None:
             result[field] = value
 
+    # Files from "mobcli export" name these fields differently.
+    if 'name' not in result and data.get('account_name') is not None:
+        result['name'] = data['account_name']
+    if 'legacy_root_entropy' not in result and data.get('root_entropy') is not None:
+        result['legacy_root_entropy'] = data['root_entropy']
+
     result['fog_keys'] = {}
     for field in [
         'fog_report_url',
@@ -813,6 +2534,17 @@ def _load_import_file(filename):
 
 
 def _save_export(account, secrets, filename):
+    export_data = _export_data(account, secrets)
+
+    path = Path(filename)
+    if path.exists():
+        raise OSError('File exists.')
+    with path.open('w') as f:
+        json.dump(export_data, f, indent=2)
+        f.write('\n')
+
+
+def _export_data(account, secrets):
     export_data = {}
 
     mnemonic = secrets.get('mnemonic')
@@ -827,13 +2559,8 @@ def _save_export(account, secrets, filename):
         'account_id': account['account_id'],
         'account_name': account['name'],
         'account_key': secrets['account_key'],
-        'first_block_index': account['first_block_index'],
-        'next_subaddress_index': account['next_subaddress_index'],
+        # Numbers are kept as strings, as in the API, and in older export files.
+        'first_block_index': str(account['first_block_index']),
+        'next_subaddress_index': str(account['next_subaddress_index']),
     })
-
-    path = Path(filename)
-    if path.exists():
-        raise OSError('File exists.')
-    with path.open('w') as f:
-        json.dump(export_data, f, indent=2)
-        f.write('\n')
+    return export_data
@@ -1,49 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar
 import http
 
 import json
+import threading
 import time
 
-import requests
-
-from .utility import mob2pmob
+from .json_stream import JSONMapStream
+from .limiter import AdaptiveLimiter, BACKGROUND, NORMAL, current_priority
+from .models import (
+    Account,
+    Address,
+    Balance,
+    GiftCode,
+    NetworkStatus,
+    TransactionLog,
+    Txo,
+)
+from .transport import transport_for_url
+from .utility import fund_amounts, mob2pmob, pmob2mob, txo_status
 
 
 DEFAULT_URL = 'http://127.0.0.1:9090/wallet'
 
 MAX_TOMBSTONE_BLOCKS = 100
 
+MAX_INPUTS = 16
+
+# Outputs per transaction, including the change.
+MAX_OUTPUTS = 16
+
+DEFAULT_CONCURRENCY = 8
+
+JSONRPC_PARAMS = {
+    "jsonrpc": "2.0",
+    "api_version": "2",
+    "id": 1,
+}
+
+# Overrides the verbose setting of clients, within one thread or async task.
+_verbose = ContextVar('mobilecoin_verbose', default=None)
+
+# Keeps the traces of concurrent requests from interleaving.
+_print_lock = threading.Lock()
+
+
+def tombstone_window(network_block_index):
+    """
+    The range of tombstone blocks which the network accepts now, as (lo, hi).
+
+    A transaction can be submitted if lo < tombstone_block <= hi. At or below lo
+    it has expired, and above hi it is too early.
+    """
+    lo = int(network_block_index) + 1
+    return lo, lo + MAX_TOMBSTONE_BLOCKS
+
 
 class WalletAPIError(Exception):
     def __init__(self, response):
         self.response = response
 
+    @property
+    def server_error(self):
+        """ The name of the error from the wallet server, such as "InsufficientFunds". """
+        error = self.response.get('error', self.response)
+        return error.get('data', {}).get('server_error') or error.get('message') or str(self.response)
+
 
 class Client:
+    """
+    Client for the full-service wallet API.
 
-    def __init__(self, url=None, verbose=False):
-        if url is None:
-            url = DEFAULT_URL
+    Results are plain dicts as returned by the API. With typed=True, accounts,
+    addresses, balances, txos, transaction logs, gift codes and network status
+    are returned as compact models from mobilecoin.models instead, which parse
+    numeric fields once, on first use, and can be read like the dicts.
+
+    Requests pass through an AdaptiveLimiter from mobilecoin.limiter, which
+    adjusts how many may be in flight at once to what the server handles
+    without slowing down. Pass limiter=False to send requests unlimited, or a
+    shared AdaptiveLimiter for several clients of the same server.
+
+    Requests are sent by a transport from mobilecoin.transport, chosen from the
+    URL: "http://" URLs use HTTP with keep-alive, and "http+unix://" URLs, such
+    as "http+unix://%2Frun%2Fwallet.sock/wallet", use HTTP over a Unix socket.
+    Pass transport= to use another, such as an InProcessTransport which calls a
+    handler function directly. With gzip=True, large request bodies are
+    compressed, for servers or proxies which accept that.
+
+    A client is thread-safe: one instance can be shared by a pool of worker
+    threads. Each thread gets its own connection, the query counter is
+    updated under a lock, and the traces of verbose requests are printed whole.
+    Use "with client.quiet():" or "with client.verbosity(True):" to change
+    verbosity for the current thread or async task only; setting
+    client.verbose changes the default for all threads.
+    """
+
+    # Methods which read whole accounts, and wait behind other requests.
+    BACKGROUND_METHODS = {
+        'get_all_txos_for_account',
+        'get_all_transaction_logs_for_account',
+        'get_addresses_for_account',
+        'get_all_gift_codes',
+    }
+
+    def __init__(self, url=None, verbose=False, typed=False, limiter=True, transport=None, gzip=False):
+        if transport is None:
+            if url is None:
+                url = DEFAULT_URL
+            transport = transport_for_url(url, gzip)
+        elif url is None:
+            url = transport.url
         self.url = url
-        self.verbose = verbose
+        self.transport = transport
+        self._default_verbose = verbose
+        self.typed = typed
+        if limiter is True:
+            limiter = AdaptiveLimiter()
+        self.limiter = limiter or None
         self._query_count = 0
+        self._lock = threading.Lock()
 
-    def _req(self, request_data):
-        default_params = {
-            "jsonrpc": "2.0",
-            "api_version": "2",
-            "id": 1,
-        }
-        request_data = {**request_data, **default_params}
+    @property
+    def verbose(self):
+        override = _verbose.get()
+        return self._default_verbose if override is None else override
 
-        if self.verbose:
-            print('POST', self.url)
-            print(json.dumps(request_data, indent=2))
+    @verbose.setter
+    def verbose(self, value):
+        self._default_verbose = value
+
+    @contextmanager
+    def verbosity(self, verbose):
+        """ Set verbosity for requests made in the current thread or async task. """
+        token = _verbose.set(verbose)
+        try:
+            yield
+        finally:
+            _verbose.reset(token)
+
+    def quiet(self):
+        """ Silence verbose output for requests made in the current thread or async task. """
+        return self.verbosity(False)
+
+    @property
+    def query_count(self):
+        """ The number of successful requests made so far. """
+        return self._query_count
+
+    def _count_query(self):
+        with self._lock:
+            self._query_count += 1
+
+    def _trace(self, *items):
+        with _print_lock:
+            for item in items:
+                print(item)
             print()
 
+    def _post(self, request_data, stream=False):
+        """ Send a request through the concurrency limiter. """
+        if self.limiter is None:
+            return self._send(request_data, stream)
+
+        method = request_data['method']
+        default_priority = BACKGROUND if method in self.BACKGROUND_METHODS else NORMAL
+        self.limiter.acquire(current_priority(default_priority))
+        start = time.monotonic()
+        latency = None
+        error = False
         try:
-            r = requests.post(self.url, json=request_data)
-        except requests.ConnectionError:
-            raise ConnectionError(f'Could not connect to wallet server at {self.url}.')
+            r = self._send(request_data, stream)
+            latency = time.monotonic() - start
+            error = r.status_code >= 500
+            return r
+        finally:
+            # A server which is down tells the limiter nothing about its load.
+            # Latency is compared per method, since some are far slower than others.
+            self.limiter.release(latency, error, key=method)
+
+    def _send(self, request_data, stream=False):
+        return self.transport.post(request_data, stream)
+
+    def _req(self, request_data):
+        request_data = {**request_data, **JSONRPC_PARAMS}
+
+        if self.verbose:
+            self._trace('POST ' + self.url, json.dumps(request_data, indent=2))
+
+        r = self._post(request_data)
 
         try:
             response_data = r.json()
@@ -51,9 +197,10 @@ class Client:
             raise ValueError('API returned invalid JSON:', r.text)
 
         if self.verbose:
-            print(r.status_code, http.client.responses[r.status_code])
-            print(json.dumps(response_data, indent=2))
-            print()
+            self._trace(
+                '{} {}'.format(r.status_code, http.client.responses[r.status_code]),
+                json.dumps(response_data, indent=2),
+            )
 
         # Check for errors and unwrap result.
         try:
@@ -61,10 +208,53 @@ class Client:
         except KeyError:
             raise WalletAPIError(response_data)
 
-        self._query_count += 1
+        self._count_query()
 
         return result
 
+    def _req_stream(self, request_data, map_key):
+        """
+        Make a request whose result contains a large map, and yield its (key, value)
+        pairs as they are parsed, so only one record is held in memory at a time.
+        """
+        request_data = {**request_data, **JSONRPC_PARAMS}
+
+        if self.verbose:
+            self._trace('POST ' + self.url, json.dumps(request_data, indent=2))
+
+        # The limiter slot is held until the response headers arrive, by which
+        # time the server has done its work.
+        r = self._post(request_data, stream=True)
+
+        with r:
+            if self.verbose:
+                self._trace('{} {}'.format(r.status_code, http.client.responses[r.status_code]))
+            stream = JSONMapStream(r.iter_content(chunk_size=65536), ['result', map_key])
+            for key, value in stream:
+                if self.verbose:
+                    self._trace(json.dumps({key: value}, indent=2))
+                yield key, value
+
+        if not stream.found:
+            raise WalletAPIError(stream.other)
+
+        self._count_query()
+
+    def _model(self, model, data):
+        if self.typed:
+            return model.from_json(data)
+        return data
+
+    def _model_map(self, model, data):
+        if self.typed:
+            return model.from_json_map(data)
+        return data
+
+    def _model_stream(self, model, pairs):
+        if self.typed:
+            return ( (key, model.from_json(value)) for key, value in pairs )
+        return pairs
+
     def create_account(self, name=None):
         r = self._req({
             "method": "create_account",
@@ -72,7 +262,7 @@ class Client:
                 "name": name,
             }
         })
-        return r['account']
+        return self._model(Account, r['account'])
 
     def import_account(self, mnemonic, key_derivation_version=2, name=None, first_block_index=None, next_subaddress_index=None, fog_keys=None):
         params = {
@@ -92,7 +282,7 @@ class Client:
             "method": "import_account",
             "params": params
         })
-        return r['account']
+        return self._model(Account, r['account'])
 
     def import_account_from_legacy_root_entropy(self, legacy_root_entropy, name=None, first_block_index=None, next_subaddress_index=None, fog_keys=None):
         params = {
@@ -111,18 +301,18 @@ class Client:
             "method": "import_account_from_legacy_root_entropy",
             "params": params
         })
-        return r['account']
+        return self._model(Account, r['account'])
 
     def get_all_accounts(self):
         r = self._req({"method": "get_all_accounts"})
-        return r['account_map']
+        return self._model_map(Account, r['account_map'])
 
     def get_account(self, account_id):
         r = self._req({
             "method": "get_account",
             "params": {"account_id": account_id}
         })
-        return r['account']
+        return self._model(Account, r['account'])
 
     def update_account_name(self, account_id, name):
         r = self._req({
@@ -132,7 +322,7 @@ class Client:
                 "name": name,
             }
         })
-        return r['account']
+        return self._model(Account, r['account'])
 
     def remove_account(self, account_id):
         return self._req({
@@ -152,7 +342,14 @@ class Client:
             "method": "get_all_txos_for_account",
             "params": {"account_id": account_id}
         })
-        return r['txo_map']
+        return self._model_map(Txo, r['txo_map'])
+
+    def iter_txos_for_account(self, account_id):
+        """ Like get_all_txos_for_account, but yield (txo_id, txo) pairs as they are received. """
+        return self._model_stream(Txo, self._req_stream({
+            "method": "get_all_txos_for_account",
+            "params": {"account_id": account_id}
+        }, 'txo_map'))
 
     def get_txo(self, txo_id):
         r = self._req({
@@ -161,13 +358,13 @@ class Client:
                 "txo_id": txo_id,
             },
         })
-        return r['txo']
+        return self._model(Txo, r['txo'])
 
     def get_network_status(self):
         r = self._req({
             "method": "get_network_status",
         })
-        return r['network_status']
+        return self._model(NetworkStatus, r['network_status'])
 
     def get_balance_for_account(self, account_id):
         r = self._req({
@@ -176,7 +373,13 @@ class Client:
                 "account_id": account_id,
             }
         })
-        return r['balance']
+        return self._model(Balance, r['balance'])
+
+    def get_balances_for_accounts(self, account_ids, concurrency=DEFAULT_CONCURRENCY):
+        """ Get the balances of many accounts, with requests in parallel. Returns a dict by account id. """
+        account_ids = list(account_ids)
+        with ThreadPoolExecutor(concurrency) as executor:
+            return dict(zip(account_ids, executor.map(self.get_balance_for_account, account_ids)))
 
     def get_balance_for_address(self, address):
         r = self._req({
@@ -185,7 +388,7 @@ class Client:
                 "address": address,
             }
         })
-        return r['balance']
+        return self._model(Balance, r['balance'])
 
     def assign_address_for_account(self, account_id, metadata=None):
         if metadata is None:
@@ -198,7 +401,26 @@ class Client:
                 "metadata": metadata,
             },
         })
-        return r['address']
+        return self._model(Address, r['address'])
+
+    def assign_addresses_for_account(self, account_id, metadata_list, concurrency=DEFAULT_CONCURRENCY, on_assigned=None):
+        """
+        Assign one new address per metadata label, with requests in parallel. Returns addresses in order.
+
+        The on_assigned callback is given each address as soon as it is assigned,
+        even if other assignments fail, so the caller can record every address
+        the wallet now holds.
+        """
+        with ThreadPoolExecutor(concurrency) as executor:
+            futures = [
+                executor.submit(self.assign_address_for_account, account_id, metadata)
+                for metadata in metadata_list
+            ]
+            if on_assigned is not None:
+                for future in as_completed(futures):
+                    if future.exception() is None:
+                        on_assigned(future.result())
+            return [ future.result() for future in futures ]
 
     def get_addresses_for_account(self, account_id, offset=0, limit=1000):
         r = self._req({
@@ -209,20 +431,40 @@ class Client:
                 "limit": str(int(limit)),
             },
         })
-        return r['address_map']
+        return self._model_map(Address, r['address_map'])
 
-    def build_and_submit_transaction(self, account_id, amount, to_address):
+    def build_and_submit_transaction(self, account_id, amount, to_address, input_txo_ids=None):
         amount = str(mob2pmob(amount))
+        params = {
+            "account_id": account_id,
+            "addresses_and_values": [(to_address, amount)],
+        }
+        if input_txo_ids is not None:
+            params['input_txo_ids'] = input_txo_ids
         r = self._req({
             "method": "build_and_submit_transaction",
-            "params": {
-                "account_id": account_id,
-                "addresses_and_values": [(to_address, amount)],
-            }
+            "params": params,
         })
-        return r['transaction_log']
+        return self._model(TransactionLog, r['transaction_log'])
 
-    def build_transaction(self, account_id, amount, to_address, tombstone_block=None):
+    def build_and_submit_transaction_to_many(self, account_id, addresses_and_amounts, input_txo_ids=None):
+        """ Like build_and_submit_transaction, but paying several (address, amount) pairs at once. """
+        params = {
+            "account_id": account_id,
+            "addresses_and_values": [
+                (address, str(mob2pmob(amount)))
+                for address, amount in addresses_and_amounts
+            ],
+        }
+        if input_txo_ids is not None:
+            params['input_txo_ids'] = input_txo_ids
+        r = self._req({
+            "method": "build_and_submit_transaction",
+            "params": params,
+        })
+        return self._model(TransactionLog, r['transaction_log'])
+
+    def build_transaction(self, account_id, amount, to_address, tombstone_block=None, input_txo_ids=None):
         amount = str(mob2pmob(amount))
         params = {
             "account_id": account_id,
@@ -230,6 +472,8 @@ class Client:
         }
         if tombstone_block is not None:
             params['tombstone_block'] = str(int(tombstone_block))
+        if input_txo_ids is not None:
+            params['input_txo_ids'] = input_txo_ids
         r = self._req({
             "method": "build_transaction",
             "params": params,
@@ -244,7 +488,7 @@ class Client:
                 "account_id": account_id,
             },
         })
-        return r['transaction_log']
+        return self._model(TransactionLog, r['transaction_log'])
 
     def get_all_transaction_logs_for_account(self, account_id):
         r = self._req({
@@ -253,7 +497,34 @@ class Client:
                 "account_id": account_id,
             },
         })
-        return r['transaction_log_map']
+        return self._model_map(TransactionLog, r['transaction_log_map'])
+
+    def get_all_transaction_logs_for_block(self, block_index):
+        r = self._req({
+            "method": "get_all_transaction_logs_for_block",
+            "params": {
+                "block_index": str(block_index),
+            },
+        })
+        return self._model_map(TransactionLog, r['transaction_log_map'])
+
+    def get_transaction_log(self, transaction_log_id):
+        r = self._req({
+            "method": "get_transaction_log",
+            "params": {
+                "transaction_log_id": transaction_log_id,
+            },
+        })
+        return self._model(TransactionLog, r['transaction_log'])
+
+    def iter_transaction_logs_for_account(self, account_id):
+        """ Like get_all_transaction_logs_for_account, but yield (log_id, log) pairs as they are received. """
+        return self._model_stream(TransactionLog, self._req_stream({
+            "method": "get_all_transaction_logs_for_account",
+            "params": {
+                "account_id": account_id,
+            },
+        }, 'transaction_log_map'))
 
     def create_receiver_receipts(self, tx_proposal):
         r = self._req({
@@ -274,15 +545,55 @@ class Client:
         })
         return r
 
-    def build_gift_code(self, account_id, amount, memo=""):
+    def check_receiver_receipt_statuses(self, receipts, concurrency=DEFAULT_CONCURRENCY, wait=True, interval=1.0):
+        """
+        Check many (address, receipt) pairs, yielding an (index, response, error)
+        tuple for each pair once its status is final, or once the server has
+        rejected it.
+
+        All pairs are checked in parallel. While any are still TransactionPending,
+        the ledger is watched, and only the pending pairs are checked again each
+        time a new block arrives. With wait=False, pending pairs are yielded
+        after the first check instead.
+        """
+        def check(i):
+            try:
+                return self.check_receiver_receipt_status(*receipts[i]), None
+            except WalletAPIError as e:
+                return None, e.server_error
+
+        receipts = list(receipts)
+        pending = list(range(len(receipts)))
+        with ThreadPoolExecutor(concurrency) as executor:
+            while True:
+                block_index = int(self.get_network_status()['local_block_index'])
+                still_pending = []
+                for i, (response, error) in zip(pending, executor.map(check, pending)):
+                    if error is not None:
+                        yield i, None, error
+                    elif wait and response['receipt_transaction_status'] == 'TransactionPending':
+                        still_pending.append(i)
+                    else:
+                        yield i, response, None
+                pending = still_pending
+                if len(pending) == 0:
+                    return
+
+                while int(self.get_network_status()['local_block_index']) <= block_index:
+                    time.sleep(interval)
+
+    def build_gift_code(self, account_id, amount, memo="", input_txo_ids=None):
         amount = str(mob2pmob(amount))
+        params = {
+            "account_id": account_id,
+            "value_pmob": amount,
+            "memo": memo,
+        }
+        if input_txo_ids is not None:
+            params['input_txo_ids'] = input_txo_ids
         r = self._req({
             "method": "build_gift_code",
-            "params": {
-                "account_id": account_id,
-                "value_pmob": amount,
-                "memo": memo,
-            },
+            "params": params,
         })
         return r
 
@@ -295,7 +606,129 @@ class Client:
                 "from_account_id": account_id,
             },
         })
-        return r['gift_code']
+        return self._model(GiftCode, r['gift_code'])
+
+    def create_gift_codes(
+        self, account_id, amount, count, memo="", concurrency=DEFAULT_CONCURRENCY, seconds=60, on_submitted=None,
+    ):
+        """
+        Build and submit many gift codes of the same amount, yielding each
+        GiftCode once it has landed in the ledger and can be claimed.
+
+        Each round funds as many gift codes as it can from disjoint unspent txos,
+        and builds and submits them all in parallel. When the unspent txos run
+        out, the next round waits for the change from earlier rounds to land.
+
+        If the unspent txos can't fund every remaining code at once, because the
+        balance is held in a few large txos, a round of transfers to the account
+        itself first splits them into txos of one code each, up to MAX_OUTPUTS - 1
+        per transaction. Larger counts are split over several rounds, as a tree,
+        so the number of rounds grows with the logarithm of the count.
+
+        The on_submitted callback is given each GiftCode once it is submitted,
+        before it has landed. Submitted gift codes are kept by the wallet server,
+        so they can be found with get_all_gift_codes if the caller stops early.
+        """
+        value = mob2pmob(amount)
+        fee = int(self.get_network_status()['fee_pmob'])
+
+        def build(input_txo_ids):
+            return self.build_gift_code(account_id, amount, memo, input_txo_ids)
+
+        def submit(response):
+            return self.submit_gift_code(response['gift_code_b58'], response['tx_proposal'], account_id)
+
+        def is_available(gift_code):
+            response = self.check_gift_code_status(gift_code['gift_code_b58'])
+            return response['gift_code_status'] == 'GiftCodeAvailable'
+
+        remaining = count
+        pending = []  # (gift_code, block index when submitted)
+        with ThreadPoolExecutor(concurrency) as executor:
+            while True:
+                block_index = int(self.get_network_status()['network_block_index'])
+                if remaining > 0:
+                    txos = self.unspent_txos(account_id)
+                    groups = fund_amounts(txos, [value + fee] * remaining, MAX_INPUTS)
+                    # Every code costs the same, so none after the first unfunded one can be funded either.
+                    groups = groups[:groups.index(None)] if None in groups else groups
+                    if len(groups) < remaining:
+                        splits = _plan_gift_code_split(txos, value + fee, fee, remaining)
+                        if len(splits) > 0:
+                            self._split_txos(account_id, splits, concurrency, seconds=10 * seconds)
+                            continue
+                    if len(groups) == 0 and len(pending) == 0:
+                        raise Exception('Insufficient funds for {} more gift codes.'.format(remaining))
+                    for gift_code in executor.map(submit, executor.map(build, groups)):
+                        if on_submitted is not None:
+                            on_submitted(gift_code)
+                        pending.append((gift_code, block_index))
+                    remaining -= len(groups)
+                if len(pending) == 0:
+                    return
+
+                self.poll_balance(account_id, block_index + 1, seconds=seconds)
+                still_pending = []
+                for (gift_code, submitted_block), available in zip(
+                    pending,
+                    executor.map(is_available, [ gift_code for gift_code, _ in pending ]),
+                ):
+                    if available:
+                        yield gift_code
+                    elif block_index > submitted_block + MAX_TOMBSTONE_BLOCKS:
+                        raise Exception('Gift code {} never landed.'.format(gift_code['gift_code_b58']))
+                    else:
+                        still_pending.append((gift_code, submitted_block))
+                pending = still_pending
+
+    def _split_txos(self, account_id, splits, concurrency, seconds):
+        """ Split each txo into outputs of the given values, sent to the account itself, and wait for them to land. """
+        address = self.get_account(account_id)['main_address']
+
+        def split(txo_id, values):
+            return self.build_and_submit_transaction_to_many(
+                account_id,
+                [ (address, pmob2mob(v)) for v in values ],
+                input_txo_ids=[txo_id],
+            )
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            logs = list(executor.map(lambda s: split(*s), splits))
+        logs = self.poll_transaction_logs([ log['transaction_log_id'] for log in logs ], concurrency, seconds)
+        if any( log['status'] != 'tx_status_succeeded' for log in logs ):
+            raise Exception('Could not split txos to fund gift codes.')
+        self.poll_balance(account_id, max( int(log['finalized_block_index']) for log in logs ), seconds=seconds)
+
+    def unspent_txos(self, account_id, below_pmob=None):
+        """ List (value, txo_id) pairs for the unspent txos in an account, optionally only those below a value. """
+        return [ (value, txo_id) for value, txo_id, _ in self._iter_unspent_txos(account_id, below_pmob) ]
+
+    def unspent_txos_by_subaddress(self, account_id, below_pmob=None):
+        """ Like unspent_txos, but grouped into a {subaddress_index: [(value, txo_id)]} dict. """
+        result = {}
+        for value, txo_id, txo in self._iter_unspent_txos(account_id, below_pmob):
+            subaddress_index = txo.get('subaddress_index')
+            if subaddress_index is None:
+                continue  # Not received at any of the account's subaddresses.
+            result.setdefault(int(subaddress_index), []).append((value, txo_id))
+        return result
+
+    def _iter_unspent_txos(self, account_id, below_pmob):
+        for txo_id, txo in self.iter_txos_for_account(account_id):
+            if txo_status(txo, account_id) != 'txo_status_unspent':
+                continue
+            value = int(txo['value_pmob'])
+            if below_pmob is None or value < below_pmob:
+                yield value, txo_id, txo
+
+    def txo_ids_by_key_image(self, account_id, key_images):
+        """ Look up an account's txos by key image, such as the inputs of a transaction proposal. Returns a {key_image: txo_id} dict. """
+        key_images = set(key_images)
+        return {
+            txo.get('key_image'): txo_id
+            for txo_id, txo in self.iter_txos_for_account(account_id)
+            if txo.get('key_image') in key_images
+        }
 
     def get_gift_code(self, gift_code_b58):
         r = self._req({
@@ -304,7 +737,7 @@ class Client:
                 "gift_code_b58": gift_code_b58,
             },
         })
-        return r['gift_code']
+        return self._model(GiftCode, r['gift_code'])
 
     def check_gift_code_status(self, gift_code_b58):
         r = self._req({
@@ -319,7 +752,7 @@ class Client:
         r = self._req({
             "method": "get_all_gift_codes",
         })
-        return r['gift_codes']
+        return [ self._model(GiftCode, gift_code) for gift_code in r['gift_codes'] ]
 
     def claim_gift_code(self, account_id, gift_code_b58):
         r = self._req({
@@ -331,6 +764,66 @@ class Client:
         })
         return r['txo_id']
 
+    def check_gift_code_statuses(self, gift_codes_b58, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Check the status of many gift codes, with requests in parallel. Returns a
+        (response, error) tuple for each code, in order, so that one bad code
+        doesn't stop the others from being checked.
+        """
+        def check(gift_code_b58):
+            try:
+                return self.check_gift_code_status(gift_code_b58), None
+            except WalletAPIError as e:
+                return None, e.server_error
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(check, gift_codes_b58))
+
+    def claim_gift_codes(self, account_id, gift_codes_b58, concurrency=DEFAULT_CONCURRENCY, seconds=60):
+        """
+        Claim many gift codes into one account, yielding a (gift_code_b58, txo_id, error)
+        tuple for each code as its claim lands, or fails.
+
+        Claims are sent with bounded parallelism. Then once per second, each
+        claimed txo which hasn't landed yet is looked up, in parallel, until the
+        wallet has them all. Codes whose txo hasn't arrived within the time
+        limit are yielded with the error "GiftCodeClaimNotLanded".
+        """
+        def claim(gift_code_b58):
+            try:
+                return self.claim_gift_code(account_id, gift_code_b58), None
+            except WalletAPIError as e:
+                return None, e.server_error
+
+        def landed(txo_id):
+            try:
+                self.get_txo(txo_id)
+            except WalletAPIError:
+                # The wallet hasn't scanned the claim's block yet.
+                return False
+            return True
+
+        waiting = {}
+        with ThreadPoolExecutor(concurrency) as executor:
+            for gift_code_b58, (txo_id, error) in zip(gift_codes_b58, executor.map(claim, gift_codes_b58)):
+                if error is not None:
+                    yield gift_code_b58, None, error
+                else:
+                    waiting[txo_id] = gift_code_b58
+
+            for _ in range(seconds):
+                if len(waiting) == 0:
+                    return
+                pending = list(waiting)
+                for txo_id, is_landed in zip(pending, executor.map(landed, pending)):
+                    if is_landed:
+                        yield waiting.pop(txo_id), txo_id, None
+                if len(waiting) > 0:
+                    time.sleep(1.0)
+
+        for txo_id, gift_code_b58 in waiting.items():
+            yield gift_code_b58, txo_id, 'GiftCodeClaimNotLanded'
+
     def remove_gift_code(self, gift_code_b58):
         r = self._req({
             "method": "remove_gift_code",
@@ -342,6 +835,36 @@ class Client:
 
     # Utility methods.
 
+    def wait_for_server(self, timeout=120):
+        """ Wait with backoff until the wallet server answers, and return its network status. """
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while True:
+            try:
+                return self.get_network_status()
+            except ConnectionError:
+                if time.monotonic() + delay > deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def poll_ledger_sync(self, interval=1.0, timeout=None):
+        """
+        Yield the network status at intervals, until the local ledger has caught up with the network.
+        Raises TimeoutError if it has not caught up after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            network_status = self.get_network_status()
+            yield network_status
+            local_block = int(network_status['local_block_index'])
+            network_block = int(network_status['network_block_index'])
+            if network_block > 0 and local_block >= network_block:
+                return
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise TimeoutError('The ledger did not sync within {} seconds.'.format(timeout))
+            time.sleep(interval)
+
     def poll_balance(self, account_id, min_block_index=None, seconds=10):
         for _ in range(seconds):
             balance = self.get_balance_for_account(account_id)
@@ -355,6 +878,24 @@ class Client:
         else:
             raise Exception('Could not sync account {}'.format(account_id))
 
+    def poll_transaction_logs(self, transaction_log_ids, concurrency=DEFAULT_CONCURRENCY, seconds=600):
+        """
+        Wait until each transaction log has succeeded or failed, and return the
+        final logs in order. Only the logs still pending are fetched again.
+        """
+        logs = {}
+        with ThreadPoolExecutor(concurrency) as executor:
+            for _ in range(seconds):
+                pending = [ log_id for log_id in transaction_log_ids if log_id not in logs ]
+                for log_id, log in zip(pending, executor.map(self.get_transaction_log, pending)):
+                    if log['status'] in ('tx_status_succeeded', 'tx_status_failed'):
+                        logs[log_id] = log
+                if len(logs) == len(set(transaction_log_ids)):
+                    return [ logs[log_id] for log_id in transaction_log_ids ]
+                time.sleep(1.0)
+            else:
+                raise Exception('{} transactions never finished.'.format(len(set(transaction_log_ids)) - len(logs)))
+
     def poll_gift_code_status(self, gift_code_b58, target_status, seconds=10):
         for _ in range(seconds):
             response = self.check_gift_code_status(gift_code_b58)
@@ -373,3 +914,205 @@ class Client:
             time.sleep(1)
         else:
             raise Exception('Txo {} never landed.'.format(txo_id))
+
+
+def _plan_gift_code_split(txos, needed, fee, count):
+    """
+    Choose txos to split into txos worth the needed amount each, for up to count
+    gift codes. Returns (txo_id, output values) pairs, one per transaction.
+
+    A txo which can fund more codes than a transaction has outputs is split
+    into parts which are each split again in a later round, so each part holds
+    enough for the fees of its own splits too. Txos which can fund only one
+    code are left alone.
+    """
+    splits = []
+    for value, txo_id in sorted(txos, reverse=True):
+        if count < 2:
+            break
+        n = _max_split(value, needed, fee, count)
+        if n < 2:
+            break
+        splits.append((txo_id, [ _split_cost(part, needed, fee) for part in _divide(n, MAX_OUTPUTS - 1) ]))
+        count -= n
+    return splits
+
+
+def _max_split(value, needed, fee, limit):
+    """ The most codes, up to limit, which one txo of this value can be split into. """
+    lo, hi = 0, min(limit, value // needed)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if _split_cost(mid, needed, fee) <= value:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _split_cost(n, needed, fee):
+    """ The value of a txo which can be split into n txos of the needed amount, paying every fee on the way. """
+    if n <= 1:
+        return needed * n
+    return fee + sum( _split_cost(part, needed, fee) for part in _divide(n, MAX_OUTPUTS - 1) )
+
+
+def _divide(n, k):
+    """ Divide n into at most k parts, as evenly as possible. """
+    k = min(n, k)
+    return [ n // k + (1 if i < n % k else 0) for i in range(k) ]
+
+
+class ShardedClient(Client):
+    """
+    Client for a wallet split across several full-service instances.
+
+    Requests are routed to the shard which owns the account they refer to.
+    Requests for the whole wallet are sent to every shard and the results
+    merged, so callers can use this exactly like a single Client.
+    """
+
+    # Methods which create a new account on the least loaded shard.
+    CREATE_METHODS = {
+        'create_account',
+        'import_account',
+        'import_account_from_legacy_root_entropy',
+    }
+
+    # Methods which return results for the whole wallet.
+    MERGE_METHODS = {
+        'get_all_accounts',
+        'get_all_gift_codes',
+    }
+
+    # Methods which do not depend on wallet contents, so any shard can answer.
+    ANY_SHARD_METHODS = {
+        'get_network_status',
+        'check_gift_code_status',
+        'submit_transaction',
+        'create_receiver_receipts',
+    }
+
+    def __init__(self, urls, verbose=False, typed=False, limiter=True, gzip=False):
+        super().__init__(url=urls[0], verbose=verbose, typed=typed, limiter=False, gzip=gzip)
+        # Each shard is a separate server, with its own limit.
+        self.shards = [ Client(url=url, verbose=verbose, limiter=limiter, gzip=gzip) for url in urls ]
+        self._account_shards = {}
+        # Accounts on each shard, loaded from the account lists once, then kept up
+        # to date locally as accounts are placed and removed.
+        self._shard_counts = None
+        # Accounts being created on each shard, which don't show in its account list yet.
+        self._placing = { id(shard): 0 for shard in self.shards }
+        self._placement_lock = threading.Lock()
+
+    def _req(self, request_data):
+        method = request_data['method']
+        params = request_data.get('params', {})
+        account_id = params.get('account_id') or params.get('from_account_id')
+
+        if method in self.MERGE_METHODS:
+            result = self._req_all(request_data)
+        elif method in self.CREATE_METHODS:
+            result = self._req_create(request_data)
+        elif account_id is not None:
+            result = self._shard_for_account(account_id)._req(request_data)
+            if method == 'remove_account':
+                with self._placement_lock:
+                    shard = self._account_shards.pop(account_id, None)
+                    if shard is not None and self._shard_counts is not None:
+                        self._shard_counts[id(shard)] -= 1
+        elif method in self.ANY_SHARD_METHODS:
+            result = self.shards[0]._req(request_data)
+        else:
+            result = self._req_first(request_data)
+
+        self._count_query()
+        return result
+
+    def _req_stream(self, request_data, map_key):
+        shard = self._shard_for_account(request_data['params']['account_id'])
+        yield from shard._req_stream(request_data, map_key)
+        self._count_query()
+
+    def _req_all(self, request_data):
+        """ Send a request to every shard, and merge the results. """
+        account_shards = {}
+        merged = {}
+        for shard in self.shards:
+            result = shard._req(request_data)
+            if 'account_map' in result:
+                for account_id in result['account_map']:
+                    account_shards[account_id] = shard
+            for key, value in result.items():
+                if isinstance(value, list):
+                    merged.setdefault(key, []).extend(value)
+                elif isinstance(value, dict):
+                    merged.setdefault(key, {}).update(value)
+                else:
+                    merged[key] = value
+        # Swap in the new account map whole, so other threads never see it half built.
+        if request_data['method'] == 'get_all_accounts':
+            counts = { id(shard): 0 for shard in self.shards }
+            for shard in account_shards.values():
+                counts[id(shard)] += 1
+            with self._placement_lock:
+                self._account_shards = account_shards
+                self._shard_counts = counts
+        return merged
+
+    def _req_first(self, request_data):
+        """ Try each shard in turn, returning the first successful result. """
+        for shard in self.shards:
+            try:
+                return shard._req(request_data)
+            except WalletAPIError as e:
+                error = e
+        raise error
+
+    def _shard_for_account(self, account_id):
+        if account_id not in self._account_shards:
+            self.get_all_accounts()
+        # Unknown accounts go to the first shard, which reports the error.
+        return self._account_shards.get(account_id, self.shards[0])
+
+    def _req_create(self, request_data):
+        """
+        Create or import an account on the least loaded shard.
+
+        Placement is serialised, and counts the accounts still being created, so
+        concurrent imports spread across the shards. An imported account's id
+        is only known once a shard has imported it, so if another shard turns
+        out to hold it already, the new copy is removed, and the existing
+        account is returned instead.
+        """
+        if self._shard_counts is None:
+            self.get_all_accounts()
+        with self._placement_lock:
+            shard = self._least_loaded_shard()
+            self._placing[id(shard)] += 1
+        try:
+            result = shard._req(request_data)
+        finally:
+            with self._placement_lock:
+                self._placing[id(shard)] -= 1
+
+        account_id = result['account']['account_id']
+        with self._placement_lock:
+            owner = self._account_shards.get(account_id)
+            if owner is None:
+                self._account_shards[account_id] = shard
+                self._shard_counts[id(shard)] += 1
+            if owner is None or owner is shard:
+                return result
+        shard._req({
+            "method": "remove_account",
+            "params": {"account_id": account_id},
+        })
+        return owner._req({
+            "method": "get_account",
+            "params": {"account_id": account_id},
+        })
+
+    def _least_loaded_shard(self):
+        # Called with the placement lock held.
+        return min(self.shards, key=lambda shard: self._shard_counts[id(shard)] + self._placing[id(shard)])
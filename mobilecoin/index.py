@@ -0,0 +1,302 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+from pathlib import Path
+
+from .client import DEFAULT_CONCURRENCY
+from .utility import try_int, txo_status
+
+
+TxoRecord = namedtuple('TxoRecord', ['status', 'subaddress_index', 'value', 'received_block_index'])
+
+
+class TxoIndex:
+    """
+    In-memory index of the txos belonging to one account.
+
+    The index is built in one pass over a txo map from get_all_txos_for_account,
+    keyed by status and subaddress index, and sorted by value. Queries only
+    touch the txos which can match, so they stay fast on very large accounts.
+    """
+
+    def __init__(self, account_id, txo_map=None):
+        self.account_id = account_id
+        self.records = {}
+        self.by_status = defaultdict(set)
+        self.by_subaddress = defaultdict(set)
+        self.by_value = []
+        if txo_map is not None:
+            self.update(txo_map)
+
+    def __len__(self):
+        return len(self.records)
+
+    def update(self, txos):
+        """
+        Bring the index up to date with a fresh txo map, or an iterable of
+        (txo_id, txo) pairs covering every txo in the account.
+
+        Only txos which were added, removed, or changed are re-indexed. Returns a
+        list of (txo_id, old_record, new_record) for each change, where a missing
+        record is None.
+        """
+        if isinstance(txos, dict):
+            txos = txos.items()
+
+        changes = []
+        seen = set()
+        for txo_id, txo in txos:
+            seen.add(txo_id)
+            record = self._record(txo)
+            old_record = self.records.get(txo_id)
+            if record != old_record:
+                changes.append((txo_id, old_record, record))
+        for txo_id, old_record in self.records.items():
+            if txo_id not in seen:
+                changes.append((txo_id, old_record, None))
+        self._apply(changes)
+        return changes
+
+    def patch(self, txos):
+        """
+        Bring some txos in the index up to date, leaving the others alone.
+
+        Takes (txo_id, txo) pairs, where a txo which is missing (None) or belongs
+        to other accounts is removed. Returns the changes, as update() does.
+        """
+        changes = []
+        for txo_id, txo in txos:
+            record = None
+            if txo is not None and self.account_id in txo['account_status_map']:
+                record = self._record(txo)
+            old_record = self.records.get(txo_id)
+            if record != old_record:
+                changes.append((txo_id, old_record, record))
+        self._apply(changes)
+        return changes
+
+    def _apply(self, changes):
+        # Patching the sorted value list costs O(n) per change, so re-sort it
+        # instead when much of the account changed, such as on the first update.
+        resort = len(changes) > len(self.records) // 8
+        for txo_id, old_record, record in changes:
+            if old_record is not None:
+                self._remove(txo_id, old_record, resort)
+            if record is not None:
+                self._add(txo_id, record, resort)
+        if resort:
+            self.by_value = sorted( (r.value, txo_id) for txo_id, r in self.records.items() )
+
+    def query(self, status=None, subaddress_index=None, min_value=None, max_value=None, sort=None):
+        """
+        List the ids of txos matching all of the given filters.
+
+        Values are in picoMOB, and the range is inclusive. Results may be sorted
+        by 'value' or 'block', or in reverse order with '-value' or '-block'.
+        """
+        sets = []
+        if status is not None:
+            sets.append(self.by_status.get(status, set()))
+        if subaddress_index is not None:
+            sets.append(self.by_subaddress.get(subaddress_index, set()))
+
+        sets.sort(key=len)
+        if min_value is not None or max_value is not None or sort in ('value', '-value'):
+            lo = 0 if min_value is None else bisect_left(self.by_value, (min_value,))
+            hi = len(self.by_value) if max_value is None else bisect_right(self.by_value, (max_value, chr(0x10ffff)))
+            if sets and len(sets[0]) < hi - lo:
+                # The smallest set is cheaper to scan than the value range.
+                lo_value = -1 if min_value is None else min_value
+                hi_value = float('inf') if max_value is None else max_value
+                txo_ids = sorted(
+                    (
+                        txo_id for txo_id in sets[0].intersection(*sets[1:])
+                        if lo_value <= self.records[txo_id].value <= hi_value
+                    ),
+                    key=lambda txo_id: (self.records[txo_id].value, txo_id),
+                )
+            else:
+                # Walk the value range in order, checking the other filters by set membership.
+                txo_ids = [
+                    txo_id for _, txo_id in self.by_value[lo:hi]
+                    if all( txo_id in s for s in sets )
+                ]
+            if sort == '-value':
+                txo_ids.reverse()
+        elif sets:
+            txo_ids = sets[0].intersection(*sets[1:])
+        else:
+            txo_ids = self.records.keys()
+
+        if sort in ('block', '-block'):
+            return sorted(
+                txo_ids,
+                key=lambda txo_id: self.records[txo_id].received_block_index or 0,
+                reverse=(sort == '-block'),
+            )
+        return list(txo_ids)
+
+    def aggregate(self, txo_ids):
+        """ Count, total, minimum and maximum value in picoMOB of the given txos. """
+        values = [ self.records[txo_id].value for txo_id in txo_ids ]
+        return {
+            'count': len(values),
+            'total_pmob': sum(values),
+            'min_pmob': min(values, default=None),
+            'max_pmob': max(values, default=None),
+        }
+
+    def _record(self, txo):
+        return TxoRecord(
+            txo_status(txo, self.account_id),
+            try_int(txo['subaddress_index']),
+            int(txo['value_pmob']),
+            try_int(txo['received_block_index']),
+        )
+
+    def _add(self, txo_id, record, resort):
+        self.records[txo_id] = record
+        self.by_status[record.status].add(txo_id)
+        self.by_subaddress[record.subaddress_index].add(txo_id)
+        if not resort:
+            insort(self.by_value, (record.value, txo_id))
+
+    def _remove(self, txo_id, record, resort):
+        del self.records[txo_id]
+        self.by_status[record.status].discard(txo_id)
+        self.by_subaddress[record.subaddress_index].discard(txo_id)
+        if not resort:
+            i = bisect_left(self.by_value, (record.value, txo_id))
+            del self.by_value[i]
+
+
+AddressRecord = namedtuple('AddressRecord', ['account_id', 'subaddress_index', 'metadata'])
+
+
+class AddressIndex:
+    """
+    Local index of assigned addresses, for reverse lookups.
+
+    Maps each public address to its (account_id, subaddress_index, metadata), and
+    each metadata label to the addresses carrying it, so finding which account and
+    invoice a payment address belongs to is a dict lookup instead of paging
+    through get_addresses_for_account. The index is saved to a JSON file.
+
+    Calling refresh() brings in addresses assigned elsewhere, across every
+    account in the wallet. It remembers how far each account has been read, and
+    only fetches addresses beyond that.
+    """
+
+    PAGE_SIZE = 1000
+
+    def __init__(self, path=None):
+        self.path = path
+        self.by_address = {}
+        self.by_metadata = defaultdict(list)
+        self.scanned = {}
+        if path is not None and Path(path).exists():
+            self.load()
+
+    def __len__(self):
+        return len(self.by_address)
+
+    def add(self, address):
+        """ Index an address object from the API. """
+        record = AddressRecord(
+            address['account_id'],
+            int(address['subaddress_index']),
+            address['metadata'],
+        )
+        public_address = address['public_address']
+        old_record = self.by_address.get(public_address)
+        if old_record == record:
+            return
+        if old_record is not None:
+            self.by_metadata[old_record.metadata].remove(public_address)
+        self.by_address[public_address] = record
+        self.by_metadata[record.metadata].append(public_address)
+
+    def remove_account(self, account_id):
+        """ Drop every address of an account, such as one which was deleted. """
+        for public_address, record in list(self.by_address.items()):
+            if record.account_id == account_id:
+                del self.by_address[public_address]
+                self.by_metadata[record.metadata].remove(public_address)
+        self.scanned.pop(account_id, None)
+
+    def refresh(self, client, accounts=None, concurrency=DEFAULT_CONCURRENCY):
+        """
+        Index the addresses of all accounts which were assigned since the last refresh.
+
+        Accounts are read in parallel, and accounts whose next subaddress index
+        shows nothing new are not read at all. Addresses of accounts no longer in
+        the wallet are dropped. Returns the number of addresses added.
+        """
+        if accounts is None:
+            accounts = client.get_all_accounts()
+
+        # Drop accounts which left the wallet, including addresses which were
+        # add()ed directly and never scanned.
+        for public_address, record in list(self.by_address.items()):
+            if record.account_id not in accounts:
+                del self.by_address[public_address]
+                self.by_metadata[record.metadata].remove(public_address)
+        for account_id in list(self.scanned):
+            if account_id not in accounts:
+                del self.scanned[account_id]
+
+        stale = [
+            account_id for account_id, account in accounts.items()
+            if try_int(account.get('next_subaddress_index')) is None
+            or self.scanned.get(account_id, 0) < int(account['next_subaddress_index'])
+        ]
+
+        def fetch(account_id):
+            offset = self.scanned.get(account_id, 0)
+            addresses = []
+            while True:
+                page = client.get_addresses_for_account(account_id, offset=offset, limit=self.PAGE_SIZE)
+                addresses.extend(page.values())
+                offset += len(page)
+                if len(page) < self.PAGE_SIZE:
+                    return account_id, offset, addresses
+
+        count = 0
+        with ThreadPoolExecutor(concurrency) as executor:
+            for account_id, offset, addresses in executor.map(fetch, stale):
+                for address in addresses:
+                    self.add(address)
+                self.scanned[account_id] = offset
+                count += len(addresses)
+        return count
+
+    def lookup(self, public_address):
+        """ Return the AddressRecord for a public address, or None. """
+        return self.by_address.get(public_address)
+
+    def lookup_metadata(self, metadata):
+        """ Return the public addresses labelled with this metadata. """
+        return list(self.by_metadata.get(metadata, []))
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        for public_address, (account_id, subaddress_index, metadata) in data['addresses'].items():
+            record = AddressRecord(account_id, subaddress_index, metadata)
+            self.by_address[public_address] = record
+            self.by_metadata[metadata].append(public_address)
+        self.scanned = data.get('scanned', {})
+
+    def save(self):
+        """ Write the index to its file, atomically replacing the old version. """
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with tmp_path.open('w') as f:
+            json.dump({
+                'addresses': { a: list(record) for a, record in self.by_address.items() },
+                'scanned': self.scanned,
+            }, f)
+        os.replace(tmp_path, path)
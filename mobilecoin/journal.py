@@ -0,0 +1,349 @@
+from concurrent.futures import ThreadPoolExecutor
+import fcntl
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+from .client import DEFAULT_CONCURRENCY, MAX_INPUTS, WalletAPIError, tombstone_window
+from .utility import fund_amounts, pmob2mob, try_int, txo_status
+
+
+# Payment states. Each change of state is written to the journal before the
+# step it leads to, so after a crash the journal shows how far each payment got.
+PLANNED = 'planned'        # Recorded, with no transaction built.
+BUILT = 'built'            # Transaction built and saved, but never sent.
+SUBMITTING = 'submitting'  # Transaction may have been sent.
+SUBMITTED = 'submitted'    # Accepted by the wallet server, waiting to finalize.
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'          # Not paid, and nothing in flight, so safe to retry.
+UNKNOWN = 'unknown'        # The inputs were spent, by a transaction which may or may not be this one.
+
+FINAL_STATES = (SUCCEEDED, FAILED, UNKNOWN)
+
+
+def payment_id(account_id, to_address, amount_pmob, n=0):
+    """
+    Derive an id for a payment from its details. Use n to tell apart identical
+    payments in the same batch, such as by counting earlier ones.
+    """
+    key = json.dumps([account_id, to_address, int(amount_pmob), n])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+class PayoutJournal:
+    """
+    Write-ahead journal of payments, which makes a payout safe to interrupt and
+    run again without paying anyone twice.
+
+    The journal is a JSON lines file, with one line for each change to a
+    payment, synced to disk before the change is acted on. Use it as a context
+    manager, which locks the journal against other processes and loads it.
+
+    A payment whose transaction may have been sent is never rebuilt. Its saved
+    transaction is resubmitted, which at worst fails because its inputs are
+    already spent, and it is reconciled against the account's transaction logs.
+    Only once its tombstone block has passed, with its inputs unspent, is a new
+    transaction built for it.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._lock_file = None
+        self._on_change = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock_file = open(self.path.with_name(self.path.name + '.lock'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise RuntimeError('The payout journal {} is in use by another process.'.format(self.path))
+        self.load()
+        self._compact()
+        self._file = self.path.open('a')
+        return self
+
+    def __exit__(self, *args):
+        self._file.close()
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+
+    def load(self):
+        self.entries = {}
+        if not self.path.exists():
+            return
+        with self.path.open() as f:
+            lines = f.readlines()
+        for i, line in enumerate(lines):
+            try:
+                change = json.loads(line)
+            except ValueError:
+                # Only the last line can be cut short, by a crash while writing it.
+                if i == len(lines) - 1:
+                    break
+                raise
+            self.entries.setdefault(change['id'], {}).update(change)
+
+    def _compact(self):
+        """ Rewrite the journal with one line per payment. """
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with tmp_path.open('w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _record(self, entry_id, sync=True, **changes):
+        """ Apply changes to an entry, and append them to the journal. """
+        with self._lock:
+            entry = self.entries.setdefault(entry_id, {'id': entry_id})
+            entry.update(changes)
+            self._file.write(json.dumps({'id': entry_id, **changes}) + '\n')
+            if sync:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            if self._on_change is not None:
+                self._on_change(entry)
+        return entry
+
+    def sync(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def add(self, entry_id, account_id, to_address, amount_pmob):
+        """
+        Record a payment to make, unless it is already in the journal. Returns
+        its entry. Call sync() after adding, or run(), which syncs first.
+        """
+        entry = self.entries.get(entry_id)
+        if entry is not None:
+            if (entry['account_id'], entry['to_address'], entry['amount_pmob']) != (account_id, to_address, int(amount_pmob)):
+                raise ValueError('Payment {} is already in the journal, with different details.'.format(entry_id))
+            return entry
+        return self._record(
+            entry_id,
+            sync=False,
+            account_id=account_id,
+            to_address=to_address,
+            amount_pmob=int(amount_pmob),
+            state=PLANNED,
+            added_time=time.time(),
+            tx_proposal=None,
+            input_txo_ids=None,
+            tombstone_block=None,
+            transaction_log_id=None,
+            finalized_block_index=None,
+            error=None,
+        )
+
+    def pending(self):
+        return [ e for e in self.entries.values() if e['state'] not in FINAL_STATES ]
+
+    def run(self, client, concurrency=DEFAULT_CONCURRENCY, interval=1.0, retry_failed=False, on_change=None):
+        """
+        Make every payment which is not yet finished, and wait for each to
+        succeed or fail. Transactions are built and submitted in parallel, each
+        from its own inputs, so they cannot conflict with each other.
+
+        With retry_failed=True, failed payments are tried again. The on_change
+        callback is given each entry whose state changed, from any thread.
+        """
+        if retry_failed:
+            for entry in self.entries.values():
+                if entry['state'] == FAILED:
+                    self._record(
+                        entry['id'],
+                        sync=False,
+                        state=PLANNED,
+                        tx_proposal=None,
+                        input_txo_ids=None,
+                        tombstone_block=None,
+                        transaction_log_id=None,
+                        error=None,
+                    )
+        self.sync()
+
+        self._on_change = on_change
+        try:
+            fee = int(client.get_network_status()['fee_pmob'])
+            last_block_index = None
+            with ThreadPoolExecutor(concurrency) as executor:
+                while len(self.pending()) > 0:
+                    block_index = int(client.get_network_status()['network_block_index'])
+                    if block_index != last_block_index:
+                        last_block_index = block_index
+                        accounts = { e['account_id'] for e in self.pending() }
+                        for account_id in sorted(accounts):
+                            self._step(client, executor, account_id, block_index, fee)
+                    if len(self.pending()) > 0:
+                        time.sleep(interval)
+        finally:
+            self._on_change = None
+
+    def _step(self, client, executor, account_id, block_index, fee):
+        entries = [ e for e in self.pending() if e['account_id'] == account_id ]
+        txos = dict(client.iter_txos_for_account(account_id))
+        logs = {}
+        if any( e['state'] in (SUBMITTING, SUBMITTED) for e in entries ):
+            logs = dict(client.iter_transaction_logs_for_account(account_id))
+        scanned_block_index = int(client.get_balance_for_account(account_id)['account_block_index'])
+        lo, hi = tombstone_window(block_index)
+
+        to_submit = []
+        for entry in entries:
+            if entry['state'] in (SUBMITTING, SUBMITTED):
+                entry = self._reconcile(entry, txos, logs, scanned_block_index)
+            if entry['state'] in (BUILT, SUBMITTING):
+                if entry['tombstone_block'] > lo:
+                    to_submit.append(entry)
+                elif entry['state'] == BUILT:
+                    # It was never sent, so it is safe to build again.
+                    self._record(entry['id'], sync=False, state=PLANNED, tx_proposal=None, input_txo_ids=None)
+
+        # Fund new transactions from unspent txos not held by saved ones.
+        reserved = {
+            txo_id
+            for e in self.pending() if e['input_txo_ids'] is not None
+            for txo_id in e['input_txo_ids']
+        }
+        unspent = [
+            (int(txo['value_pmob']), txo_id)
+            for txo_id, txo in txos.items()
+            if txo_id not in reserved and txo_status(txo, account_id) == 'txo_status_unspent'
+        ]
+        # Fund the largest payments first, while the largest txos are left.
+        planned = sorted(
+            ( e for e in self.pending() if e['account_id'] == account_id and e['state'] == PLANNED ),
+            key=lambda e: e['amount_pmob'],
+            reverse=True,
+        )
+        groups = fund_amounts(unspent, [ e['amount_pmob'] + fee for e in planned ], MAX_INPUTS)
+        to_build = [ (e, group) for e, group in zip(planned, groups) if group is not None ]
+        in_flight = any( e['state'] in (BUILT, SUBMITTING, SUBMITTED) for e in self.pending() if e['account_id'] == account_id )
+        if len(to_build) == 0 and not in_flight:
+            # No change is on its way, so the rest can't be funded.
+            for e in planned:
+                self._record(e['id'], state=FAILED, error='InsufficientFunds')
+
+        def build_and_submit(item):
+            entry, group = item
+            try:
+                tx_proposal = client.build_transaction(
+                    entry['account_id'], pmob2mob(entry['amount_pmob']), entry['to_address'], input_txo_ids=group)
+            except WalletAPIError as e:
+                self._record(entry['id'], state=FAILED, error=e.server_error)
+                return
+            entry = self._record(
+                entry['id'],
+                state=BUILT,
+                tx_proposal=tx_proposal,
+                input_txo_ids=group,
+                tombstone_block=int(tx_proposal['tx']['prefix']['tombstone_block']),
+            )
+            self._submit(client, entry)
+
+        list(executor.map(lambda entry: self._submit(client, entry), to_submit))
+        list(executor.map(build_and_submit, to_build))
+
+    def _submit(self, client, entry):
+        if entry['state'] == BUILT:
+            entry = self._record(entry['id'], state=SUBMITTING)
+        try:
+            transaction_log = client.submit_transaction(entry['tx_proposal'], entry['account_id'])
+        except WalletAPIError as e:
+            # The transaction may have been sent before, so the error settles
+            # nothing; the next reconciliation does.
+            self._record(entry['id'], error=e.server_error)
+            return
+        self._record(entry['id'], state=SUBMITTED, transaction_log_id=transaction_log['transaction_log_id'], error=None)
+
+    def _reconcile(self, entry, txos, logs, scanned_block_index):
+        """ Settle the state of a payment whose transaction may have been sent. """
+        log = logs.get(entry['transaction_log_id'])
+        if log is None:
+            log = _find_log(entry, logs)
+            if log is not None and not _pays(log, entry):
+                if not _is_other_transaction(log, entry):
+                    # The log doesn't show the payment as expected, but may
+                    # still be it, so building it again could pay twice.
+                    return self._record(
+                        entry['id'], state=UNKNOWN, error='Inputs spent by a transaction which does not match the payment')
+                if log['status'] != 'tx_status_succeeded':
+                    return entry
+                # Another transaction spent the inputs, so this one can never land.
+                return self._record(entry['id'], state=PLANNED, tx_proposal=None, input_txo_ids=None, tombstone_block=None)
+
+        if log is not None:
+            if log['status'] == 'tx_status_succeeded':
+                return self._record(
+                    entry['id'],
+                    state=SUCCEEDED,
+                    transaction_log_id=log['transaction_log_id'],
+                    finalized_block_index=log.get('finalized_block_index'),
+                    error=None,
+                )
+            if log['status'] != 'tx_status_failed':
+                if entry['state'] != SUBMITTED:
+                    entry = self._record(entry['id'], state=SUBMITTED, transaction_log_id=log['transaction_log_id'])
+                return entry
+
+        # Wait until the wallet has scanned every block the transaction could be in.
+        if scanned_block_index < entry['tombstone_block']:
+            return entry
+
+        spent = [
+            txo_id for txo_id in entry['input_txo_ids']
+            if txo_id in txos and txo_status(txos[txo_id], entry['account_id']) != 'txo_status_unspent'
+        ]
+        if len(spent) > 0:
+            return self._record(entry['id'], state=UNKNOWN, error='Inputs spent by an unlogged transaction')
+        if entry['error'] is not None:
+            # The server rejected the transaction, and it has expired, so it was never paid.
+            return self._record(entry['id'], state=FAILED)
+        return self._record(
+            entry['id'],
+            state=PLANNED,
+            tx_proposal=None,
+            input_txo_ids=None,
+            tombstone_block=None,
+            transaction_log_id=None,
+        )
+
+
+def _find_log(entry, logs):
+    """ Find a sent transaction log which spends any of a payment's inputs. """
+    input_txo_ids = set(entry['input_txo_ids'])
+    for log in logs.values():
+        if log['direction'] != 'tx_direction_sent' or log['status'] == 'tx_status_failed':
+            continue
+        if any( txo['txo_id_hex'] in input_txo_ids for txo in log['input_txos'] ):
+            return log
+    return None
+
+
+def _pays(log, entry):
+    return any(
+        txo['recipient_address_id'] == entry['to_address'] and int(txo['value_pmob']) == entry['amount_pmob']
+        for txo in log['output_txos']
+    )
+
+
+def _is_other_transaction(log, entry):
+    """
+    Whether a log which spends some of a payment's inputs is certainly not its
+    transaction. A transaction's inputs and value are fixed when it is built, so
+    a different set of inputs, or a different value, proves it.
+    """
+    if { txo['txo_id_hex'] for txo in log['input_txos'] } != set(entry['input_txo_ids']):
+        return True
+    value = try_int(log.get('value_pmob'))
+    return value is not None and value != entry['amount_pmob']
@@ -0,0 +1,148 @@
+import codecs
+import json
+
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_START = '-0123456789'
+_NUMBER_END = _WHITESPACE + ',]}'
+
+_decoder = json.JSONDecoder()
+
+
+class JSONMapStream:
+    """
+    Incrementally parse a JSON document, yielding the (key, value) pairs of the
+    object found at a path of keys, such as ['result', 'txo_map'].
+
+    The document is read from an iterable of bytes or str chunks, and only one
+    value of the target object is held in memory at a time. Other values inside
+    the path are skipped element by element, so a large sibling like a list of
+    ids does not need to fit in memory either. Top-level values not on the path,
+    such as an error response, are kept in `other`.
+    """
+
+    def __init__(self, chunks, path):
+        self.reader = _Reader(chunks)
+        self.path = path
+        self.found = False
+        self.other = {}
+
+    def __iter__(self):
+        return self._walk(self.path, top_level=True)
+
+    def _walk(self, path, top_level=False):
+        for key in self.reader.iter_object():
+            if key != path[0]:
+                if top_level:
+                    self.other[key] = self.reader.value()
+                else:
+                    self.reader.skip()
+            elif len(path) > 1:
+                yield from self._walk(path[1:])
+            else:
+                self.found = True
+                for item_key in self.reader.iter_object():
+                    yield item_key, self.reader.value()
+
+
+class _Reader:
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """
+        Append the next chunk to the buffer, returning False at the end of the input.
+
+        The consumed part of the buffer is dropped, so the current position moves to 0.
+        """
+        for chunk in self.chunks:
+            if isinstance(chunk, bytes):
+                chunk = self.decoder.decode(chunk)
+            if chunk:
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.decoder.decode(b'', final=True)
+        self.eof = True
+        return False
+
+    def peek(self):
+        """ Return the next non-whitespace character, without consuming it. """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON input.')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected {!r} at {!r} in JSON input.'.format(char, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def value(self):
+        """ Decode one complete value. """
+        # A number is only complete once the character after it has arrived.
+        if self.peek() in _NUMBER_START:
+            while (
+                not any( self.buf.find(c, self.pos) >= 0 for c in _NUMBER_END )
+                and self.fill()
+            ):
+                pass
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            self.pos = end
+            return value
+
+    def skip(self):
+        """ Consume one value, one element at a time for objects and arrays. """
+        char = self.peek()
+        if char == '{':
+            for _ in self.iter_object():
+                self.skip()
+        elif char == '[':
+            for _ in self.iter_array():
+                self.skip()
+        else:
+            self.value()
+
+    def iter_object(self):
+        """ Yield each key of an object, after which the caller must consume its value. """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect('}')
+                return
+
+    def iter_array(self):
+        """ Yield once per element of an array, after which the caller must consume the element. """
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ',':
+                self.pos += 1
+            else:
+                self.expect(']')
+                return
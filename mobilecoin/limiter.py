@@ -0,0 +1,212 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+import heapq
+import itertools
+import threading
+import time
+
+
+# Request priorities, lowest first. Waiting requests are let through in priority order.
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+_priority = ContextVar('mobilecoin_request_priority', default=None)
+
+
+@contextmanager
+def priority(level):
+    """
+    Run the requests made inside this block at a priority level, overriding the
+    default for each method. Like other context variables, the priority does
+    not carry over into threads started inside the block.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default=NORMAL):
+    level = _priority.get()
+    return default if level is None else level
+
+
+class AdaptiveLimiter:
+    """
+    Adaptive limit on the number of requests in flight to one server.
+
+    The limit follows additive increase, multiplicative decrease (AIMD). Each
+    request which completes at close to the best latency seen raises the limit
+    by about one per round of requests. A request which fails, or takes more
+    than latency_tolerance times the baseline latency, cuts the limit by the
+    backoff factor, at most once per round. Throughput settles just below what
+    the server can handle without queueing.
+
+    The baseline is the lowest latency seen in the last one to two periods of
+    baseline_window seconds. Some requests are much slower than others, so a
+    baseline is kept for each key, such as the method name, and latencies are
+    only compared with the baseline for their own key.
+
+    Requests beyond the limit wait, and are let through in priority order, so
+    interactive requests go ahead of queued background scans. Threads and
+    asyncio tasks wait in the same queue.
+    """
+
+    def __init__(
+        self, initial_limit=4, min_limit=1, max_limit=64, latency_tolerance=2.0, backoff=0.7, baseline_window=30.0,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.baseline_window = baseline_window
+        self.in_flight = 0
+        self._baselines = {}  # key: [window start, lowest in window, lowest in previous window]
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._since_decrease = 0
+
+    def acquire(self, priority=NORMAL):
+        """ Block until a request at this priority may be sent. """
+        with self._cond:
+            waiter = self._enqueue(priority, self._cond.notify_all)
+            try:
+                while not waiter.granted:
+                    self._cond.wait()
+            except BaseException:
+                self._cancel(waiter)
+                raise
+
+    def release(self, latency=None, error=False, key=None):
+        """
+        Record the end of a request, with its latency in seconds, and adjust the
+        limit. A request with neither a latency nor an error, such as one which
+        never reached the server, frees its slot but leaves the limit alone.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None or error:
+                self._adjust(latency, error, key)
+            self._grant()
+
+    def _adjust(self, latency, error, key):
+        self._since_decrease += 1
+        overloaded = error
+        if latency is not None:
+            if latency > self.latency_tolerance * self._update_baseline(key, latency):
+                overloaded = True
+
+        if overloaded:
+            # Requests already in flight at the last decrease would see the same
+            # overload, so only cut the limit again after a full round.
+            if self._since_decrease >= self.limit:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._since_decrease = 0
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def baseline_latency(self, key=None):
+        """ The lowest recent latency for a key, or None if there is none yet. """
+        with self._cond:
+            window = self._baselines.get(key)
+            return None if window is None else min(window[1], window[2])
+
+    def _update_baseline(self, key, latency):
+        # Keep the lowest latency of the current window and the one before, so
+        # the baseline follows a server which has become slower for good, but
+        # is never dragged up by requests queueing under load.
+        now = time.monotonic()
+        window = self._baselines.get(key)
+        if window is None or now - window[0] >= 2 * self.baseline_window:
+            window = self._baselines[key] = [now, latency, latency]
+        elif now - window[0] >= self.baseline_window:
+            window[:] = [now, latency, window[1]]
+        else:
+            window[1] = min(window[1], latency)
+        return min(window[1], window[2])
+
+    def _enqueue(self, priority, wake):
+        waiter = _Waiter(priority, next(self._sequence), wake)
+        heapq.heappush(self._waiters, waiter)
+        self._grant()
+        return waiter
+
+    def _grant(self):
+        """ Let waiters through in priority order while there is room under the limit. """
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = heapq.heappop(self._waiters)
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.wake()
+
+    def _cancel(self, waiter):
+        """ Withdraw a waiter which gave up, handing on its slot if it was just granted one. """
+        if waiter.granted:
+            self.in_flight -= 1
+        else:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+        self._grant()
+
+    @contextmanager
+    def slot(self, priority=NORMAL, key=None):
+        """ Hold a request slot for the duration of the block, timing it. """
+        self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            self.release(error=True, key=key)
+            raise
+        else:
+            self.release(time.monotonic() - start, key=key)
+
+    async def acquire_async(self, priority=NORMAL):
+        """ Wait for a request slot without blocking the event loop. """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def set_granted():
+            if not granted.done():
+                granted.set_result(None)
+
+        with self._cond:
+            waiter = self._enqueue(priority, lambda: loop.call_soon_threadsafe(set_granted))
+        try:
+            await granted
+        except BaseException:
+            # Cancelled while waiting, so the slot must not be left taken.
+            with self._cond:
+                self._cancel(waiter)
+            raise
+
+    @asynccontextmanager
+    async def slot_async(self, priority=NORMAL, key=None):
+        await self.acquire_async(priority)
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException:
+            self.release(error=True, key=key)
+            raise
+        else:
+            self.release(time.monotonic() - start, key=key)
+
+
+class _Waiter:
+    """ A request waiting for a slot, ordered by priority, then arrival. """
+
+    def __init__(self, priority, sequence, wake):
+        self.priority = priority
+        self.sequence = sequence
+        self.wake = wake
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
@@ -0,0 +1,232 @@
+from abc import ABCMeta
+from collections.abc import Mapping
+
+
+class _IntField:
+    """
+    A numeric field, which the API sends as a string.
+
+    The string is kept as received, and parsed the first time the field is read.
+    The parsed int then replaces it, so each field is parsed at most once.
+    """
+
+    def __init__(self, slot_name):
+        self.slot_name = slot_name
+
+    def __set_name__(self, owner, name):
+        self.slot = getattr(owner, self.slot_name)
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = self.slot.__get__(obj, owner)
+        if value.__class__ is str:
+            value = int(value)
+            self.slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        self.slot.__set__(obj, value)
+
+
+class _ModelType(ABCMeta):
+    """ Give each model a slot per field, instead of a per-instance dict. """
+
+    def __new__(mcs, name, bases, namespace):
+        fields = namespace.get('FIELDS', ())
+        int_fields = namespace.get('INT_FIELDS', ())
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + fields + tuple( '_' + field for field in int_fields )
+        for field in int_fields:
+            namespace[field] = _IntField('_' + field)
+        cls = super().__new__(mcs, name, bases, namespace)
+        cls._KNOWN = frozenset(fields + int_fields)
+        return cls
+
+
+class Model(Mapping, metaclass=_ModelType):
+    """
+    Compact typed record for an API object.
+
+    Models keep the fields listed in FIELDS and INT_FIELDS as attributes. Fields in
+    INT_FIELDS are parsed to int lazily, on first access. Fields missing from the
+    API response are None. Any other fields in the response are kept aside.
+
+    Models are read-only mappings, so code written for plain dict results, using
+    item access, get() or items(), also works with them. Items are the same as
+    the attributes, so numbers are ints, and int() on them costs nothing.
+    """
+
+    __slots__ = ('_extra',)
+
+    FIELDS = ()
+    INT_FIELDS = ()
+
+    @classmethod
+    def from_json(cls, data):
+        obj = cls.__new__(cls)
+        for field in cls.FIELDS:
+            setattr(obj, field, data.get(field))
+        for field in cls.INT_FIELDS:
+            setattr(obj, '_' + field, data.get(field))
+        extra = None
+        if len(data) > len(cls._KNOWN) or not cls._KNOWN.issuperset(data):
+            extra = { key: value for key, value in data.items() if key not in cls._KNOWN }
+        obj._extra = extra or None
+        return obj
+
+    @classmethod
+    def from_json_map(cls, data):
+        return { key: cls.from_json(value) for key, value in data.items() }
+
+    def to_json(self):
+        """ Convert back to the API's representation, with numbers as strings. """
+        data = { field: getattr(self, field) for field in self.FIELDS }
+        for field in self.INT_FIELDS:
+            value = getattr(self, '_' + field)
+            data[field] = None if value is None else str(value)
+        if self._extra is not None:
+            data.update(self._extra)
+        return data
+
+    def __getitem__(self, field):
+        if field in self._KNOWN:
+            return getattr(self, field)
+        elif self._extra is not None:
+            return self._extra[field]
+        else:
+            raise KeyError(field)
+
+    def __iter__(self):
+        yield from self.FIELDS
+        yield from self.INT_FIELDS
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return len(self._KNOWN) + (0 if self._extra is None else len(self._extra))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_json() == other.to_json()
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.to_json())
+
+
+class Account(Model):
+    FIELDS = (
+        'object',
+        'account_id',
+        'name',
+        'main_address',
+        'recovery_mode',
+    )
+    INT_FIELDS = (
+        'first_block_index',
+        'next_subaddress_index',
+    )
+
+
+class Address(Model):
+    FIELDS = (
+        'object',
+        'public_address',
+        'account_id',
+        'metadata',
+    )
+    INT_FIELDS = (
+        'subaddress_index',
+        'offset_count',
+    )
+
+
+class Balance(Model):
+    FIELDS = (
+        'object',
+        'is_synced',
+    )
+    INT_FIELDS = (
+        'unspent_pmob',
+        'pending_pmob',
+        'spent_pmob',
+        'secreted_pmob',
+        'orphaned_pmob',
+        'network_block_index',
+        'local_block_index',
+        'account_block_index',
+    )
+
+
+class Txo(Model):
+    FIELDS = (
+        'object',
+        'txo_id_hex',
+        'account_status_map',
+        'assigned_address',
+        'recipient_address_id',
+        'key_image',
+        'public_key',
+        'target_key',
+        'e_fog_hint',
+        'confirmation',
+    )
+    INT_FIELDS = (
+        'value_pmob',
+        'subaddress_index',
+        'received_block_index',
+        'spent_block_index',
+    )
+
+    def status(self, account_id):
+        """ The status of this txo for one account, e.g. "txo_status_unspent". """
+        return self.account_status_map[account_id]['txo_status']
+
+
+class TransactionLog(Model):
+    FIELDS = (
+        'object',
+        'transaction_log_id',
+        'account_id',
+        'direction',
+        'status',
+        'assigned_address_id',
+        'recipient_address_id',
+        'input_txos',
+        'output_txos',
+        'change_txos',
+        'sent_time',
+        'comment',
+        'failure_code',
+        'failure_message',
+    )
+    INT_FIELDS = (
+        'value_pmob',
+        'fee_pmob',
+        'submitted_block_index',
+        'finalized_block_index',
+    )
+
+
+class GiftCode(Model):
+    FIELDS = (
+        'object',
+        'gift_code_b58',
+        'entropy',
+        'memo',
+        'account_id',
+        'txo_id_hex',
+    )
+    INT_FIELDS = (
+        'value_pmob',
+    )
+
+
+class NetworkStatus(Model):
+    FIELDS = (
+        'object',
+    )
+    INT_FIELDS = (
+        'network_block_index',
+        'local_block_index',
+        'fee_pmob',
+        'block_version',
+    )
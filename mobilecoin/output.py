@@ -0,0 +1,101 @@
+import abc
+from contextlib import contextmanager
+import csv
+import json
+import sys
+
+
+FORMATS = ['text', 'json', 'ndjson', 'csv']
+
+BUFFER_SIZE = 1 << 16
+
+
+@contextmanager
+def record_writer(format, stream=None):
+    """
+    Write records, which are flat dicts, to a stream as they are produced.
+
+    Output goes through one large buffer instead of a write per line, and
+    nothing is collected in memory, so huge outputs start flowing straight
+    away. The default stream is stdout.
+    """
+    own_stream = stream is None
+    if own_stream:
+        sys.stdout.flush()
+        # The wrapper leaves stdout's file descriptor open when it is closed.
+        stream = open(sys.stdout.fileno(), 'w', buffering=BUFFER_SIZE, closefd=False)
+    try:
+        writer = {
+            'json': JSONWriter,
+            'ndjson': NDJSONWriter,
+            'csv': CSVWriter,
+        }[format](stream)
+        try:
+            yield writer
+        finally:
+            writer.close()
+            stream.flush()
+    finally:
+        if own_stream:
+            stream.close()
+
+
+class RecordWriter(abc.ABC):
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    @abc.abstractmethod
+    def write(self, record):
+        pass
+
+    def flush(self):
+        """ Push out buffered records, for output which is watched live. """
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class NDJSONWriter(RecordWriter):
+    """ One JSON object per line. """
+
+    def write(self, record):
+        self.stream.write(json.dumps(record))
+        self.stream.write('\n')
+
+
+class JSONWriter(RecordWriter):
+    """ A JSON array of objects, written one element at a time. """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.separator = '[\n'
+
+    def write(self, record):
+        self.stream.write(self.separator)
+        self.stream.write(json.dumps(record))
+        self.separator = ',\n'
+
+    def close(self):
+        if self.separator == '[\n':
+            self.stream.write('[]\n')
+        else:
+            self.stream.write('\n]\n')
+
+
+class CSVWriter(RecordWriter):
+    """ CSV with a header row taken from the fields of the first record. """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.stream, fieldnames=list(record.keys()), extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow({
+            key: json.dumps(value) if isinstance(value, (list, dict)) else value
+            for key, value in record.items()
+        })
@@ -0,0 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+from pathlib import Path
+import time
+
+from .client import DEFAULT_CONCURRENCY, WalletAPIError, tombstone_window
+from .utility import txo_status
+
+
+# Entry states. An entry is marked "submitting" in the state file before its
+# proposal is sent, so a run which was interrupted part way can tell which
+# proposals may already have reached the network.
+QUEUED = 'queued'
+SUBMITTING = 'submitting'
+SUBMITTED = 'submitted'
+EXPIRED = 'expired'
+FAILED = 'failed'
+# A proposal which may have been sent, and expired, but whose outcome the
+# wallet can't settle, such as one whose inputs were spent by an unknown transaction.
+UNKNOWN = 'unknown'
+
+
+class TransactionQueue:
+    """
+    Durable local queue of built transaction proposals, each submitted once the
+    network will accept its tombstone block, and before that block passes.
+
+    The queue lives in a JSON state file. Every change happens under an
+    exclusive lock on a neighbouring lock file and is written atomically, so
+    several processes can add to the queue while another one runs it.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+
+    @contextmanager
+    def transaction(self):
+        """ Lock the state file, load it, and save it again on exit. """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_name(self.path.name + '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.load()
+                yield self
+                self.save()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self):
+        if self.path.exists():
+            with self.path.open() as f:
+                self.entries = json.load(f)['entries']
+        else:
+            self.entries = {}
+
+    def save(self):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with tmp_path.open('w') as f:
+            json.dump({'entries': self.entries}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def add(self, tx_proposal, account_id=None, input_txo_ids=None):
+        """
+        Add a proposal, returning its entry id. The id is derived from the
+        proposal itself, so adding the same proposal twice has no effect.
+
+        The ids of the proposal's input txos, if known, are kept to match the
+        proposal against the account's transaction logs later. Otherwise they
+        are looked up by the inputs' key images when needed.
+        """
+        entry_id = hashlib.sha256(json.dumps(tx_proposal, sort_keys=True).encode()).hexdigest()[:16]
+        if entry_id not in self.entries:
+            self.entries[entry_id] = {
+                'id': entry_id,
+                'account_id': account_id,
+                'input_txo_ids': None if input_txo_ids is None else list(input_txo_ids),
+                'tombstone_block': int(tx_proposal['tx']['prefix']['tombstone_block']),
+                'value_pmob': sum( int(outlay['value']) for outlay in tx_proposal['outlay_list'] ),
+                'state': QUEUED,
+                'added_time': time.time(),
+                'submitted_block': None,
+                'error': None,
+                'tx_proposal': tx_proposal,
+            }
+        return entry_id
+
+    def waiting(self):
+        """ Entries which have not yet been submitted, or may not have been. """
+        return [ e for e in self.entries.values() if e['state'] in (QUEUED, SUBMITTING) ]
+
+    def run(self, client, interval=1.0, forever=False, on_change=None):
+        """
+        Submit each proposal once its tombstone window opens.
+
+        A single network status watcher drives the whole queue, and the state
+        file is only read when the network block index changes. Runs until no
+        entries are waiting, or indefinitely with forever=True. The on_change
+        callback is given each entry whose state changed.
+        """
+        last_block_index = None
+        while True:
+            block_index = int(client.get_network_status()['network_block_index'])
+            if block_index != last_block_index:
+                last_block_index = block_index
+                num_waiting = self._step(client, block_index, on_change)
+                if num_waiting == 0 and not forever:
+                    return
+            time.sleep(interval)
+
+    def _step(self, client, block_index, on_change):
+        lo, hi = tombstone_window(block_index)
+        changed = []
+        with self.transaction():
+            due = []
+            expired = []
+            for entry in self.waiting():
+                if entry['tombstone_block'] <= lo:
+                    if entry['state'] == QUEUED:
+                        entry['state'] = EXPIRED
+                        changed.append(entry)
+                    else:
+                        # It may have been sent before expiring, so look for it first.
+                        expired.append(entry)
+                elif entry['tombstone_block'] <= hi:
+                    due.append(entry)
+            due.sort(key=lambda e: e['tombstone_block'])
+            # Entries left "submitting" by an interrupted run are sent again; a
+            # duplicate is recognized by its spent key images below.
+            retried = { e['id'] for e in due if e['state'] == SUBMITTING }
+            for entry in due:
+                entry['state'] = SUBMITTING
+
+        def submit(entry):
+            try:
+                client.submit_transaction(entry['tx_proposal'], entry['account_id'])
+                return SUBMITTED, None
+            except ConnectionError:
+                # It may or may not have been sent, so try again at the next block.
+                return SUBMITTING, None
+            except WalletAPIError as e:
+                if entry['id'] in retried and e.server_error == 'KeyImageAlreadySpent':
+                    return _resubmit_outcome(client, entry, block_index)
+                return FAILED, e.server_error
+
+        with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+            results = list(executor.map(submit, due))
+            outcomes = list(executor.map(lambda entry: _outcome(client, entry), expired))
+
+        with self.transaction():
+            for entry, (state, error) in zip(due, results):
+                # The entry may have been cleared from the queue meanwhile.
+                entry = self.entries.get(entry['id'])
+                if entry is None or state == SUBMITTING:
+                    continue
+                entry['state'] = state
+                entry['error'] = error
+                if state == SUBMITTED:
+                    entry['submitted_block'] = block_index
+                changed.append(entry)
+            for entry, (state, error) in zip(expired, outcomes):
+                entry = self.entries.get(entry['id'])
+                if entry is None or entry['state'] != SUBMITTING or state == SUBMITTING:
+                    continue
+                entry['state'] = state
+                entry['error'] = error
+                changed.append(entry)
+            num_waiting = len(self.waiting())
+
+        if on_change is not None:
+            for entry in changed:
+                on_change(entry)
+        return num_waiting
+
+
+def input_key_images(tx_proposal):
+    """ The key images of a proposal's inputs, which identify the txos it spends. """
+    return [ txo['key_image'] for txo in tx_proposal['input_list'] ]
+
+
+def _resubmit_outcome(client, entry, block_index):
+    """
+    Settle a proposal from an interrupted run whose inputs were already spent
+    when it was sent again, returning its (state, error). The state is SUBMITTED
+    only if the account's logs show this proposal succeeded, and SUBMITTING to
+    check again while the wallet has not yet scanned up to the current block.
+    """
+    account_id = entry['account_id']
+    if account_id is None:
+        return UNKNOWN, 'No account to look up the transaction in'
+    try:
+        balance = client.get_balance_for_account(account_id)
+        if int(balance['account_block_index']) < block_index:
+            return SUBMITTING, None
+        input_txo_ids = _input_txo_ids(client, entry)
+        if input_txo_ids is None:
+            return UNKNOWN, 'Inputs not found in the account'
+        if _spent_by_proposal(client, account_id, input_txo_ids):
+            return SUBMITTED, None
+    except ConnectionError:
+        return SUBMITTING, None
+    except WalletAPIError as e:
+        return UNKNOWN, e.server_error
+    return FAILED, 'Inputs spent by another transaction'
+
+
+def _outcome(client, entry):
+    """
+    Settle a proposal which expired while it may have been sent, returning its
+    (state, error). The state is SUBMITTED if a transaction spending exactly its
+    inputs succeeded, EXPIRED if its inputs are still unspent, UNKNOWN if
+    neither can be shown, or SUBMITTING to check again once the wallet has
+    scanned every block the transaction could be in.
+    """
+    account_id = entry['account_id']
+    if account_id is None:
+        return UNKNOWN, 'No account to look up the transaction in'
+    try:
+        balance = client.get_balance_for_account(account_id)
+        if int(balance['account_block_index']) < entry['tombstone_block']:
+            return SUBMITTING, None
+        input_txo_ids = _input_txo_ids(client, entry)
+        if input_txo_ids is None:
+            return UNKNOWN, 'Inputs not found in the account'
+        if _spent_by_proposal(client, account_id, input_txo_ids):
+            return SUBMITTED, None
+        statuses = [ txo_status(client.get_txo(txo_id), account_id) for txo_id in input_txo_ids ]
+    except ConnectionError:
+        return SUBMITTING, None
+    except WalletAPIError as e:
+        return UNKNOWN, e.server_error
+    if all( status == 'txo_status_unspent' for status in statuses ):
+        return EXPIRED, None
+    return UNKNOWN, 'Inputs spent by an unlogged transaction'
+
+
+def _input_txo_ids(client, entry):
+    """ The ids of a proposal's input txos, as stored when it was added, or looked up by key image. """
+    if entry.get('input_txo_ids'):
+        return set(entry['input_txo_ids'])
+    key_images = [ txo.get('key_image') for txo in entry['tx_proposal'].get('input_list', []) ]
+    if not key_images or None in key_images:
+        return None
+    txo_ids = client.txo_ids_by_key_image(entry['account_id'], key_images)
+    if len(txo_ids) != len(set(key_images)):
+        return None
+    return set(txo_ids.values())
+
+
+def _spent_by_proposal(client, account_id, input_txo_ids):
+    """ Whether a succeeded transaction in the account's logs spent exactly these txos. """
+    for _, log in client.iter_transaction_logs_for_account(account_id):
+        if (
+            log['status'] == 'tx_status_succeeded'
+            and { txo['txo_id_hex'] for txo in log['input_txos'] } == input_txo_ids
+        ):
+            return True
+    return False
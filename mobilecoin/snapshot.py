@@ -0,0 +1,258 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+import struct
+import time
+import zlib
+
+
+SNAPSHOT_FORMAT = 'mobilecoin-ledger-snapshot'
+SNAPSHOT_VERSION = 1
+
+MAGIC = b'MCLEDGER'
+
+# The trailer at the very end of a snapshot: the manifest's offset and length,
+# the sha256 of the manifest, and the magic bytes again.
+TRAILER = struct.Struct('>QQ32s8s')
+
+CHUNK_SIZE = 16 * 1024 * 1024
+
+COMPRESS_LEVEL = 3
+
+# LMDB recreates its lock file, and it must not be copied from a live database.
+SKIP_FILES = {'lock.mdb'}
+
+DEFAULT_THREADS = os.cpu_count() or 4
+
+
+def create_snapshot(ledger_dir, path, chunk_size=CHUNK_SIZE, threads=DEFAULT_THREADS, progress=None):
+    """
+    Write a compressed snapshot of the files in a ledger database directory.
+
+    Each file is split into chunks, which are compressed in parallel and
+    written in order. A JSON manifest at the end of the snapshot lists each
+    file, and the offset, size and sha256 of each of its chunks. The snapshot
+    is written to a temporary file and moved into place once complete.
+
+    The wallet server must not be running, or the copy may be inconsistent.
+    The progress callback is given the number of bytes read so far, and the
+    total. Returns the manifest.
+    """
+    ledger_dir = Path(ledger_dir)
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+
+    files = sorted(
+        p for p in ledger_dir.iterdir()
+        if p.is_file() and p.name not in SKIP_FILES
+    )
+    if len(files) == 0:
+        raise ValueError('There is no ledger database in {}.'.format(ledger_dir))
+    total = sum( p.stat().st_size for p in files )
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'chunk_size': chunk_size,
+        'compression': 'zlib',
+        'files': [],
+    }
+    done = 0
+    try:
+        with tmp_path.open('wb') as out, ThreadPoolExecutor(threads) as executor:
+            out.write(MAGIC)
+            offset = len(MAGIC)
+            for file_path in files:
+                size = file_path.stat().st_size
+                fd = os.open(file_path, os.O_RDONLY)
+                try:
+                    chunks = []
+                    for data, raw_size, digest in _ordered(executor, _compress_chunk, [
+                        (fd, start, min(chunk_size, size - start))
+                        for start in range(0, size, chunk_size)
+                    ], window=2 * threads):
+                        out.write(data)
+                        chunks.append({
+                            'offset': offset,
+                            'length': len(data),
+                            'size': raw_size,
+                            'sha256': digest,
+                        })
+                        offset += len(data)
+                        done += raw_size
+                        if progress is not None:
+                            progress(done, total)
+                finally:
+                    os.close(fd)
+                manifest['files'].append({
+                    'name': file_path.name,
+                    'size': size,
+                    'mode': file_path.stat().st_mode & 0o777,
+                    'chunks': chunks,
+                })
+
+            manifest_data = json.dumps(manifest).encode()
+            out.write(manifest_data)
+            out.write(TRAILER.pack(offset, len(manifest_data), hashlib.sha256(manifest_data).digest(), MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return manifest
+
+
+def read_manifest(path):
+    """ Read and check the manifest of a snapshot. """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a ledger snapshot.'.format(path))
+        f.seek(0, os.SEEK_END)
+        if f.tell() < len(MAGIC) + TRAILER.size:
+            raise ValueError('The ledger snapshot {} is truncated.'.format(path))
+        f.seek(-TRAILER.size, os.SEEK_END)
+        offset, length, digest, magic = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != MAGIC:
+            raise ValueError('The ledger snapshot {} is truncated.'.format(path))
+        f.seek(offset)
+        manifest_data = f.read(length)
+    if hashlib.sha256(manifest_data).digest() != digest:
+        raise ValueError('The manifest of ledger snapshot {} is corrupt.'.format(path))
+    manifest = json.loads(manifest_data)
+    if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError('{} is not a supported ledger snapshot.'.format(path))
+    return manifest
+
+
+def restore_snapshot(path, ledger_dir, threads=DEFAULT_THREADS, progress=None, replace=False):
+    """
+    Restore a ledger database directory from a snapshot.
+
+    Chunks are read, checked against their sha256 and decompressed in parallel,
+    and written straight to their place in each file. The files go into a
+    temporary directory, which replaces the ledger directory only once every
+    chunk has been verified, so a corrupt snapshot leaves the ledger as it was.
+    An existing, non-empty ledger directory is only replaced with replace=True.
+    """
+    ledger_dir = Path(ledger_dir)
+    if ledger_dir.exists() and any(ledger_dir.iterdir()) and not replace:
+        raise FileExistsError('The ledger directory {} is not empty.'.format(ledger_dir))
+
+    manifest = read_manifest(path)
+    tmp_dir = ledger_dir.with_name(ledger_dir.name + '.restoring')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    try:
+        _extract(path, manifest, tmp_dir, threads, progress)
+        if ledger_dir.exists():
+            old_dir = ledger_dir.with_name(ledger_dir.name + '.old')
+            if old_dir.exists():
+                shutil.rmtree(old_dir)
+            os.rename(ledger_dir, old_dir)
+            os.rename(tmp_dir, ledger_dir)
+            shutil.rmtree(old_dir)
+        else:
+            os.rename(tmp_dir, ledger_dir)
+        _fsync_dir(ledger_dir.parent)
+    except BaseException:
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        raise
+    return manifest
+
+
+def verify_snapshot(path, threads=DEFAULT_THREADS, progress=None):
+    """ Check every chunk of a snapshot against its sha256, without writing anything. """
+    manifest = read_manifest(path)
+    _extract(path, manifest, None, threads, progress)
+    return manifest
+
+
+def _extract(path, manifest, out_dir, threads, progress):
+    total = sum( f['size'] for f in manifest['files'] )
+    done = 0
+    fd = os.open(path, os.O_RDONLY)
+    out_fds = []
+    try:
+        jobs = []
+        for file_info in manifest['files']:
+            out_fd = None
+            if out_dir is not None:
+                name = Path(file_info['name']).name
+                out_fd = os.open(out_dir / name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, file_info['mode'])
+                out_fds.append(out_fd)
+                os.ftruncate(out_fd, file_info['size'])
+            position = 0
+            for chunk in file_info['chunks']:
+                jobs.append((fd, chunk, out_fd, position))
+                position += chunk['size']
+            if position != file_info['size']:
+                raise ValueError('The manifest of ledger snapshot {} is inconsistent.'.format(path))
+
+        with ThreadPoolExecutor(threads) as executor:
+            for raw_size in _ordered(executor, _extract_chunk, jobs, window=2 * threads):
+                done += raw_size
+                if progress is not None:
+                    progress(done, total)
+
+        for out_fd in out_fds:
+            os.fsync(out_fd)
+    finally:
+        os.close(fd)
+        for out_fd in out_fds:
+            os.close(out_fd)
+
+
+def _compress_chunk(fd, start, size):
+    data = os.pread(fd, size, start)
+    if len(data) != size:
+        raise ValueError('A ledger file changed size while being read. Is the wallet server running?')
+    return zlib.compress(data, COMPRESS_LEVEL), size, hashlib.sha256(data).hexdigest()
+
+
+def _extract_chunk(fd, chunk, out_fd, position):
+    data = os.pread(fd, chunk['length'], chunk['offset'])
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        data = None
+    if data is None or len(data) != chunk['size'] or hashlib.sha256(data).hexdigest() != chunk['sha256']:
+        raise ValueError('The ledger snapshot is corrupt, at offset {}.'.format(chunk['offset']))
+    if out_fd is not None:
+        view = memoryview(data)
+        while len(view) > 0:
+            written = os.pwrite(out_fd, view, position)
+            view = view[written:]
+            position += written
+    return len(data)
+
+
+def _ordered(executor, func, jobs, window):
+    """
+    Run func over argument tuples in parallel, yielding the results in order,
+    with at most window jobs in flight, so results don't pile up in memory.
+    """
+    futures = deque()
+    for args in jobs:
+        futures.append(executor.submit(func, *args))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def _fsync_dir(path):
+    dir_fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
@@ -0,0 +1,300 @@
+"""
+Run a wallet server, restarting it if it crashes.
+
+Used by "mobcli start --bg", as:
+$ python -c 'from mobilecoin.supervisor import main; main()' --pidfile PIDFILE [--metrics FILE] -- COMMAND...
+"""
+import argparse
+import fcntl
+import json
+import os
+from pathlib import Path
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+# Seconds between checks for a stop request, while waiting for the child.
+WAIT_INTERVAL = 0.5
+
+
+class Supervisor:
+    """
+    Run a command as a child process, and keep it running.
+
+    While running, the supervisor holds an exclusive lock on its pidfile, which
+    holds its own process id, so stop() can tell a live supervisor from a stale
+    file. If the child exits without being asked to, it is restarted, after a
+    delay which doubles with each quick failure, up to max_backoff. After
+    max_failures failures in a row, each within stable_time seconds of
+    starting, the supervisor gives up.
+
+    SIGTERM or SIGINT stops the supervisor: the child is sent SIGTERM, and is
+    killed if it has not exited after stop_timeout seconds.
+
+    With a metrics path, the child's memory, CPU and disk usage are sampled
+    from /proc every metrics_interval seconds, and appended to the file as JSON
+    lines.
+    """
+
+    def __init__(
+        self, command, pidfile, env=None, metrics_path=None, metrics_interval=10.0,
+        stop_timeout=30.0, min_backoff=1.0, max_backoff=60.0, stable_time=60.0, max_failures=5,
+    ):
+        self.command = command
+        self.pidfile = Path(pidfile)
+        self.env = env
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self.stop_timeout = stop_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_time = stable_time
+        self.max_failures = max_failures
+        self.process = None
+        self.restarts = 0
+        self._stopping = threading.Event()
+
+    def run(self):
+        """ Run until stopped, or until the child keeps failing. Returns the child's last exit code. """
+        pid_file = _lock_pidfile(self.pidfile)
+        previous_handlers = {
+            signum: signal.signal(signum, self._handle_stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        env = self.env
+        backoff = self.min_backoff
+        failures = 0
+        code = None
+        try:
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                self.process = subprocess.Popen(self.command, env=env)
+                if self._stopping.is_set():
+                    # Stopped while the child was starting.
+                    self.process.terminate()
+                code = self._wait()
+                if self._stopping.is_set():
+                    break
+
+                if time.monotonic() - started >= self.stable_time:
+                    backoff = self.min_backoff
+                    failures = 0
+                    if env is not None and 'MC_CHANGED_PASSWORD' in env:
+                        # The server ran long enough to have changed the password, so
+                        # restarts use the new one. After a quick failure the change may
+                        # not have happened, and the next start tries it again.
+                        env = {**env, 'MC_PASSWORD': env['MC_CHANGED_PASSWORD']}
+                        del env['MC_CHANGED_PASSWORD']
+                failures += 1
+                if failures >= self.max_failures:
+                    _log('{} exited with code {}, {} times in a row. Giving up.'.format(
+                        self.command[0], code, failures))
+                    break
+                _log('{} exited with code {}. Restarting in {:g} seconds.'.format(self.command[0], code, backoff))
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                self.restarts += 1
+        finally:
+            if self.process is not None and self.process.poll() is None:
+                code = self._stop_child()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            self.pidfile.unlink()
+            pid_file.close()
+        return code
+
+    def _handle_stop(self, signum, frame):
+        self._stopping.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+    def _wait(self):
+        """
+        Wait for the child to exit, sampling its resource use meanwhile. Returns
+        its exit code, or None if the supervisor is stopped first.
+        """
+        sampler = None
+        if self.metrics_path is not None:
+            sampler = ProcessSampler(self.process.pid)
+        next_sample = time.monotonic() + self.metrics_interval
+        while not self._stopping.is_set():
+            try:
+                return self.process.wait(timeout=min(WAIT_INTERVAL, max(0, next_sample - time.monotonic())))
+            except subprocess.TimeoutExpired:
+                pass
+            if sampler is not None and time.monotonic() >= next_sample:
+                next_sample += self.metrics_interval
+                sample = sampler.sample()
+                if sample is not None:
+                    sample['restarts'] = self.restarts
+                    with open(self.metrics_path, 'a') as f:
+                        f.write(json.dumps(sample) + '\n')
+        return None
+
+    def _stop_child(self):
+        self.process.terminate()
+        try:
+            return self.process.wait(timeout=self.stop_timeout)
+        except subprocess.TimeoutExpired:
+            _log('{} did not stop after {:g} seconds. Killing it.'.format(self.command[0], self.stop_timeout))
+            self.process.kill()
+            return self.process.wait()
+
+
+class ProcessSampler:
+    """
+    Read a process's resource usage from /proc, on Linux.
+
+    Each sample holds the resident memory in bytes, the CPU use since the
+    previous sample as a percentage of one core, and the bytes read from and
+    written to storage, in total and per second since the previous sample.
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.previous = None
+
+    def sample(self):
+        """ Take a sample, or return None if the process is gone or /proc is not available. """
+        proc = Path('/proc', str(self.pid))
+        try:
+            # The command name in field 2 may contain spaces, so split after it.
+            stat = (proc / 'stat').read_text().rsplit(')', 1)[1].split()
+            rss_pages = int((proc / 'statm').read_text().split()[1])
+            io = self._read_io(proc)
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+        now = time.monotonic()
+        cpu_seconds = (int(stat[11]) + int(stat[12])) / self.clock_ticks
+
+        sample = {
+            'time': time.time(),
+            'pid': self.pid,
+            'rss_bytes': rss_pages * self.page_size,
+            'cpu_percent': None,
+            'threads': int(stat[17]),
+            'read_bytes': io.get('read_bytes'),
+            'write_bytes': io.get('write_bytes'),
+            'read_bytes_per_second': None,
+            'write_bytes_per_second': None,
+        }
+        if self.previous is not None:
+            t, previous_cpu_seconds, previous_io = self.previous
+            elapsed = now - t
+            if elapsed > 0:
+                sample['cpu_percent'] = round(100 * (cpu_seconds - previous_cpu_seconds) / elapsed, 1)
+                for key in ['read_bytes', 'write_bytes']:
+                    if key in io and key in previous_io:
+                        sample[key + '_per_second'] = round((io[key] - previous_io[key]) / elapsed)
+        self.previous = (now, cpu_seconds, io)
+        return sample
+
+    def _read_io(self, proc):
+        try:
+            text = (proc / 'io').read_text()
+        except PermissionError:
+            return {}
+        io = {}
+        for line in text.splitlines():
+            key, value = line.split(':')
+            io[key] = int(value)
+        return io
+
+
+def running_pid(pidfile):
+    """ The process id of the supervisor holding a pidfile, or None if it is not running. """
+    try:
+        f = open(pidfile)
+    except FileNotFoundError:
+        return None
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            pass
+        else:
+            # Nothing holds the lock, so the file was left by a supervisor which died.
+            fcntl.flock(f, fcntl.LOCK_UN)
+            return None
+        for _ in range(50):
+            # The supervisor writes its id just after taking the lock.
+            f.seek(0)
+            text = f.read().strip()
+            if text:
+                return int(text)
+            time.sleep(0.01)
+        return None
+
+
+def stop(pidfile, timeout=60.0):
+    """
+    Stop the supervisor holding a pidfile, and wait for it and its child to
+    exit. Returns the supervisor's process id, or None if it was not running.
+    """
+    pid = running_pid(pidfile)
+    if pid is None:
+        if os.path.exists(pidfile):
+            os.unlink(pidfile)
+        return None
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + timeout
+    while running_pid(pidfile) is not None:
+        if time.monotonic() > deadline:
+            raise TimeoutError('The process {} did not stop within {:.0f} seconds.'.format(pid, timeout))
+        time.sleep(0.1)
+    return pid
+
+
+def _lock_pidfile(pidfile):
+    pidfile.parent.mkdir(parents=True, exist_ok=True)
+    f = open(pidfile, 'a+')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise RuntimeError('Already running, according to {}.'.format(pidfile))
+    f.seek(0)
+    f.truncate()
+    f.write('{}\n'.format(os.getpid()))
+    f.flush()
+    return f
+
+
+def _log(message):
+    print('[supervisor {}] {}'.format(time.strftime('%Y-%m-%d %H:%M:%S'), message), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='mobilecoin.supervisor', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pidfile', required=True)
+    parser.add_argument('--metrics', help='Append resource usage samples to this file.')
+    parser.add_argument('--metrics-interval', type=float, default=10.0)
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    args = parser.parse_args()
+    command = args.command
+    if command and command[0] == '--':
+        command = command[1:]
+    if not command:
+        parser.error('No command given.')
+
+    # Only the wallet server's own settings, and its log level, are passed on to it.
+    env = { k: v for k, v in os.environ.items() if k.startswith('MC_') or k == 'RUST_LOG' }
+    supervisor = Supervisor(command, args.pidfile, env, args.metrics, args.metrics_interval)
+    try:
+        code = supervisor.run()
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    if supervisor._stopping.is_set():
+        sys.exit(0)
+    # The supervisor gave up on a failing child.
+    sys.exit(code if code is not None and code > 0 else 1)
+
+
+if __name__ == '__main__':
+    main()
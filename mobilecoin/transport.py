@@ -0,0 +1,247 @@
+import abc
+import gzip
+import http.client
+import json
+import select
+import socket
+import threading
+from urllib.parse import unquote, urlsplit
+
+import requests
+
+
+# Request bodies at least this large are compressed, when gzip is enabled.
+GZIP_MIN_SIZE = 4096
+
+CHUNK_SIZE = 65536
+
+
+def transport_for_url(url, gzip=False):
+    """
+    Choose a transport from the scheme of a URL.
+
+    "http://" and "https://" URLs use HTTPTransport. "http+unix://" URLs use
+    UnixSocketTransport, with the percent-encoded socket path as the host, as in
+    "http+unix://%2Frun%2Ffull-service.sock/wallet".
+    """
+    scheme = urlsplit(url).scheme
+    if scheme in ('http', 'https'):
+        return HTTPTransport(url, gzip)
+    elif scheme == 'http+unix':
+        return UnixSocketTransport(url, gzip)
+    else:
+        raise ValueError('Unsupported URL scheme: {}'.format(url))
+
+
+class Transport(abc.ABC):
+    """
+    Sends JSON-RPC requests to a wallet server.
+
+    post() returns a response with a status_code, json() and text, and
+    iter_content() for reading the body in chunks as it arrives. Transports
+    are thread-safe. They raise ConnectionError if the server can't be reached.
+    """
+
+    @abc.abstractmethod
+    def post(self, request_data, stream=False):
+        pass
+
+    def close(self):
+        pass
+
+
+class HTTPTransport(Transport):
+    """
+    HTTP/1.1 through requests, keeping connections alive between calls.
+
+    Each thread has its own session, and so its own open connections. With
+    gzip=True, large request bodies are compressed; responses are compressed
+    whenever the server supports it.
+    """
+
+    def __init__(self, url, gzip=False):
+        self.url = url
+        self.gzip = gzip
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def post(self, request_data, stream=False):
+        body, headers = _encode(request_data, self.gzip)
+        try:
+            return self._session().post(self.url, data=body, headers=headers, stream=stream)
+        except requests.ConnectionError:
+            raise ConnectionError(f'Could not connect to wallet server at {self.url}.')
+
+
+class UnixSocketTransport(Transport):
+    """
+    HTTP/1.1 over a Unix domain socket, such as a local proxy in front of the
+    wallet server. Each thread keeps one connection open.
+    """
+
+    def __init__(self, url, gzip=False):
+        parts = urlsplit(url)
+        self.url = url
+        self.socket_path = unquote(parts.netloc)
+        self.path = parts.path or '/'
+        self.gzip = gzip
+        self._local = threading.local()
+
+    def post(self, request_data, stream=False):
+        body, headers = _encode(request_data, self.gzip)
+        if self.gzip:
+            headers['Accept-Encoding'] = 'gzip'
+
+        # A request is only sent again if it failed while being written to a
+        # kept-alive connection which the server had closed since its last use.
+        # Once the server may have read the request, it is never resent, since
+        # a second copy of a payment request could pay twice.
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is not None and _is_dropped(conn):
+                conn.close()
+                conn = None
+            fresh = conn is None
+            if fresh:
+                conn = self._local.conn = _UnixHTTPConnection(self.socket_path)
+            try:
+                conn.request('POST', self.path, body, headers)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                self._local.conn = None
+                raise ConnectionError(f'Could not connect to wallet server at {self.url}.')
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if fresh or attempt == 1:
+                    raise ConnectionError(f'Lost connection to wallet server at {self.url}.')
+        try:
+            r = conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            self._local.conn = None
+            raise ConnectionError(f'Lost connection to wallet server at {self.url}.')
+
+        if r.getheader('Content-Encoding') == 'gzip':
+            chunks = _gunzip_chunks(r)
+        else:
+            chunks = iter(lambda: r.read(CHUNK_SIZE), b'')
+        response = Response(r.status, chunks=chunks, on_close=r.read)
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+
+
+class InProcessTransport(Transport):
+    """
+    Calls a handler function directly, with no socket or HTTP in between.
+
+    The handler takes a request dict and returns a JSON-RPC response dict, as
+    from the wallet server. Meant for tests and benchmarks.
+    """
+
+    url = 'in-process'
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def post(self, request_data, stream=False):
+        return Response(200, data=self.handler(request_data))
+
+
+class Response:
+    """ The subset of a requests.Response which the client uses. """
+
+    def __init__(self, status_code, chunks=None, data=None, on_close=None):
+        self.status_code = status_code
+        self._chunks = chunks
+        self._content = None
+        self._data = data
+        self._on_close = on_close
+
+    @property
+    def content(self):
+        if self._content is None:
+            if self._data is not None:
+                self._content = json.dumps(self._data).encode()
+            else:
+                self._content = b''.join(self._chunks)
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        if self._data is not None:
+            return self._data
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        if self._content is not None or self._data is not None:
+            content = self.content
+            for i in range(0, len(content), chunk_size):
+                yield content[i:i + chunk_size]
+        else:
+            yield from self._chunks
+
+    def close(self):
+        # Finish reading the body, so a kept-alive connection can be reused.
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path):
+        super().__init__('localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+def _is_dropped(conn):
+    """ Whether the server has closed an idle connection, which then reads as ready, at EOF. """
+    if conn.sock is None:
+        return True
+    readable, _, _ = select.select([conn.sock], [], [], 0)
+    return bool(readable)
+
+
+def _encode(request_data, use_gzip):
+    body = json.dumps(request_data).encode()
+    headers = {'Content-Type': 'application/json'}
+    if use_gzip and len(body) >= GZIP_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
+def _gunzip_chunks(r):
+    decompressor = gzip.zlib.decompressobj(16 + gzip.zlib.MAX_WBITS)
+    for chunk in iter(lambda: r.read(CHUNK_SIZE), b''):
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
@@ -1,4 +1,6 @@
+from collections import deque
 from decimal import Decimal
+import time
 
 
 PMOB = Decimal('1e12')
@@ -21,3 +23,72 @@ def pmob2mob(x):
 def try_int(x):
     if x is not None:
         return int(x)
+
+
+def txo_status(txo, account_id):
+    """ The status of a txo from the point of view of one account, e.g. "txo_status_unspent". """
+    return txo['account_status_map'][account_id]['txo_status']
+
+
+def fund_amounts(txos, amounts, max_inputs):
+    """
+    Pick disjoint groups of (value, txo_id) pairs, each worth at least one of the
+    amounts, taking the largest txos first and at most max_inputs per group.
+    Returns a list of txo ids for each amount, or None where the remaining txos
+    can't fund it.
+    """
+    available = sorted(txos, reverse=True)
+    groups = []
+    for amount in amounts:
+        total = 0
+        for i, (value, _) in enumerate(available[:max_inputs]):
+            total += value
+            if total >= amount:
+                groups.append([ txo_id for _, txo_id in available[:i + 1] ])
+                del available[:i + 1]
+                break
+        else:
+            groups.append(None)
+    return groups
+
+
+class RateMeter:
+    """ Measure how fast a counter advances, averaged over a sliding time window. """
+
+    def __init__(self, window=30.0):
+        self.window = window
+        self.samples = deque()
+        self.changed_at = None
+
+    def add(self, value, t=None):
+        if t is None:
+            t = time.monotonic()
+        if not self.samples or value != self.samples[-1][1]:
+            self.changed_at = t
+        self.samples.append((t, value))
+        while len(self.samples) > 2 and t - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+    def rate(self):
+        """ Units per second, or None until there are enough samples. """
+        if len(self.samples) < 2:
+            return None
+        (t0, v0), (t1, v1) = self.samples[0], self.samples[-1]
+        if t1 == t0:
+            return None
+        return (v1 - v0) / (t1 - t0)
+
+    def eta(self, target):
+        """ Seconds until the counter reaches the target, or None if it is not advancing. """
+        rate = self.rate()
+        if not rate or rate <= 0:
+            return None
+        return max(0, target - self.samples[-1][1]) / rate
+
+    def stalled_for(self, t=None):
+        """ Seconds since the counter last changed. """
+        if self.changed_at is None:
+            return 0
+        if t is None:
+            t = time.monotonic()
+        return t - self.changed_at
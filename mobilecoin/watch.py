@@ -0,0 +1,205 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import socket
+import threading
+import time
+
+from .client import DEFAULT_CONCURRENCY, WalletAPIError
+from .index import TxoIndex
+
+
+# Balance fields which change whenever an account's txos do.
+BALANCE_FIELDS = [
+    'unspent_pmob',
+    'pending_pmob',
+    'spent_pmob',
+    'secreted_pmob',
+    'orphaned_pmob',
+]
+
+# An account which has scanned more blocks than this since the last poll, such
+# as one still syncing, is read again in full rather than block by block.
+MAX_LOG_BLOCKS = 100
+
+
+class TxoWatcher:
+    """
+    Subscription to changes in the txos of some accounts.
+
+    The watcher keeps a TxoIndex snapshot of each account. On each new block it
+    reads the transaction logs of the blocks each account has scanned since,
+    and fetches only the txos those logs received, spent, or made as change.
+    An account is read again in full only if its balance changed in a way no
+    log explains, such as a transaction still pending, so a quiet account costs
+    one small request per block however many txos it holds.
+
+    Iterating over the watcher yields event dicts, such as a txo being received
+    or spent, until interrupted.
+    """
+
+    def __init__(self, client, account_ids, interval=1.0):
+        self.client = client
+        self.account_ids = list(account_ids)
+        self.interval = interval
+        self.indexes = {}
+        self.balances = {}
+        self.block_indexes = {}
+
+    def __iter__(self):
+        block_index = None
+        while True:
+            network_status = self.client.get_network_status()
+            local_block_index = int(network_status['local_block_index'])
+            if local_block_index != block_index:
+                block_index = local_block_index
+                yield from self.poll(block_index)
+            time.sleep(self.interval)
+
+    def poll(self, block_index=None):
+        """ Check each account once, returning a list of events. """
+        events = []
+        with ThreadPoolExecutor(DEFAULT_CONCURRENCY) as executor:
+            balances = list(executor.map(self.client.get_balance_for_account, self.account_ids))
+
+            # The blocks each account has scanned since the last poll.
+            scanned = defaultdict(set)
+            rescan = set()
+            for account_id, balance in zip(self.account_ids, balances):
+                account_block_index = int(balance['account_block_index'])
+                if account_id not in self.indexes:
+                    # The first snapshot is a baseline, not a change.
+                    self.indexes[account_id] = TxoIndex(account_id, self.client.iter_txos_for_account(account_id))
+                    self.balances[account_id] = _balance_key(balance)
+                    self.block_indexes[account_id] = account_block_index
+                    continue
+                first_block_index = self.block_indexes[account_id] + 1
+                if account_block_index - first_block_index >= MAX_LOG_BLOCKS:
+                    rescan.add(account_id)
+                else:
+                    for i in range(first_block_index, account_block_index + 1):
+                        scanned[i].add(account_id)
+
+            # Collect the txos logged in each account's new blocks.
+            logged = defaultdict(set)
+            blocks = sorted(scanned)
+            for i, logs in zip(blocks, executor.map(self.client.get_all_transaction_logs_for_block, blocks)):
+                for log in logs.values():
+                    if log['account_id'] not in scanned[i]:
+                        continue
+                    for field in ('input_txos', 'output_txos', 'change_txos'):
+                        logged[log['account_id']].update( txo['txo_id_hex'] for txo in log.get(field) or [] )
+
+            for account_id, balance in zip(self.account_ids, balances):
+                key = _balance_key(balance)
+                if account_id not in logged and self.balances[account_id] != key:
+                    rescan.add(account_id)
+                self.balances[account_id] = key
+                self.block_indexes[account_id] = int(balance['account_block_index'])
+
+            def read(account_id):
+                index = self.indexes[account_id]
+                if account_id not in rescan:
+                    txo_ids = sorted(logged[account_id])
+                    txos = [ self._get_txo(txo_id) for txo_id in txo_ids ]
+                    # A snapshot txo which can't be fetched is only taken as gone after a full read.
+                    if not any( txo is None and txo_id in index.records for txo_id, txo in zip(txo_ids, txos) ):
+                        return index.patch(zip(txo_ids, txos))
+                return index.update(self.client.iter_txos_for_account(account_id))
+
+            account_ids = [ a for a in self.account_ids if a in rescan or a in logged ]
+            for account_id, changes in zip(account_ids, executor.map(read, account_ids)):
+                for txo_id, old_record, record in changes:
+                    events.append(_txo_event(account_id, txo_id, old_record, record, block_index))
+        return events
+
+    def _get_txo(self, txo_id):
+        try:
+            return self.client.get_txo(txo_id)
+        except WalletAPIError:
+            # Such as a txo sent to another wallet, which this one has no record of.
+            return None
+
+
+def _balance_key(balance):
+    return tuple( balance[field] for field in BALANCE_FIELDS )
+
+
+def _txo_event(account_id, txo_id, old_record, record, block_index):
+    if old_record is None:
+        event = 'received'
+    elif record is None:
+        event = 'removed'
+    elif record.status == 'txo_status_spent':
+        event = 'spent'
+    else:
+        event = 'status'
+    current = record if record is not None else old_record
+    return {
+        'event': event,
+        'time': time.time(),
+        'block_index': block_index,
+        'account_id': account_id,
+        'txo_id': txo_id,
+        'value_pmob': current.value,
+        'subaddress_index': current.subaddress_index,
+        'status': None if record is None else record.status,
+        'previous_status': None if old_record is None else old_record.status,
+    }
+
+
+class UnixSocketBroadcaster:
+    """
+    A local Unix socket server, which sends everything written to it to every
+    connected client. Clients which disconnect or fall behind are dropped.
+
+    It has the write() and flush() methods of a text stream, so it can be used
+    as the stream for a record writer.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen()
+        self.clients = []
+        self.lock = threading.Lock()
+        self.buffer = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            conn.settimeout(5.0)
+            with self.lock:
+                self.clients.append(conn)
+
+    def write(self, text):
+        self.buffer.append(text)
+
+    def flush(self):
+        data = ''.join(self.buffer).encode()
+        self.buffer = []
+        if not data:
+            return
+        with self.lock:
+            for conn in list(self.clients):
+                try:
+                    conn.sendall(data)
+                except OSError:
+                    conn.close()
+                    self.clients.remove(conn)
+
+    def close(self):
+        self.server.close()
+        with self.lock:
+            for conn in self.clients:
+                conn.close()
+            self.clients = []
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name='mobilecoin',
@@ -14,4 +14,8 @@ setup(
     install_requires=[
         'requests',
     ],
+    extras_require={
+        # Encrypted export archives.
+        'encrypt': ['cryptography'],
+    },
 )
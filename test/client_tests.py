@@ -1,8 +1,6 @@
-from contextlib import contextmanager
 from decimal import Decimal
 import sys
 import tempfile
-import time
 
 from mobilecoin import (
     Client,
@@ -24,10 +22,8 @@ def main():
     db_file = tempfile.NamedTemporaryFile(suffix='.db', prefix='test_wallet_', delete=False)
     cli = CommandLineInterface()
     cli.config['wallet-db'] = db_file.name
-    cli.stop()
-    time.sleep(0.5)  # Wait for other servers to stop.
-    cli.start(bg=True, unencrypted=True)
-    time.sleep(1.5)  # Wait for the server to start listening.
+    cli.stop()  # Stop any server already running, so this one uses the test database.
+    cli.start(bg=True, unencrypted=True)  # Waits for the server to start and sync.
 
     # Start and end with an empty wallet.
     try:
@@ -122,6 +118,7 @@ def tests_with_wallet(c, source_wallet):
     assert pmob2mob(balance['unspent_pmob']) >= 1
     txos = c.get_all_txos_for_account(source_account_id)
     assert len(txos) > 0
+    assert dict(c.iter_txos_for_account(source_account_id)) == txos
 
     try:
         test_transaction(c, source_account_id)
@@ -160,6 +157,7 @@ def test_transaction(c, source_account_id):
     amounts = [ pmob2mob(t['value_pmob']) for t in transaction_log_map.values() ]
     assert sorted( float(a) for a in amounts ) == [0.0996, 0.1], str(amounts)
     assert all( t['status'] == 'tx_status_succeeded' for t in transaction_log_map.values() )
+    assert dict(c.iter_transaction_logs_for_account(dest_account_id)) == transaction_log_map
 
     c.remove_account(dest_account_id)
 
@@ -293,18 +291,10 @@ def test_gift_codes(c, source_account_id):
 
 
 def check_wallet_empty(c):
-    with quiet(c):
+    with c.quiet():
         accounts = c.get_all_accounts()
         assert accounts == {}, 'Wallet not empty!'
 
 
-@contextmanager
-def quiet(c):
-    old_verbose = c.verbose
-    c.verbose = False
-    yield
-    c.verbose = old_verbose
-
-
 if __name__ == '__main__':
     main()
@@ -0,0 +1,115 @@
+"""
+Check that "mobcli export --encrypt" never writes seed phrases in plaintext,
+against an in-process stub wallet. The encrypted cases are skipped if the
+cryptography library is not installed.
+"""
+from contextlib import redirect_stdout
+import io
+import json
+import os
+from pathlib import Path
+import tempfile
+
+os.environ.setdefault('MOBILECOIN_CONFIG', json.dumps({'logfile': '/dev/null'}))
+
+try:
+    import cryptography
+except ImportError:
+    cryptography = None
+
+from mobilecoin import Client, InProcessTransport
+from mobilecoin import cli
+from mobilecoin.archive import read_archive
+
+
+MNEMONIC = 'plaintext sentinel ' * 12
+ACCOUNT = {
+    'account_id': 'a1b2c3',
+    'name': 'Test',
+    'first_block_index': '0',
+    'next_subaddress_index': '2',
+}
+
+# An account whose secrets the wallet fails to export.
+FAILING_ACCOUNT_ID = 'd4e5f6'
+
+
+def handle(request):
+    method = request['method']
+    if method == 'get_all_accounts':
+        accounts = {ACCOUNT['account_id']: ACCOUNT, FAILING_ACCOUNT_ID: dict(ACCOUNT, account_id=FAILING_ACCOUNT_ID)}
+        result = {'account_ids': list(accounts), 'account_map': accounts}
+    elif method == 'export_account_secrets' and request['params']['account_id'] == FAILING_ACCOUNT_ID:
+        return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32603, 'data': {'server_error': 'Database'}}}
+    elif method == 'export_account_secrets':
+        result = {'account_secrets': {
+            'mnemonic': MNEMONIC,
+            'key_derivation_version': '2',
+            'account_key': {},
+        }}
+    elif method == 'get_balance_for_account':
+        result = {'balance': {'unspent_pmob': '0'}}
+    else:
+        raise ValueError(method)
+    return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+
+
+def command_line_interface():
+    interface = cli.CommandLineInterface()
+    interface.auto_confirm = True
+    interface.client = Client(transport=InProcessTransport(handle))
+    cli.getpass = lambda prompt: 'password'
+    return interface
+
+
+def test_encrypted_single_export(directory):
+    interface = command_line_interface()
+
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        interface.export([ACCOUNT['account_id']], encrypt=True)
+
+    assert MNEMONIC not in stdout.getvalue()
+    files = list(Path(directory).iterdir())
+    assert [ p.name for p in files ] == ['mobilecoin_seed_phrases.jsonl'], files
+    for path in files:
+        assert MNEMONIC.encode() not in path.read_bytes(), path
+
+    backups = list(read_archive(files[0], 'password'))
+    assert [ b['mnemonic'] for b in backups ] == [MNEMONIC]
+
+
+def test_failed_export_writes_nothing(directory):
+    interface = command_line_interface()
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        try:
+            interface.export([], all_accounts=True, output='all.jsonl')
+        except SystemExit as e:
+            assert e.code == 1, e.code
+        else:
+            assert False, 'export() returned'
+    assert 'Could not export account secrets' in stdout.getvalue(), stdout.getvalue()
+    assert list(Path(directory).iterdir()) == []
+
+
+def main():
+    tests = [test_failed_export_writes_nothing]
+    if cryptography is None:
+        print('Skipping the encrypted export tests: the cryptography library is not installed.')
+    else:
+        tests.append(test_encrypted_single_export)
+
+    cwd = os.getcwd()
+    for test in tests:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                test(directory)
+            finally:
+                os.chdir(cwd)
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
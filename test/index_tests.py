@@ -0,0 +1,79 @@
+"""
+Check the local txo and address indexes against hand-built data.
+"""
+from mobilecoin.index import AddressIndex, TxoIndex
+
+
+ACCOUNT_ID = 'a1'
+
+
+def txo(value, block, status='txo_status_unspent', subaddress_index=0):
+    return {
+        'value_pmob': str(value),
+        'received_block_index': str(block),
+        'subaddress_index': str(subaddress_index),
+        'account_status_map': {ACCOUNT_ID: {'txo_status': status}},
+    }
+
+
+def test_txo_query():
+    ix = TxoIndex(ACCOUNT_ID, {
+        'x': txo(30, 1),
+        'y': txo(10, 3, status='txo_status_spent'),
+        'z': txo(20, 2, subaddress_index=1),
+    })
+    assert ix.query(sort='value') == ['y', 'z', 'x']
+    assert ix.query(sort='-value') == ['x', 'z', 'y']
+    assert ix.query(sort='block') == ['x', 'z', 'y']
+
+    # A value filter must not override the requested sort.
+    assert ix.query(min_value=0, sort='block') == ['x', 'z', 'y']
+    assert ix.query(min_value=0, sort='-block') == ['y', 'z', 'x']
+    assert ix.query(min_value=15, max_value=30, sort='block') == ['x', 'z']
+    assert ix.query(status='txo_status_unspent', max_value=25, sort='-block') == ['z']
+    assert ix.query(min_value=15, sort='value') == ['z', 'x']
+
+
+def test_txo_patch():
+    ix = TxoIndex(ACCOUNT_ID, {'x': txo(30, 1), 'y': txo(10, 3)})
+    other = txo(5, 4)
+    other['account_status_map'] = {'a2': {'txo_status': 'txo_status_unspent'}}
+    changes = ix.patch([
+        ('x', txo(30, 1, status='txo_status_spent')),
+        ('z', txo(20, 4)),
+        ('w', other),
+        ('y', None),
+    ])
+    # Only the given txos change, and ones in other accounts are left out.
+    assert [ (txo_id, new and new.status) for txo_id, _, new in changes ] == [
+        ('x', 'txo_status_spent'),
+        ('z', 'txo_status_unspent'),
+        ('y', None),
+    ]
+    assert ix.query(sort='value') == ['z', 'x']
+    assert ix.patch([('z', txo(20, 4))]) == []
+
+
+def test_address_refresh_prunes_removed_accounts():
+    class StubClient:
+        def get_addresses_for_account(self, account_id, offset, limit):
+            return {}
+
+    ix = AddressIndex()
+    ix.add({'account_id': 'kept', 'subaddress_index': '2', 'metadata': 'm', 'public_address': 'K'})
+    ix.add({'account_id': 'removed', 'subaddress_index': '2', 'metadata': 'm', 'public_address': 'R'})
+    ix.refresh(StubClient(), {'kept': {'next_subaddress_index': '0'}})
+    assert ix.lookup('R') is None
+    assert ix.lookup('K').account_id == 'kept'
+    assert ix.lookup_metadata('m') == ['K']
+
+
+def main():
+    test_txo_query()
+    test_txo_patch()
+    test_address_refresh_prunes_removed_accounts()
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
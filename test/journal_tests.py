@@ -0,0 +1,253 @@
+"""
+Check that a payout killed at each step of a payment, then run again, pays
+everyone exactly once, against an in-process stub wallet.
+"""
+from pathlib import Path
+import tempfile
+import threading
+
+from mobilecoin import Client, InProcessTransport
+from mobilecoin.journal import (
+    BUILT,
+    PLANNED,
+    SUBMITTED,
+    SUBMITTING,
+    SUCCEEDED,
+    UNKNOWN,
+    PayoutJournal,
+    payment_id,
+)
+
+
+ACCOUNT_ID = 'a1'
+FEE = 10**10
+MOB = 10**12
+PAYMENTS = [ ('addr{}'.format(i), (i + 1) * MOB) for i in range(4) ]
+
+
+class Killed(Exception):
+    """ The payout process died. """
+
+
+class StubWallet:
+    """
+    One account's txos and transaction logs, where every network status request
+    finds a new block. Once killed, every request fails, as if the process
+    making them had died.
+    """
+
+    def __init__(self, journal_path):
+        self.journal_path = journal_path
+        self.block_index = 100
+        self.txos = {}
+        self.logs = {}
+        self.paid = []
+        self.killed = False
+        self.journal_at_kill = None
+        # Payees whose transaction lands, then the process dies before hearing back.
+        self.kill_after_submit = set()
+        # Payees whose transaction lands without leaving a transaction log.
+        self.unlogged = set()
+        self.lock = threading.Lock()
+        for _ in range(8):
+            self._add_txo(3 * MOB)
+
+    def kill(self):
+        """ Die now, keeping only the journal lines which reached the file. """
+        if not self.killed:
+            self.killed = True
+            self.journal_at_kill = self.journal_path.read_bytes()
+        raise Killed()
+
+    def restart(self):
+        """ Put the journal back as the dead process left it. """
+        self.journal_path.write_bytes(self.journal_at_kill)
+        self.killed = False
+
+    def _add_txo(self, value):
+        txo_id = 'txo{}'.format(len(self.txos))
+        self.txos[txo_id] = {
+            'txo_id_hex': txo_id,
+            'value_pmob': str(value),
+            'subaddress_index': '0',
+            'received_block_index': str(self.block_index),
+            'account_status_map': {ACCOUNT_ID: {'txo_status': 'txo_status_unspent'}},
+        }
+
+    def _status(self, txo_id):
+        return self.txos[txo_id]['account_status_map'][ACCOUNT_ID]['txo_status']
+
+    def handle(self, request):
+        with self.lock:
+            if self.killed:
+                raise Killed()
+            result = getattr(self, request['method'])(**request.get('params', {}))
+        if 'error' in result:
+            return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32603, 'data': {'server_error': result['error']}}}
+        return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+
+    def get_network_status(self):
+        self.block_index += 1
+        block_index = str(self.block_index)
+        return {'network_status': {'network_block_index': block_index, 'local_block_index': block_index, 'fee_pmob': str(FEE)}}
+
+    def get_balance_for_account(self, account_id):
+        return {'balance': {'account_block_index': str(self.block_index)}}
+
+    def get_all_txos_for_account(self, account_id):
+        return {'txo_map': dict(self.txos)}
+
+    def get_all_transaction_logs_for_account(self, account_id):
+        return {'transaction_log_map': dict(self.logs)}
+
+    def build_transaction(self, account_id, addresses_and_values, input_txo_ids):
+        [(to_address, value)] = addresses_and_values
+        return {'tx_proposal': {
+            'input_txo_ids': input_txo_ids,
+            'outlay_list': [{'receiver': to_address, 'value': value}],
+            'tx': {'prefix': {'tombstone_block': str(self.block_index + 10)}},
+        }}
+
+    def submit_transaction(self, tx_proposal, account_id):
+        if int(tx_proposal['tx']['prefix']['tombstone_block']) <= self.block_index:
+            return {'error': 'TombstoneBlockExceeded'}
+        input_txo_ids = tx_proposal['input_txo_ids']
+        if any( self._status(txo_id) != 'txo_status_unspent' for txo_id in input_txo_ids ):
+            return {'error': 'KeyImageAlreadySpent'}
+        [outlay] = tx_proposal['outlay_list']
+        to_address, value = outlay['receiver'], int(outlay['value'])
+
+        for txo_id in input_txo_ids:
+            self.txos[txo_id]['account_status_map'][ACCOUNT_ID]['txo_status'] = 'txo_status_spent'
+        self._add_txo(sum( int(self.txos[txo_id]['value_pmob']) for txo_id in input_txo_ids ) - value - FEE)
+        self.paid.append((to_address, value))
+
+        log = {
+            'transaction_log_id': 'log{}'.format(len(self.paid)),
+            'direction': 'tx_direction_sent',
+            'status': 'tx_status_succeeded',
+            'value_pmob': str(value),
+            'finalized_block_index': str(self.block_index),
+            'input_txos': [ {'txo_id_hex': txo_id} for txo_id in input_txo_ids ],
+            'output_txos': [{'recipient_address_id': to_address, 'value_pmob': str(value)}],
+        }
+        if to_address not in self.unlogged:
+            self.logs[log['transaction_log_id']] = log
+        if to_address in self.kill_after_submit:
+            self.kill()
+        return {'transaction_log': log}
+
+
+def add_payments(journal):
+    for to_address, amount_pmob in PAYMENTS:
+        journal.add(payment_id(ACCOUNT_ID, to_address, amount_pmob), ACCOUNT_ID, to_address, amount_pmob)
+    journal.sync()
+
+
+def kill_at(wallet, state, to_address):
+    """ An on_change callback which kills the payout once a payment reaches a state. """
+    def on_change(entry):
+        if entry['state'] == state and entry['to_address'] == to_address:
+            wallet.kill()
+    return on_change
+
+
+def run_killed(directory, state=None, to_address=PAYMENTS[1][0], setup=None):
+    """
+    Start a payout, kill it once a payment reaches the given state, then run
+    it again to the end. Returns the stub wallet and the final journal entries.
+    """
+    path = Path(tempfile.mkdtemp(dir=directory), 'payout.journal')
+    wallet = StubWallet(path)
+    client = Client(transport=InProcessTransport(wallet.handle))
+    if setup is not None:
+        setup(wallet)
+
+    with PayoutJournal(path) as journal:
+        add_payments(journal)
+        try:
+            if state == PLANNED:
+                # Killed before running, while writing a line.
+                journal._file.write('{"id": "cut sh')
+                journal.sync()
+                wallet.kill()
+            journal.run(client, interval=0, on_change=kill_at(wallet, state, to_address))
+        except Killed:
+            pass
+        else:
+            assert False, 'The payout was never killed at {}.'.format(state)
+    wallet.restart()
+    wallet.kill_after_submit = set()
+
+    with PayoutJournal(path) as journal:
+        add_payments(journal)
+        journal.run(client, interval=0)
+        entries = { e['to_address']: e for e in journal.entries.values() }
+    return wallet, entries
+
+
+def check_paid_once(wallet, entries, unknown=()):
+    assert sorted(wallet.paid) == sorted(PAYMENTS), wallet.paid
+    for to_address, _ in PAYMENTS:
+        expected = UNKNOWN if to_address in unknown else SUCCEEDED
+        assert entries[to_address]['state'] == expected, (to_address, entries[to_address])
+
+
+def test_killed_when_planned(directory):
+    wallet, entries = run_killed(directory, PLANNED)
+    check_paid_once(wallet, entries)
+
+
+def test_killed_when_built(directory):
+    wallet, entries = run_killed(directory, BUILT)
+    check_paid_once(wallet, entries)
+
+
+def test_killed_when_submitting(directory):
+    # Killed before the transaction was sent.
+    wallet, entries = run_killed(directory, SUBMITTING)
+    check_paid_once(wallet, entries)
+
+
+def test_killed_after_sending(directory):
+    # The transaction landed, but the journal still says "submitting".
+    to_address = PAYMENTS[2][0]
+    wallet, entries = run_killed(
+        directory,
+        to_address=to_address,
+        setup=lambda wallet: wallet.kill_after_submit.add(to_address),
+    )
+    check_paid_once(wallet, entries)
+
+
+def test_killed_when_submitted(directory):
+    wallet, entries = run_killed(directory, SUBMITTED)
+    check_paid_once(wallet, entries)
+
+
+def test_killed_when_unknown(directory):
+    # A payment whose transaction landed without a log can't be settled, and
+    # must not be paid again.
+    to_address = PAYMENTS[3][0]
+    wallet, entries = run_killed(
+        directory,
+        UNKNOWN,
+        to_address=to_address,
+        setup=lambda wallet: wallet.unlogged.add(to_address),
+    )
+    check_paid_once(wallet, entries, unknown=[to_address])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        test_killed_when_planned(directory)
+        test_killed_when_built(directory)
+        test_killed_when_submitting(directory)
+        test_killed_after_sending(directory)
+        test_killed_when_submitted(directory)
+        test_killed_when_unknown(directory)
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
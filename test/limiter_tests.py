@@ -0,0 +1,107 @@
+"""
+Check that the adaptive limiter finds the concurrency a simulated server can
+take, and never leaks request slots.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from mobilecoin.limiter import AdaptiveLimiter
+
+
+class SimulatedServer:
+    """ A server with a fixed number of workers, which slows down when given more requests than that. """
+
+    def __init__(self, workers, service_time):
+        self.workers = workers
+        self.service_time = service_time
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def call(self):
+        with self.lock:
+            self.active += 1
+            latency = self.service_time * max(1, self.active / self.workers)
+        time.sleep(latency)
+        with self.lock:
+            self.active -= 1
+
+
+def test_limit_adapts():
+    # Starting well above what the server can take, latency climbs from the
+    # queueing, and the limit comes down close to the number of workers.
+    limiter = AdaptiveLimiter(initial_limit=48, max_limit=64)
+    server = SimulatedServer(workers=6, service_time=0.01)
+
+    def worker(_):
+        deadline = time.monotonic() + 3
+        while time.monotonic() < deadline:
+            with limiter.slot(key='get_balance_for_account'):
+                server.call()
+
+    with ThreadPoolExecutor(48) as executor:
+        list(executor.map(worker, range(48)))
+    assert 3 <= limiter.limit <= 16, limiter.limit
+    assert limiter.in_flight == 0
+
+    # With no queueing, the limit grows again.
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=64)
+    for _ in range(200):
+        limiter.acquire()
+        limiter.release(0.01, key='get_balance_for_account')
+    assert limiter.limit > 10, limiter.limit
+
+
+def test_baseline_per_key():
+    # A slow method at its usual speed is not mistaken for an overloaded server.
+    limiter = AdaptiveLimiter(initial_limit=4)
+    for _ in range(100):
+        for key, latency in [('get_network_status', 0.001), ('get_all_txos_for_account', 0.5)]:
+            limiter.acquire()
+            limiter.release(latency, key=key)
+    assert limiter.limit > 10, limiter.limit
+    assert limiter.baseline_latency('get_network_status') == 0.001
+    assert limiter.baseline_latency('get_all_txos_for_account') == 0.5
+
+
+def test_release_without_outcome():
+    # A request which never reached the server leaves the limit alone.
+    limiter = AdaptiveLimiter(initial_limit=4)
+    limiter.acquire()
+    limiter.release()
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_async_waiter():
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1)
+
+    async def run():
+        await limiter.acquire_async()
+        waiting = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        try:
+            await waiting
+        except asyncio.CancelledError:
+            pass
+        limiter.release(0.01)
+        assert limiter.in_flight == 0, limiter.in_flight
+        await asyncio.wait_for(limiter.acquire_async(), timeout=1)
+        limiter.release(0.01)
+
+    asyncio.run(run())
+    assert limiter.in_flight == 0
+
+
+def main():
+    test_limit_adapts()
+    test_baseline_per_key()
+    test_release_without_outcome()
+    test_cancelled_async_waiter()
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
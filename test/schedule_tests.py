@@ -0,0 +1,225 @@
+"""
+Check that the transaction queue submits each proposal only inside its
+tombstone window, and settles proposals left "submitting" by an interrupted
+run without counting one as sent unless it landed, against an in-process stub
+wallet.
+"""
+from pathlib import Path
+import tempfile
+import threading
+
+from mobilecoin import Client, InProcessTransport
+from mobilecoin.client import MAX_TOMBSTONE_BLOCKS
+from mobilecoin.schedule import (
+    EXPIRED,
+    FAILED,
+    QUEUED,
+    SUBMITTED,
+    SUBMITTING,
+    UNKNOWN,
+    TransactionQueue,
+)
+
+
+ACCOUNT_ID = 'a1'
+
+
+class StubWallet:
+    """ One account's txos and transaction logs, at a block set by the test. """
+
+    def __init__(self):
+        self.block_index = 100
+        self.txos = {}
+        self.logs = {}
+        self.submitted = []
+        self.connection_down = False
+        self.lock = threading.Lock()
+
+    def add_txo(self):
+        txo_id = 'txo{}'.format(len(self.txos))
+        self.txos[txo_id] = {
+            'txo_id_hex': txo_id,
+            'key_image': 'ki-' + txo_id,
+            'value_pmob': '100',
+            'account_status_map': {ACCOUNT_ID: {'txo_status': 'txo_status_unspent'}},
+        }
+        return txo_id
+
+    def proposal(self, tombstone_block, txo_ids=None):
+        """ A proposal spending new txos, or the given ones. """
+        if txo_ids is None:
+            txo_ids = [self.add_txo()]
+        return {
+            'input_list': [ {'key_image': self.txos[txo_id]['key_image']} for txo_id in txo_ids ],
+            'outlay_list': [{'value': '10'}],
+            'tx': {'prefix': {'tombstone_block': str(tombstone_block)}},
+        }
+
+    def spend(self, tx_proposal):
+        """ Land a transaction, as if it had been submitted by anyone. """
+        by_key_image = { txo['key_image']: txo for txo in self.txos.values() }
+        inputs = [ by_key_image[txo['key_image']] for txo in tx_proposal['input_list'] ]
+        for txo in inputs:
+            txo['account_status_map'][ACCOUNT_ID]['txo_status'] = 'txo_status_spent'
+        log_id = 'log{}'.format(len(self.logs))
+        self.logs[log_id] = {
+            'transaction_log_id': log_id,
+            'status': 'tx_status_succeeded',
+            'input_txos': [ {'txo_id_hex': txo['txo_id_hex']} for txo in inputs ],
+        }
+        return self.logs[log_id]
+
+    def handle(self, request):
+        with self.lock:
+            result = getattr(self, request['method'])(**request.get('params', {}))
+        if 'error' in result:
+            return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32603, 'data': {'server_error': result['error']}}}
+        return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+
+    def get_network_status(self):
+        return {'network_status': {'network_block_index': str(self.block_index)}}
+
+    def get_balance_for_account(self, account_id):
+        return {'balance': {'account_block_index': str(self.block_index)}}
+
+    def get_all_txos_for_account(self, account_id):
+        return {'txo_map': dict(self.txos)}
+
+    def get_txo(self, txo_id):
+        return {'txo': self.txos[txo_id]}
+
+    def get_all_transaction_logs_for_account(self, account_id):
+        return {'transaction_log_map': dict(self.logs)}
+
+    def submit_transaction(self, tx_proposal, account_id):
+        if self.connection_down:
+            raise ConnectionError('Lost connection to wallet server.')
+        tombstone_block = int(tx_proposal['tx']['prefix']['tombstone_block'])
+        if not self.block_index + 1 < tombstone_block <= self.block_index + 1 + MAX_TOMBSTONE_BLOCKS:
+            return {'error': 'TombstoneBlockOutOfRange'}
+        spent = [
+            txo for txo in self.txos.values()
+            if txo['account_status_map'][ACCOUNT_ID]['txo_status'] != 'txo_status_unspent'
+        ]
+        if any( txo['key_image'] in {i['key_image'] for i in tx_proposal['input_list']} for txo in spent ):
+            return {'error': 'KeyImageAlreadySpent'}
+        self.submitted.append(tx_proposal)
+        return {'transaction_log': self.spend(tx_proposal)}
+
+
+def new_queue(directory):
+    wallet = StubWallet()
+    client = Client(transport=InProcessTransport(wallet.handle))
+    return wallet, client, TransactionQueue(Path(tempfile.mkdtemp(dir=directory), 'queue.json'))
+
+
+def add(queue, tx_proposal, state=QUEUED):
+    with queue.transaction() as q:
+        entry_id = q.add(tx_proposal, ACCOUNT_ID)
+        q.entries[entry_id]['state'] = state
+    return entry_id
+
+
+def step(queue, client, block_index):
+    queue._step(client, block_index, None)
+    queue.load()
+    return { entry_id: entry['state'] for entry_id, entry in queue.entries.items() }
+
+
+def test_tombstone_windows(directory):
+    wallet, client, queue = new_queue(directory)
+    # At block 100 the network accepts tombstone blocks from 102 to 201.
+    lo = wallet.block_index + 1
+    hi = lo + MAX_TOMBSTONE_BLOCKS
+    expired = add(queue, wallet.proposal(lo))
+    first = add(queue, wallet.proposal(lo + 1))
+    last = add(queue, wallet.proposal(hi))
+    early = add(queue, wallet.proposal(hi + 1))
+
+    states = step(queue, client, wallet.block_index)
+    assert states == {expired: EXPIRED, first: SUBMITTED, last: SUBMITTED, early: QUEUED}, states
+    assert len(wallet.submitted) == 2
+
+    # The early one is sent once its window opens.
+    wallet.block_index += 1
+    states = step(queue, client, wallet.block_index)
+    assert states[early] == SUBMITTED, states
+    assert len(wallet.submitted) == 3
+
+    # run() stops once nothing is waiting.
+    queue.run(client, interval=0)
+
+
+def test_retry_after_interrupted_submit(directory):
+    wallet, client, queue = new_queue(directory)
+    tombstone_block = wallet.block_index + 10
+
+    # Interrupted before the proposal was sent: it is simply sent.
+    unsent = add(queue, wallet.proposal(tombstone_block), SUBMITTING)
+
+    # Interrupted after the proposal landed: it is found in the logs.
+    landed_proposal = wallet.proposal(tombstone_block)
+    landed = add(queue, landed_proposal, SUBMITTING)
+    wallet.spend(landed_proposal)
+
+    # Its inputs were spent by another transaction, so it can never land.
+    txo_ids = [wallet.add_txo(), wallet.add_txo()]
+    conflicting = add(queue, wallet.proposal(tombstone_block, txo_ids), SUBMITTING)
+    wallet.spend(wallet.proposal(tombstone_block, txo_ids[:1]))
+
+    # A proposal which was never interrupted gets no benefit of the doubt.
+    txo_ids = [wallet.add_txo()]
+    fresh = add(queue, wallet.proposal(tombstone_block, txo_ids))
+    wallet.spend(wallet.proposal(tombstone_block, txo_ids))
+
+    states = step(queue, client, wallet.block_index)
+    assert states == {unsent: SUBMITTED, landed: SUBMITTED, conflicting: FAILED, fresh: FAILED}, states
+    assert queue.entries[conflicting]['error'] == 'Inputs spent by another transaction'
+    assert queue.entries[fresh]['error'] == 'KeyImageAlreadySpent'
+    assert wallet.submitted == [queue.entries[unsent]['tx_proposal']]
+
+
+def test_retry_after_connection_error(directory):
+    wallet, client, queue = new_queue(directory)
+    entry_id = add(queue, wallet.proposal(wallet.block_index + 10))
+
+    # A failed connection leaves the proposal "submitting", to be sent again.
+    wallet.connection_down = True
+    assert step(queue, client, wallet.block_index) == {entry_id: SUBMITTING}
+    wallet.connection_down = False
+    wallet.block_index += 1
+    assert step(queue, client, wallet.block_index) == {entry_id: SUBMITTED}
+    assert len(wallet.submitted) == 1
+
+
+def test_expired_while_submitting(directory):
+    wallet, client, queue = new_queue(directory)
+    tombstone_block = wallet.block_index + 1
+
+    landed_proposal = wallet.proposal(tombstone_block)
+    landed = add(queue, landed_proposal, SUBMITTING)
+    wallet.spend(landed_proposal)
+    unsent = add(queue, wallet.proposal(tombstone_block), SUBMITTING)
+    # Its inputs aren't in the account, so nothing can be told about it.
+    missing_proposal = wallet.proposal(tombstone_block)
+    missing = add(queue, missing_proposal, SUBMITTING)
+    del wallet.txos['txo{}'.format(len(wallet.txos) - 1)]
+
+    # Once the wallet has scanned past the tombstone block, each is settled.
+    wallet.block_index += 1
+    states = step(queue, client, wallet.block_index)
+    assert states == {landed: SUBMITTED, unsent: EXPIRED, missing: UNKNOWN}, states
+    assert wallet.submitted == []
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        test_tombstone_windows(directory)
+        test_retry_after_interrupted_submit(directory)
+        test_retry_after_connection_error(directory)
+        test_expired_while_submitting(directory)
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Check that ShardedClient spreads concurrent imports across its shards, and
+never leaves an account on two shards, against in-process stub shards.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from mobilecoin import InProcessTransport, ShardedClient
+
+
+class StubShard:
+    """ A wallet server holding accounts by id, where an import takes a while. """
+
+    def __init__(self):
+        self.accounts = {}
+        self.lock = threading.Lock()
+        self.num_listed = 0
+
+    def handle(self, request):
+        method = request['method']
+        params = request.get('params', {})
+        if method == 'get_all_accounts':
+            with self.lock:
+                accounts = dict(self.accounts)
+                self.num_listed += 1
+            result = {'account_ids': list(accounts), 'account_map': accounts}
+        elif method == 'import_account':
+            time.sleep(0.05)
+            account_id = 'id-' + params['mnemonic']
+            account = {'account_id': account_id, 'name': params.get('name', '')}
+            with self.lock:
+                self.accounts[account_id] = account
+            result = {'account': account}
+        elif method == 'get_account':
+            result = {'account': self.accounts[params['account_id']]}
+        elif method == 'remove_account':
+            with self.lock:
+                del self.accounts[params['account_id']]
+            result = {'removed': True}
+        else:
+            raise ValueError(method)
+        return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+
+
+def sharded_client(num_shards):
+    stubs = [ StubShard() for _ in range(num_shards) ]
+    client = ShardedClient([ 'http://127.0.0.1:{}/wallet'.format(9090 + i) for i in range(num_shards) ])
+    for shard, stub in zip(client.shards, stubs):
+        shard.transport = InProcessTransport(stub.handle)
+    return client, stubs
+
+
+def test_concurrent_imports_spread():
+    client, stubs = sharded_client(3)
+    with ThreadPoolExecutor(6) as executor:
+        list(executor.map(lambda i: client.import_account('m{}'.format(i)), range(6)))
+    assert [ len(stub.accounts) for stub in stubs ] == [2, 2, 2], [ stub.accounts for stub in stubs ]
+
+
+def test_accounts_are_listed_once():
+    # Placement keeps its own counts, rather than listing every shard per import.
+    client, stubs = sharded_client(2)
+    for i in range(10):
+        client.import_account('m{}'.format(i))
+    client.remove_account('id-m0')
+    client.remove_account('id-m2')
+    client.import_account('n1')
+    client.import_account('n2')
+    assert [ stub.num_listed for stub in stubs ] == [1, 1]
+    assert [ len(stub.accounts) for stub in stubs ] == [5, 5]
+
+
+def test_reimport_is_not_duplicated():
+    client, stubs = sharded_client(2)
+    client.import_account('a')
+    client.import_account('b')
+    account = client.import_account('a', name='again')
+    assert account['account_id'] == 'id-a'
+    assert sum( 'id-a' in stub.accounts for stub in stubs ) == 1
+    assert len(client.get_all_accounts()) == 2
+
+    # The same account imported twice at once ends up on one shard.
+    client, stubs = sharded_client(2)
+    with ThreadPoolExecutor(2) as executor:
+        list(executor.map(lambda _: client.import_account('c'), range(2)))
+    assert sum( 'id-c' in stub.accounts for stub in stubs ) == 1
+
+
+def main():
+    test_concurrent_imports_spread()
+    test_accounts_are_listed_once()
+    test_reimport_is_not_duplicated()
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Check that ledger snapshots restore byte for byte, across many chunks, and that
+corrupt or truncated snapshots are rejected without touching the ledger.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+
+from mobilecoin.snapshot import (
+    MAGIC,
+    TRAILER,
+    create_snapshot,
+    read_manifest,
+    restore_snapshot,
+    verify_snapshot,
+)
+
+
+CHUNK_SIZE = 4096
+
+
+def make_ledger(directory):
+    ledger_dir = Path(directory, 'ledger-db')
+    ledger_dir.mkdir()
+    # Compressible and incompressible data, not a whole number of chunks.
+    Path(ledger_dir, 'data.mdb').write_bytes(b'block' * 9000 + os.urandom(3 * CHUNK_SIZE + 123))
+    Path(ledger_dir, 'empty.mdb').write_bytes(b'')
+    Path(ledger_dir, 'lock.mdb').write_bytes(b'live lock')
+    return ledger_dir
+
+
+def expect_error(error_type, message, func, *args, **kwargs):
+    try:
+        func(*args, **kwargs)
+    except error_type as e:
+        assert message in str(e), e
+    else:
+        assert False, 'Expected {}: {}'.format(error_type.__name__, message)
+
+
+def test_round_trip(directory):
+    ledger_dir = make_ledger(directory)
+    snapshot = Path(directory, 'ledger.snapshot')
+    progress = []
+    manifest = create_snapshot(ledger_dir, snapshot, chunk_size=CHUNK_SIZE, threads=4, progress=lambda *p: progress.append(p))
+
+    files = { f['name']: f for f in manifest['files'] }
+    assert sorted(files) == ['data.mdb', 'empty.mdb'], files.keys()
+    data = Path(ledger_dir, 'data.mdb').read_bytes()
+    assert len(files['data.mdb']['chunks']) == -(-len(data) // CHUNK_SIZE)
+    assert files['empty.mdb']['chunks'] == []
+    assert progress[-1] == (len(data), len(data))
+    assert read_manifest(snapshot) == manifest
+    assert not Path(directory, 'ledger.snapshot.tmp').exists()
+
+    progress = []
+    verify_snapshot(snapshot, threads=4, progress=lambda *p: progress.append(p))
+    assert progress[-1] == (len(data), len(data))
+
+    restored_dir = Path(directory, 'restored')
+    restore_snapshot(snapshot, restored_dir, threads=4)
+    assert sorted( p.name for p in restored_dir.iterdir() ) == ['data.mdb', 'empty.mdb']
+    assert Path(restored_dir, 'data.mdb').read_bytes() == data
+    assert Path(restored_dir, 'empty.mdb').read_bytes() == b''
+
+    # An existing ledger is only replaced when asked.
+    expect_error(FileExistsError, 'not empty', restore_snapshot, snapshot, ledger_dir)
+    restore_snapshot(snapshot, ledger_dir, replace=True)
+    assert not Path(ledger_dir, 'lock.mdb').exists()
+    assert Path(ledger_dir, 'data.mdb').read_bytes() == data
+
+
+def rewrite_manifest(snapshot, change):
+    """ Change the manifest of a snapshot, keeping the trailer consistent with it. """
+    content = snapshot.read_bytes()
+    offset, length, _, _ = TRAILER.unpack(content[-TRAILER.size:])
+    manifest = json.loads(content[offset:offset + length])
+    change(manifest)
+    manifest_data = json.dumps(manifest).encode()
+    snapshot.write_bytes(
+        content[:offset]
+        + manifest_data
+        + TRAILER.pack(offset, len(manifest_data), hashlib.sha256(manifest_data).digest(), MAGIC)
+    )
+
+
+def check_ledger_untouched(ledger_dir, snapshot, message):
+    before = { p.name: p.read_bytes() for p in ledger_dir.iterdir() }
+    expect_error(ValueError, message, restore_snapshot, snapshot, ledger_dir, replace=True)
+    assert { p.name: p.read_bytes() for p in ledger_dir.iterdir() } == before
+    assert not ledger_dir.with_name(ledger_dir.name + '.restoring').exists()
+
+
+def test_sha256_mismatch(directory):
+    ledger_dir = make_ledger(directory)
+    snapshot = Path(directory, 'mismatch.snapshot')
+    create_snapshot(ledger_dir, snapshot, chunk_size=CHUNK_SIZE)
+
+    # A chunk which decompresses fine, but not to the data it was taken from.
+    def change(manifest):
+        chunk = manifest['files'][0]['chunks'][-1]
+        chunk['sha256'] = hashlib.sha256(b'other data').hexdigest()
+    rewrite_manifest(snapshot, change)
+    expect_error(ValueError, 'corrupt', verify_snapshot, snapshot)
+    check_ledger_untouched(ledger_dir, snapshot, 'corrupt')
+
+    # Damaged chunk data.
+    create_snapshot(ledger_dir, snapshot, chunk_size=CHUNK_SIZE)
+    manifest = read_manifest(snapshot)
+    chunk = manifest['files'][0]['chunks'][1]
+    with snapshot.open('r+b') as f:
+        f.seek(chunk['offset'] + chunk['length'] // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xff]))
+    expect_error(ValueError, 'corrupt', verify_snapshot, snapshot)
+    check_ledger_untouched(ledger_dir, snapshot, 'corrupt')
+
+
+def test_truncated(directory):
+    ledger_dir = make_ledger(directory)
+    snapshot = Path(directory, 'truncated.snapshot')
+    create_snapshot(ledger_dir, snapshot, chunk_size=CHUNK_SIZE)
+    content = snapshot.read_bytes()
+
+    # Cut off in the trailer, and before the trailer even fits.
+    for size in [len(content) - 5, len(MAGIC) + TRAILER.size - 1]:
+        snapshot.write_bytes(content[:size])
+        expect_error(ValueError, 'truncated', read_manifest, snapshot)
+        check_ledger_untouched(ledger_dir, snapshot, 'truncated')
+
+    snapshot.write_bytes(b'not a snapshot')
+    expect_error(ValueError, 'not a ledger snapshot', read_manifest, snapshot)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        for i, test in enumerate([test_round_trip, test_sha256_mismatch, test_truncated]):
+            test_directory = Path(directory, str(i))
+            test_directory.mkdir()
+            test(test_directory)
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""
+Check that the supervisor restarts a crashing child, gives up on one which
+keeps failing, and kills a child which ignores SIGTERM.
+"""
+import functools
+import os
+from pathlib import Path
+import signal
+import sys
+import tempfile
+import threading
+import time
+
+from mobilecoin import supervisor
+from mobilecoin.supervisor import Supervisor, running_pid
+
+
+def child(code):
+    return [sys.executable, '-c', code]
+
+
+def test_restart(directory):
+    # The child fails twice, then keeps running until stopped.
+    count_path = Path(directory, 'count')
+    script = '\n'.join([
+        'import time',
+        'from pathlib import Path',
+        'p = Path({!r})'.format(str(count_path)),
+        'n = int(p.read_text()) + 1 if p.exists() else 1',
+        'p.write_text(str(n))',
+        'if n <= 2:',
+        '    raise SystemExit(3)',
+        'time.sleep(60)',
+    ])
+    pidfile = Path(directory, 'restart.pid')
+    s = Supervisor(child(script), pidfile, min_backoff=0.01, stable_time=60, max_failures=5)
+
+    def stop_when_running():
+        deadline = time.monotonic() + 10
+        while count_path.exists() is False or count_path.read_text() != '3':
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert running_pid(pidfile) == os.getpid()
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=stop_when_running, daemon=True).start()
+    s.run()
+    assert s.restarts == 2, s.restarts
+    assert s._stopping.is_set()
+    assert not pidfile.exists()
+
+
+def test_give_up(directory):
+    pidfile = Path(directory, 'give_up.pid')
+    s = Supervisor(child('raise SystemExit(3)'), pidfile, min_backoff=0.01, stable_time=60, max_failures=3)
+    code = s.run()
+    assert code == 3, code
+    assert s.restarts == 2, s.restarts
+    assert not s._stopping.is_set()
+
+    # The command line exits non-zero when it gives up, even on a child which exited with 0.
+    argv = sys.argv
+    # Its log level is passed on to the child, but not the rest of the environment.
+    env_path = Path(directory, 'env')
+    script = 'import os; open({!r}, "a").write(repr((os.environ.get("RUST_LOG"), os.environ.get("HOME"))))'.format(str(env_path))
+    sys.argv = ['supervisor', '--pidfile', str(pidfile), '--', sys.executable, '-c', script]
+    supervisor.Supervisor = functools.partial(Supervisor, min_backoff=0.01)
+    os.environ['RUST_LOG'] = 'debug'
+    try:
+        supervisor.main()
+    except SystemExit as e:
+        assert e.code == 1, e.code
+    else:
+        assert False, 'main() returned'
+    finally:
+        sys.argv = argv
+        supervisor.Supervisor = Supervisor
+        del os.environ['RUST_LOG']
+    assert env_path.read_text().startswith("('debug', None)"), env_path.read_text()
+
+
+def test_password_change(directory):
+    # The changed password is only used after a run long enough to have changed it.
+    # Once started with the new password, the child stops the supervisor.
+    log_path = Path(directory, 'passwords')
+    script = '\n'.join([
+        'import os, signal',
+        'with open({!r}, "a") as f:'.format(str(log_path)),
+        '    f.write(os.environ["MC_PASSWORD"] + "\\n")',
+        'if os.environ["MC_PASSWORD"] == "new":',
+        '    os.kill(os.getppid(), signal.SIGTERM)',
+        'raise SystemExit(3)',
+    ])
+    env = {'MC_PASSWORD': 'old', 'MC_CHANGED_PASSWORD': 'new'}
+    Supervisor(child(script), Path(directory, 'p1.pid'), env, min_backoff=0.01, stable_time=60, max_failures=2).run()
+    assert log_path.read_text().split() == ['old', 'old']
+
+    log_path.unlink()
+    Supervisor(child(script), Path(directory, 'p2.pid'), env, min_backoff=0.01, stable_time=0).run()
+    assert log_path.read_text().split() == ['old', 'new']
+
+
+def test_kill_after_stop_timeout(directory):
+    # The child ignores SIGTERM, so it is killed once stop_timeout has passed.
+    ready_path = Path(directory, 'ready')
+    script = '\n'.join([
+        'import signal, time',
+        'from pathlib import Path',
+        'signal.signal(signal.SIGTERM, signal.SIG_IGN)',
+        'Path({!r}).touch()'.format(str(ready_path)),
+        'time.sleep(60)',
+    ])
+    s = Supervisor(child(script), Path(directory, 'kill.pid'), stop_timeout=0.5)
+
+    def stop_when_ready():
+        while not ready_path.exists():
+            time.sleep(0.05)
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    threading.Thread(target=stop_when_ready, daemon=True).start()
+    started = time.monotonic()
+    code = s.run()
+    assert code == -signal.SIGKILL, code
+    assert time.monotonic() - started < 10
+    assert s.restarts == 0
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        test_restart(directory)
+        test_give_up(directory)
+        test_password_change(directory)
+        test_kill_after_stop_timeout(directory)
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Stress test sharing one Client between many threads, against a local stub
+server, over each kind of transport.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import os
+from socketserver import ThreadingUnixStreamServer
+import tempfile
+import threading
+from urllib.parse import quote
+
+from mobilecoin import Client, InProcessTransport
+
+
+NUM_THREADS = 32
+REQUESTS_PER_THREAD = 100
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Answer every request with a balance which echoes the account id. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        body = json.dumps(handle(request)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def handle(request):
+    account_id = request['params']['account_id']
+    return {
+        'jsonrpc': '2.0',
+        'id': 1,
+        'result': {
+            'balance': {'account_block_index': account_id},
+        },
+    }
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/wallet'.format(server.server_address[1])
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'wallet.sock')
+    unix_server = ThreadingUnixStreamServer(socket_path, StubHandler)
+    threading.Thread(target=unix_server.serve_forever, daemon=True).start()
+    unix_url = 'http+unix://{}/wallet'.format(quote(socket_path, safe=''))
+
+    try:
+        test_shared_client(Client(url))
+        test_shared_client(Client(unix_url))
+        test_shared_client(Client(transport=InProcessTransport(handle)))
+        test_scoped_verbosity(url)
+    finally:
+        server.shutdown()
+        unix_server.shutdown()
+        os.unlink(socket_path)
+
+    print('PASS')
+
+
+def test_shared_client(c):
+    def worker(n):
+        for i in range(REQUESTS_PER_THREAD):
+            account_id = '{}-{}'.format(n, i)
+            balance = c.get_balance_for_account(account_id)
+            # A response meant for another thread would carry its account id.
+            assert balance['account_block_index'] == account_id
+
+    with ThreadPoolExecutor(NUM_THREADS) as executor:
+        list(executor.map(worker, range(NUM_THREADS)))
+
+    assert c.query_count == NUM_THREADS * REQUESTS_PER_THREAD, c.query_count
+
+
+def test_scoped_verbosity(url):
+    c = Client(url, verbose=True)
+    barrier = threading.Barrier(2)
+
+    def quiet_worker():
+        with c.quiet():
+            barrier.wait()
+            assert not c.verbose
+            c.get_balance_for_account('quiet')
+            barrier.wait()
+
+    def verbose_worker():
+        barrier.wait()
+        # The other thread being quiet does not silence this one.
+        assert c.verbose
+        c.get_balance_for_account('verbose')
+        barrier.wait()
+
+    output = io.StringIO()
+    with redirect_stdout(output), ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(quiet_worker), executor.submit(verbose_worker)]
+        for future in futures:
+            future.result()
+
+    assert c.verbose
+    assert '"verbose"' in output.getvalue()
+    assert '"quiet"' not in output.getvalue()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Check round trips over the HTTP, Unix socket and in-process transports,
+including streamed and gzipped bodies, and that server and connection errors
+surface as WalletAPIError and ConnectionError.
+"""
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from socketserver import ThreadingUnixStreamServer
+import tempfile
+import threading
+from urllib.parse import quote
+
+from mobilecoin import Client, InProcessTransport, WalletAPIError
+
+
+# Enough txos that a streamed response arrives in many chunks.
+NUM_TXOS = 2000
+
+# Request headers seen by the stub servers, by method.
+seen_headers = {}
+
+
+def handle(request):
+    """ Answer a request as the wallet server would, or with one of its errors. """
+    method = request['method']
+    params = request.get('params', {})
+    if method == 'get_balance_for_account':
+        result = {'balance': {'account_block_index': params['account_id']}}
+    elif method == 'get_all_txos_for_account':
+        result = {'txo_map': {
+            'txo{}'.format(i): {'txo_id_hex': 'txo{}'.format(i), 'value_pmob': str(i)}
+            for i in range(NUM_TXOS)
+        }}
+    elif method == 'submit_transaction':
+        result = {'transaction_log': {'transaction_log_id': str(len(json.dumps(params['tx_proposal'])))}}
+    elif method == 'build_transaction':
+        return error_response('InsufficientFunds')
+    elif method == 'get_txo':
+        # An error with only a message, as from a server before server_error was added.
+        return {'jsonrpc': '2.0', 'id': 1, 'error': {'code': -32603, 'message': 'TxoNotFound'}}
+    else:
+        return error_response('MethodNotFound')
+    return {'jsonrpc': '2.0', 'id': 1, 'result': result}
+
+
+def error_response(server_error):
+    return {
+        'jsonrpc': '2.0',
+        'id': 1,
+        'error': {'code': -32603, 'message': 'Internal error', 'data': {'server_error': server_error}},
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Serve handle() over HTTP, with gzip both ways, and some broken responses. """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        request = json.loads(body)
+        method = request['method']
+        seen_headers[method] = dict(self.headers)
+
+        status = 200
+        if method == 'get_network_status':
+            # A proxy's error page, not JSON.
+            status, body = 502, b'<html>Bad Gateway</html>'
+        else:
+            response = handle(request)
+            if 'error' in response:
+                status = 500
+            body = json.dumps(response).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        if method == 'remove_account':
+            # Drop the kept-alive connection after answering.
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def check_round_trips(c):
+    assert c.get_balance_for_account('a1')['account_block_index'] == 'a1'
+
+    txos = list(c.iter_txos_for_account('a1'))
+    assert len(txos) == NUM_TXOS
+    assert txos[-1] == ('txo{}'.format(NUM_TXOS - 1), {'txo_id_hex': 'txo{}'.format(NUM_TXOS - 1), 'value_pmob': str(NUM_TXOS - 1)})
+
+    # A large body, which is gzipped when the client asks for it.
+    tx_proposal = {'input_list': [ {'key_image': 'k' * 64} for _ in range(200) ]}
+    log = c.submit_transaction(tx_proposal, 'a1')
+    assert log['transaction_log_id'] == str(len(json.dumps(tx_proposal)))
+
+    assert c.query_count == 3, c.query_count
+
+
+def check_errors(c):
+    for func, args, server_error in [
+        (c.build_transaction, ('a1', 1, 'address'), 'InsufficientFunds'),
+        (c.get_txo, ('txo1',), 'TxoNotFound'),
+        (c.get_account, ('a1',), 'MethodNotFound'),
+    ]:
+        try:
+            func(*args)
+        except WalletAPIError as e:
+            assert e.server_error == server_error, (e.server_error, server_error)
+        else:
+            assert False, '{} did not raise WalletAPIError'.format(func.__name__)
+
+    # An error in place of a streamed result.
+    try:
+        list(c.iter_transaction_logs_for_account('a1'))
+    except WalletAPIError as e:
+        assert e.server_error == 'MethodNotFound', e.server_error
+    else:
+        assert False, 'Streamed request did not raise WalletAPIError'
+
+
+def test_http(url):
+    c = Client(url)
+    check_round_trips(c)
+    check_errors(c)
+    assert 'Content-Encoding' not in seen_headers['submit_transaction']
+
+    c = Client(url, gzip=True)
+    check_round_trips(c)
+    assert seen_headers['submit_transaction']['Content-Encoding'] == 'gzip'
+    # Small requests aren't worth compressing.
+    assert 'Content-Encoding' not in seen_headers['get_balance_for_account']
+
+    try:
+        c.get_network_status()
+    except ValueError as e:
+        assert 'invalid JSON' in str(e.args[0]), e
+    else:
+        assert False, 'A non-JSON response was accepted.'
+
+
+def test_unix_socket(unix_url):
+    c = Client(unix_url)
+    check_round_trips(c)
+    check_errors(c)
+
+    # Over a Unix socket, the client asks for gzipped responses itself.
+    c = Client(unix_url, gzip=True)
+    check_round_trips(c)
+    assert seen_headers['submit_transaction']['Content-Encoding'] == 'gzip'
+    assert seen_headers['get_all_txos_for_account']['Accept-Encoding'] == 'gzip'
+
+    # The server closing a kept-alive connection doesn't fail the next request.
+    try:
+        c.remove_account('a1')
+    except WalletAPIError:
+        pass
+    assert c.get_balance_for_account('a2')['account_block_index'] == 'a2'
+
+
+def test_in_process():
+    c = Client(transport=InProcessTransport(handle))
+    check_round_trips(c)
+    check_errors(c)
+
+
+def test_connection_errors(directory):
+    for url in [
+        'http://127.0.0.1:1/wallet',
+        'http+unix://{}/wallet'.format(quote(os.path.join(directory, 'missing.sock'), safe='')),
+    ]:
+        try:
+            Client(url).get_balance_for_account('a1')
+        except ConnectionError as e:
+            assert 'Could not connect' in str(e), e
+        else:
+            assert False, 'Connected to {}'.format(url)
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/wallet'.format(server.server_address[1])
+
+    directory = tempfile.mkdtemp()
+    socket_path = os.path.join(directory, 'wallet.sock')
+    unix_server = ThreadingUnixStreamServer(socket_path, StubHandler)
+    threading.Thread(target=unix_server.serve_forever, daemon=True).start()
+    unix_url = 'http+unix://{}/wallet'.format(quote(socket_path, safe=''))
+
+    try:
+        test_http(url)
+        test_unix_socket(unix_url)
+        test_in_process()
+        test_connection_errors(directory)
+    finally:
+        server.shutdown()
+        unix_server.shutdown()
+        os.unlink(socket_path)
+        os.rmdir(directory)
+
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()